@@ -1,67 +1,29 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
-import re
 import json
 import threading
 import queue
 from pathlib import Path
-import subprocess
 from datetime import datetime
-import sys
-import shutil
-import hashlib
-from collections import defaultdict
 try:
     from PIL import Image
 except ImportError:
     Image = None
 
-def get_ffmpeg_path():
-    """Return a path/command to ffmpeg that works for source and PyInstaller builds.
-
-    Resolution order (Windows-friendly):
-    - If frozen (PyInstaller): try bundled location via sys._MEIPASS and beside the executable
-    - Same directory as this script
-    - On PATH via shutil.which('ffmpeg')
-    - Fallback to 'ffmpeg' (let subprocess rely on PATH)
-    """
-    candidates = []
-
-    # PyInstaller bundled temporary dir
-    if getattr(sys, 'frozen', False):
-        try:
-            meipass_dir = getattr(sys, '_MEIPASS', None)
-            if meipass_dir:
-                candidates.append(os.path.join(meipass_dir, 'ffmpeg.exe'))
-                candidates.append(os.path.join(meipass_dir, 'ffmpeg'))
-        except Exception:
-            pass
-        # Directory of the executable
-        exe_dir = os.path.dirname(sys.executable)
-        candidates.append(os.path.join(exe_dir, 'ffmpeg.exe'))
-        candidates.append(os.path.join(exe_dir, 'ffmpeg'))
-
-    # Directory of this source file
-    try:
-        here = os.path.dirname(os.path.abspath(__file__))
-        candidates.append(os.path.join(here, 'ffmpeg.exe'))
-        candidates.append(os.path.join(here, 'ffmpeg'))
-    except Exception:
-        pass
-
-    # PATH resolution
-    which_ffmpeg = shutil.which('ffmpeg')
-    if which_ffmpeg:
-        candidates.append(which_ffmpeg)
-
-    # Pick the first existing/accessible candidate
-    for path in candidates:
-        if path and os.path.exists(path):
-            return path
-
-    # Fallback: rely on PATH
-    return 'ffmpeg'
+from media_engine import (
+    VIDEO_EXTENSIONS, AUDIO_EXTENSIONS,
+    RenameOptions, FolderRenamer,
+    MediaMerger,
+    SortOptions, FileSorter,
+    CleanupOptions, FolderCleaner,
+    DuplicateOptions, DuplicateFinder, DuplicateResults, ScanCheckpoint,
+    DUPLICATE_TIERS, DUPLICATE_TIER_CONFIDENCE, ORIGINAL_FIRST_KEYS,
+    format_file_size, resolve_target_folders,
+)
+from media_cache import MetadataCache
+from media_library import LibraryIndex
+from media_report import DuplicateReportWriter
 
 class ImportFolderCleanup:
     def __init__(self, root):
@@ -82,6 +44,15 @@ class ImportFolderCleanup:
         # Duplicate Finder tab state
         self.duplicate_selected_folder = tk.StringVar()
         self.processing_queue = queue.Queue()
+        # Duplicate results: the model, Treeview item ID -> record, group ID -> (tree node, number),
+        # and group IDs queued by the scan thread
+        self.duplicate_results = DuplicateResults()
+        self.duplicate_tree_records = {}
+        self.duplicate_tree_groups = {}
+        self.duplicate_results_queue = queue.Queue()
+        self.duplicate_group_count = 0
+        self.duplicate_finder = None  # set while a scan runs, for the Cancel button
+        self.duplicate_results_tier = None  # tier the current results were checked at
         self.is_processing = False
         self.media_is_processing = False
         self.sorter_is_processing = False
@@ -89,13 +60,33 @@ class ImportFolderCleanup:
         self.duplicate_is_processing = False
         
         # Video/Audio file extensions
-        self.video_extensions = {'.mp4', '.webm', '.avi', '.mov', '.mkv'}
-        self.audio_extensions = {'.m4a', '.aac', '.mp3', '.wav', '.flac', '.audio'}
+        self.video_extensions = set(VIDEO_EXTENSIONS)
+        self.audio_extensions = set(AUDIO_EXTENSIONS)
         
         self.setup_ui()
         self.load_config()
         self._update_export_mode_state()
         
+        # Persistent hash/probe cache shared by the cleanup and duplicate tabs
+        try:
+            self.metadata_cache = MetadataCache()
+        except Exception as e:
+            self.metadata_cache = None
+            self.log_message(f"Metadata cache unavailable, continuing without it: {e}")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+    def on_close(self):
+        """Stop a running duplicate scan and save pending cache entries before closing the window"""
+        if self.duplicate_finder is not None:
+            self.duplicate_finder.cancel()
+        if self.metadata_cache is not None:
+            try:
+                self.metadata_cache.close()
+            except Exception:
+                pass
+        self.root.destroy()
+        
+        
     def setup_ui(self):
         # Configure grid weights
         self.root.columnconfigure(0, weight=1)
@@ -542,6 +533,69 @@ class ImportFolderCleanup:
         ttk.Label(d_min_size_frame, text="Minimum file size (KB):").grid(row=0, column=0, sticky=tk.W)
         self.duplicate_min_size_var = tk.StringVar(value="100")
         ttk.Entry(d_min_size_frame, textvariable=self.duplicate_min_size_var, width=10).grid(row=0, column=1, sticky=tk.W, padx=(10, 0))
+        ttk.Label(d_min_size_frame, text="Exclude (comma-separated globs):").grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        self.duplicate_exclude_var = tk.StringVar(value="")
+        ttk.Entry(d_min_size_frame, textvariable=self.duplicate_exclude_var, width=30).grid(row=0, column=3, sticky=tk.W, padx=(10, 0))
+
+        # Parallel hashing
+        d_workers_frame = ttk.Frame(d_scan_options_frame)
+        d_workers_frame.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=2)
+
+        ttk.Label(d_workers_frame, text="Parallel hashing - quick:").grid(row=0, column=0, sticky=tk.W)
+        self.duplicate_quick_workers_var = tk.StringVar(value=str(DuplicateOptions.quick_hash_workers))
+        ttk.Entry(d_workers_frame, textvariable=self.duplicate_quick_workers_var, width=5).grid(row=0, column=1, sticky=tk.W, padx=(10, 0))
+        ttk.Label(d_workers_frame, text="full:").grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        self.duplicate_full_workers_var = tk.StringVar(value=str(DuplicateOptions.full_hash_workers))
+        ttk.Entry(d_workers_frame, textvariable=self.duplicate_full_workers_var, width=5).grid(row=0, column=3, sticky=tk.W, padx=(10, 0))
+        ttk.Label(d_workers_frame, text="(per SSD; spinning disks read one file at a time)").grid(row=0, column=4, sticky=tk.W, padx=(10, 0))
+
+        # Perceptual (near-duplicate) image mode
+        d_similar_frame = ttk.Frame(d_scan_options_frame)
+        d_similar_frame.grid(row=5, column=0, sticky=(tk.W, tk.E), pady=2)
+
+        self.duplicate_similar_images_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(d_similar_frame, text="Find visually similar images instead (re-encodes, resizes)",
+                       variable=self.duplicate_similar_images_var).grid(row=0, column=0, sticky=tk.W)
+        ttk.Label(d_similar_frame, text="Max difference (bits of 64):").grid(row=0, column=1, sticky=tk.W, padx=(10, 0))
+        self.duplicate_similarity_var = tk.StringVar(value=str(DuplicateOptions.similarity_distance))
+        ttk.Entry(d_similar_frame, textvariable=self.duplicate_similarity_var, width=5).grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+
+        self.duplicate_similar_videos_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(d_similar_frame, text="Find re-encoded copies of videos (requires FFmpeg)",
+                       variable=self.duplicate_similar_videos_var).grid(row=1, column=0, sticky=tk.W)
+
+        self.duplicate_similar_audio_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(d_similar_frame, text="Find the same audio in other formats (requires FFmpeg and NumPy)",
+                       variable=self.duplicate_similar_audio_var).grid(row=2, column=0, sticky=tk.W)
+
+        self.duplicate_content_only_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(d_similar_frame, text="Compare media content only (ignore EXIF, MP4 and ID3 tags of JPEG/MP4/MP3)",
+                       variable=self.duplicate_content_only_var).grid(row=3, column=0, sticky=tk.W)
+        self.duplicate_folder_mode_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(d_similar_frame, text="Report duplicate folders as one group (actions remove the whole folder)",
+                       variable=self.duplicate_folder_mode_var).grid(row=4, column=0, sticky=tk.W)
+        self.duplicate_truncated_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(d_similar_frame, text="Find truncated copies of larger files instead (interrupted downloads)",
+                       variable=self.duplicate_truncated_var).grid(row=5, column=0, sticky=tk.W)
+
+        # Scan tier
+        d_tier_frame = ttk.Frame(d_scan_options_frame)
+        d_tier_frame.grid(row=7, column=0, sticky=(tk.W, tk.E), pady=2)
+
+        ttk.Label(d_tier_frame, text="Match by:").grid(row=0, column=0, sticky=tk.W)
+        self.duplicate_tier_var = tk.StringVar(value=DuplicateOptions.tier)
+        ttk.Combobox(d_tier_frame, textvariable=self.duplicate_tier_var, values=list(DUPLICATE_TIERS),
+                     state="readonly", width=10).grid(row=0, column=1, sticky=tk.W, padx=(10, 0))
+        ttk.Label(d_tier_frame, text="(name/size tiers read no file contents; Verify Results upgrades them)").grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+
+        # Reference library mode
+        d_library_frame = ttk.Frame(d_scan_options_frame)
+        d_library_frame.grid(row=6, column=0, sticky=(tk.W, tk.E), pady=2)
+
+        self.duplicate_use_library_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(d_library_frame, text="Only find files already in the indexed reference library",
+                       variable=self.duplicate_use_library_var).grid(row=0, column=0, sticky=tk.W)
+        ttk.Button(d_library_frame, text="Index Library...", command=self.duplicate_index_library).grid(row=0, column=1, sticky=tk.W, padx=(10, 0))
 
         # Action options frame
         d_action_frame = ttk.LabelFrame(duplicate_frame, text="Duplicate Actions", padding="10")
@@ -555,10 +609,14 @@ class ImportFolderCleanup:
                        variable=self.duplicate_action_var, value="delete").grid(row=1, column=0, sticky=tk.W, pady=2)
         ttk.Radiobutton(d_action_frame, text="Move duplicates to subfolder", 
                        variable=self.duplicate_action_var, value="move").grid(row=2, column=0, sticky=tk.W, pady=2)
+        ttk.Radiobutton(d_action_frame, text="Replace duplicates with hardlinks to the original (frees space)", 
+                       variable=self.duplicate_action_var, value="hardlink").grid(row=3, column=0, sticky=tk.W, pady=2)
+        ttk.Radiobutton(d_action_frame, text="Replace duplicates with reflinks (btrfs/XFS copy-on-write clones)", 
+                       variable=self.duplicate_action_var, value="reflink").grid(row=4, column=0, sticky=tk.W, pady=2)
 
         # Hash algorithm selection
         d_hash_frame = ttk.Frame(d_action_frame)
-        d_hash_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
+        d_hash_frame.grid(row=5, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
         d_hash_frame.columnconfigure(1, weight=1)
 
         ttk.Label(d_hash_frame, text="Hash algorithm:").grid(row=0, column=0, sticky=tk.W)
@@ -572,7 +630,11 @@ class ImportFolderCleanup:
         d_buttons_frame.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
 
         ttk.Button(d_buttons_frame, text="Scan for Duplicates", command=self.duplicate_scan_files).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(d_buttons_frame, text="Estimate Savings", command=self.duplicate_estimate_space).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(d_buttons_frame, text="Cancel Scan", command=self.duplicate_cancel_scan).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(d_buttons_frame, text="Verify Results", command=self.duplicate_upgrade_results).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(d_buttons_frame, text="Apply Actions", command=self.duplicate_apply_actions).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(d_buttons_frame, text="Export Report...", command=self.duplicate_export_report).pack(side=tk.LEFT, padx=(0, 5))
 
         # Progress frame
         d_progress_frame = ttk.LabelFrame(duplicate_frame, text="Progress", padding="10")
@@ -645,19 +707,10 @@ class ImportFolderCleanup:
                 self.clear_preview()
                 return
             
-            item = selection[0]
-            # Get the file path from the selected item
-            item_values = self.duplicate_tree.item(item, 'values')
-            
-            if len(item_values) >= 3:  # It's a file item (has File, Size, Location columns)
-                # Clean up the file name by removing prefixes and suffixes
-                raw_file_name = item_values[0]
-                clean_file_name = raw_file_name.replace("📁 ", "").replace("🔄 ", "")
-                clean_file_name = clean_file_name.replace(" (Original)", "").replace(" (Duplicate)", "")
-                
-                file_location = item_values[2]
-                file_path = os.path.join(file_location, clean_file_name)
-                self.update_preview(file_path)
+            # File rows map to their result record; group rows have none
+            record = self.duplicate_tree_records.get(selection[0])
+            if record is not None:
+                self.update_preview(str(record.path))
             else:
                 self.clear_preview()
                 
@@ -828,101 +881,26 @@ class ImportFolderCleanup:
         self.media_log_text.see(tk.END)
         self.root.update_idletasks()
         
-    def clean_folder_name(self, folder_name):
-        """Apply renaming rules to folder name"""
-        cleaned = folder_name
-        
-        # Remove first X characters
-        try:
-            remove_first = int(self.remove_first_var.get())
-            if remove_first > 0:
-                cleaned = cleaned[remove_first:]
-        except ValueError:
-            pass
-
-        # Remove last X characters
-        try:
-            remove_last = int(self.remove_last_var.get())
-            if remove_last > 0:
-                if remove_last >= len(cleaned):
-                    cleaned = ''
-                else:
-                    cleaned = cleaned[:-remove_last]
-        except ValueError:
-            pass
-            
-        # Remove everything before character
-        if self.before_char_var.get():
-            char = self.before_char_var.get()
-            if char in cleaned:
-                cleaned = cleaned[cleaned.find(char) + len(char):]
-                
-        # Remove everything after character
-        if self.after_char_var.get():
-            char = self.after_char_var.get()
-            if char in cleaned:
-                cleaned = cleaned[:cleaned.find(char)]
-                
-        # Remove digits
-        if self.remove_digits_var.get():
-            cleaned = re.sub(r'\d+', '', cleaned)
-            
-        # Remove special characters
-        if self.remove_special_var.get():
-            cleaned = re.sub(r'[^\w\s-]', '', cleaned)
-            
-        # Replace underscores with spaces
-        if self.replace_underscores_var.get():
-            cleaned = cleaned.replace('_', ' ')
-            
-        # Title case
-        if self.title_case_var.get():
-            cleaned = cleaned.title()
-            
-        # Clean up extra spaces
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-        
-        return cleaned
-        
-    def find_video_audio_pairs(self, folder_path):
-        """Find related video and audio files in a folder - DISABLED"""
-        # Merging functionality disabled - return empty pairs
-        return []
-        
-    def merge_video_audio(self, video_path, audio_path, output_path):
-        """Merge video and audio files using FFmpeg"""
-        try:
-            cmd = [
-                get_ffmpeg_path(), '-y',
-                '-i', str(video_path),
-                '-i', str(audio_path),
-                '-c:v', 'copy',
-                '-c:a', 'aac',
-                '-map', '0:v:0',
-                '-map', '1:a:0',
-                str(output_path)
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            if result.returncode == 0:
-                # Remove original files
-                video_path.unlink()
-                audio_path.unlink()
-                return True
-            else:
-                self.media_log_message(f"FFmpeg error: {result.stderr}")
-                return False
-                
-        except subprocess.TimeoutExpired:
-            self.media_log_message("FFmpeg operation timed out")
-            return False
-        except Exception as e:
-            self.media_log_message(f"Error merging files: {e}")
-            return False
+    def _rename_options(self):
+        """Build RenameOptions from the renamer tab's widgets"""
+        def as_int(var):
+            try:
+                return int(var.get())
+            except ValueError:
+                return 0
+
+        return RenameOptions(
+            remove_first=as_int(self.remove_first_var),
+            remove_last=as_int(self.remove_last_var),
+            before_char=self.before_char_var.get(),
+            after_char=self.after_char_var.get(),
+            remove_digits=self.remove_digits_var.get(),
+            remove_special=self.remove_special_var.get(),
+            replace_underscores=self.replace_underscores_var.get(),
+            title_case=self.title_case_var.get(),
+            rename_files=self.rename_files_var.get(),
+        )
 
-    
-            
     def preview_changes(self):
         """Preview all changes without applying them"""
         if not self.selected_folder.get():
@@ -939,107 +917,8 @@ class ImportFolderCleanup:
         selected_names = self._get_selected_subfolder_names()
 
         # Build preview using a tree view
-        preview_items = []  # list of dict: {folder_path, old_name, final_folder_name, folder_will_change, file_changes: [(old, new)]}
-
-        # Handle case where user wants to process the selected folder itself (no subfolders selected)
-        folders_to_process = []
-        
-        if selected_names is None:
-            # No subfolders selected - check if the selected folder has subfolders
-            subfolders = [p for p in folder_path.iterdir() if p.is_dir()]
-            if subfolders:
-                # Has subfolders - process all subfolders
-                folders_to_process = subfolders
-            else:
-                # No subfolders - process the selected folder itself
-                folders_to_process = [folder_path]
-        else:
-            # Specific subfolders selected
-            folders_to_process = [folder_path / name for name in selected_names if (folder_path / name).exists() and (folder_path / name).is_dir()]
-
-        # Prepare folder rename simulation to reflect conflict handling and case-insensitive FS
-        planned = []
-        for p in folders_to_process:
-            if p == folder_path:
-                # Processing the selected folder itself - don't rename it, just process its files
-                planned.append((p, p.name))
-            else:
-                # Processing subfolders - apply renaming rules
-                planned.append((p, self.clean_folder_name(p.name)))
-        
-        # Order by original name length (longest first), matching processing
-        planned.sort(key=lambda x: len(x[0].name), reverse=True)
-
-        def norm_name(name: str) -> str:
-            return os.path.normcase(name)
-
-        occupied = {norm_name(p.name) for p in folders_to_process}
-
-        folder_final_names = {}
-
-        for folder, target_name in planned:
-            old_name = folder.name
-            old_norm = norm_name(old_name)
-            target_norm = norm_name(target_name)
-            final_name = target_name
-            
-            # Don't rename the root selected folder
-            if folder == folder_path:
-                final_name = old_name
-            elif old_name != target_name:
-                if target_norm in occupied:
-                    if target_norm == old_norm:
-                        # Same folder (case-only or similar) – allow
-                        final_name = target_name
-                    else:
-                        counter = 1
-                        while norm_name(f"{target_name} ({counter})") in occupied:
-                            counter += 1
-                        final_name = f"{target_name} ({counter})"
-                # Update occupied names to reflect rename
-                occupied.discard(old_norm)
-                occupied.add(norm_name(final_name))
-            else:
-                # No change
-                final_name = old_name
-            folder_final_names[folder] = final_name
-
-        for folder, final_name in folder_final_names.items():
-            old_name = folder.name
-            folder_will_change = (old_name != final_name)
-
-            file_changes = []
-            if self.rename_files_var.get():
-                files = [f for f in folder.iterdir() if f.is_file()]
-                files.sort()
-                existing_names = {f.name for f in files}
-                planned_names = set()
-                for i, file_path in enumerate(files):
-                    base = final_name if i == 0 else f"{final_name} {i + 1}"
-                    file_ext = file_path.suffix
-                    candidate = f"{base}{file_ext}"
-                    new_name = candidate
-                    if new_name != file_path.name:
-                        # Check conflicts with existing and planned
-                        if (new_name in existing_names) or (new_name in planned_names):
-                            counter = 1
-                            conflict_candidate = f"{base} ({counter}){file_ext}"
-                            while (conflict_candidate in existing_names) or (conflict_candidate in planned_names):
-                                counter += 1
-                                conflict_candidate = f"{base} ({counter}){file_ext}"
-                            new_name = conflict_candidate
-                    planned_names.add(new_name)
-                    if new_name != file_path.name:
-                        file_changes.append((file_path.name, new_name))
-
-            if folder_will_change or file_changes:
-                preview_items.append({
-                    'folder_path': folder,
-                    'old_name': old_name,
-                    'final_folder_name': final_name,
-                    'folder_will_change': folder_will_change,
-                    'file_changes': file_changes,
-                })
+        renamer = FolderRenamer(self._rename_options(), self.log_message)
+        preview_items = renamer.plan(folder_path, selected_names)
 
         if preview_items:
             preview_window = tk.Toplevel(self.root)
@@ -1089,107 +968,19 @@ class ImportFolderCleanup:
         self.is_processing = True
         self.progress_var.set("Processing...")
         
-        # Capture selected subfolders at the time of applying
+        # Capture selected subfolders and options at the time of applying
         self._selected_names_at_apply = self._get_selected_subfolder_names()
+        options = self._rename_options()
 
-        thread = threading.Thread(target=self._process_folder)
+        thread = threading.Thread(target=self._process_folder, args=(options,))
         thread.daemon = True
         thread.start()
         
-    def _process_folder(self):
+    def _process_folder(self, options):
         """Process folder in background thread"""
         try:
             folder_path = Path(self.selected_folder.get())
-            self.log_message("=== STARTING PROCESSING ===")
-            
-            # Determine which folders to process
-            folders_to_process = []
-            
-            if self._selected_names_at_apply is None:
-                # No subfolders selected - check if the selected folder has subfolders
-                subfolders = [p for p in folder_path.iterdir() if p.is_dir()]
-                if subfolders:
-                    # Has subfolders - process all subfolders
-                    folders_to_process = subfolders
-                else:
-                    # No subfolders - process the selected folder itself
-                    folders_to_process = [folder_path]
-            else:
-                # Specific subfolders selected
-                folders_to_process = [folder_path / name for name in self._selected_names_at_apply if (folder_path / name).exists() and (folder_path / name).is_dir()]
-            
-            # Step 1: Rename folders (but not the root selected folder)
-            self.log_message("Step 1: Renaming folders...")
-            folders_to_rename = []
-            
-            for item in folders_to_process:
-                if item != folder_path:  # Don't rename the root selected folder
-                    old_name = item.name
-                    new_name = self.clean_folder_name(old_name)
-                    
-                    if old_name != new_name:
-                        folders_to_rename.append((item, new_name))
-                        
-            # Sort by name length (longest first) to avoid conflicts
-            folders_to_rename.sort(key=lambda x: len(x[0].name), reverse=True)
-            
-            for folder, new_name in folders_to_rename:
-                try:
-                    new_path = folder.parent / new_name
-                    if new_path.exists():
-                        # If the existing path is the same folder (case-only change on Windows), allow it
-                        is_same = False
-                        try:
-                            is_same = new_path.samefile(folder)
-                        except Exception:
-                            # Fallback for Windows when samefile may fail
-                            is_same = os.path.normcase(os.fspath(new_path)) == os.path.normcase(os.fspath(folder))
-                        if not is_same:
-                            # Handle conflicts by adding number
-                            counter = 1
-                            candidate = folder.parent / f"{new_name} ({counter})"
-                            while candidate.exists():
-                                counter += 1
-                                candidate = folder.parent / f"{new_name} ({counter})"
-                            new_path = candidate
-                            
-                    try:
-                        folder.rename(new_path)
-                    except OSError as e:
-                        # Handle Windows case-change edge case by renaming via a temp name
-                        if os.name == 'nt' and "already exists" in str(e).lower():
-                            temp_path = folder.parent / f"{new_name}.__tmp_case__"
-                            folder.rename(temp_path)
-                            temp_path.rename(new_path)
-                        else:
-                            raise
-                    self.log_message(f"Renamed folder: '{folder.name}' → '{new_path.name}'")
-                except Exception as e:
-                    self.log_message(f"Error renaming folder '{folder.name}': {e}")
-                    
-            # Step 2: Rename files
-            self.log_message("Step 2: Processing files...")
-            
-            if self.rename_files_var.get():
-                # Re-scan folders after renaming
-                current_folders = []
-                if self._selected_names_at_apply is None:
-                    subfolders = [p for p in folder_path.iterdir() if p.is_dir()]
-                    if subfolders:
-                        current_folders = subfolders
-                    else:
-                        current_folders = [folder_path]
-                else:
-                    # After renaming, we need to find the renamed folders
-                    current_folders = [p for p in folder_path.iterdir() if p.is_dir()]
-                    if not current_folders and folder_path.exists():
-                        current_folders = [folder_path]
-                
-                for item in current_folders:
-                    self._process_folder_contents(item)
-
-            self.log_message("=== PROCESSING COMPLETE ===")
-            
+            FolderRenamer(options, self.log_message).apply(folder_path, self._selected_names_at_apply)
         except Exception as e:
             self.log_message(f"Error during processing: {e}")
         finally:
@@ -1201,40 +992,6 @@ class ImportFolderCleanup:
             except Exception:
                 pass
 
-    def _process_folder_contents(self, folder_path):
-        """Process contents of a single folder"""
-        folder_name = folder_path.name
-        
-        # Rename files
-        files = [f for f in folder_path.iterdir() if f.is_file()]
-        files.sort()  # Sort for consistent numbering
-        
-        for i, file_path in enumerate(files):
-            file_ext = file_path.suffix
-            if i == 0:
-                new_file_name = f"{folder_name}{file_ext}"
-            else:
-                new_file_name = f"{folder_name} {i + 1}{file_ext}"
-                
-            try:
-                new_file_path = folder_path / new_file_name
-                if new_file_path != file_path:
-                    if new_file_path.exists():
-                        # Handle conflicts
-                        counter = 1
-                        while new_file_path.exists():
-                            if i == 0:
-                                new_file_name = f"{folder_name} ({counter}){file_ext}"
-                            else:
-                                new_file_name = f"{folder_name} {i + 1} ({counter}){file_ext}"
-                            new_file_path = folder_path / new_file_name
-                            counter += 1
-                            
-                    file_path.rename(new_file_path)
-                    self.log_message(f"Renamed file: '{file_path.name}' → '{new_file_name}'")
-            except Exception as e:
-                self.log_message(f"Error renaming file '{file_path.name}': {e}")
-                
     def save_config(self):
         """Save current configuration to file"""
         config = {
@@ -1331,98 +1088,6 @@ class ImportFolderCleanup:
         except Exception:
             return None
 
-    def media_find_video_audio_pairs(self, folder_path: Path):
-        """Return list of (video_path, audio_path, output_path) pairs for a folder.
-        Rules:
-        - Handle split .mp4 files (files ending with ' 2' that pair with base name)
-        - Prefer files with matching stem names across video/audio sets
-        - If exactly one video and one audio exist, pair them
-        - Output name based on video stem with video extension; ensure no conflict by suffixing (n)
-        """
-        try:
-            files = [f for f in folder_path.iterdir() if f.is_file()]
-            videos = [f for f in files if f.suffix.lower() in self.video_extensions]
-            audios = [f for f in files if f.suffix.lower() in self.audio_extensions]
-
-            pairs = []
-            used_videos = set()
-            used_audio = set()
-
-            # First, handle split .mp4 files (files ending with ' 2')
-            mp4_files = [f for f in files if f.suffix.lower() == ".mp4"]
-            split_mp4_pairs = {}
-            
-            for f in mp4_files:
-                name_no_ext = f.stem
-                if name_no_ext.endswith(" 2"):
-                    base = name_no_ext[:-2]
-                    split_mp4_pairs.setdefault(base, {})['second'] = f
-                else:
-                    split_mp4_pairs.setdefault(name_no_ext, {})['first'] = f
-
-            # Process split .mp4 pairs
-            for base, parts in split_mp4_pairs.items():
-                first = parts.get('first')
-                second = parts.get('second')
-                if first and second:
-                    output = folder_path / f"{base}.mp4"
-                    if output.exists():
-                        counter = 1
-                        candidate = folder_path / f"{base} ({counter}).mp4"
-                        while candidate.exists():
-                            counter += 1
-                            candidate = folder_path / f"{base} ({counter}).mp4"
-                        output = candidate
-                    pairs.append((first, second, output))
-                    used_videos.add(first)
-                    used_videos.add(second)
-
-            # Then handle regular video/audio pairs
-            audio_by_stem = {}
-            for a in audios:
-                audio_by_stem.setdefault(a.stem, []).append(a)
-
-            for v in videos:
-                if v in used_videos:
-                    continue  # Skip if already used in split mp4 pairs
-                    
-                candidates = audio_by_stem.get(v.stem, [])
-                if candidates:
-                    a = candidates[0]
-                    if a not in used_audio:
-                        used_audio.add(a)
-                        output = folder_path / f"{v.stem}{v.suffix}"
-                        if output.exists():
-                            counter = 1
-                            candidate = folder_path / f"{v.stem} ({counter}){v.suffix}"
-                            while candidate.exists():
-                                counter += 1
-                                candidate = folder_path / f"{v.stem} ({counter}){v.suffix}"
-                            output = candidate
-                        pairs.append((v, a, output))
-                        used_videos.add(v)
-
-            # If none matched by stem and there is exactly one video and one audio left
-            remaining_videos = [v for v in videos if v not in used_videos]
-            remaining_audios = [a for a in audios if a not in used_audio]
-            if len(remaining_videos) == 1 and len(remaining_audios) == 1:
-                v = remaining_videos[0]
-                a = remaining_audios[0]
-                output = folder_path / f"{v.stem}{v.suffix}"
-                if output.exists():
-                    counter = 1
-                    candidate = folder_path / f"{v.stem} ({counter}){v.suffix}"
-                    while candidate.exists():
-                        counter += 1
-                        candidate = folder_path / f"{v.stem} ({counter}){v.suffix}"
-                    output = candidate
-                pairs.append((v, a, output))
-
-            return pairs
-        except Exception as e:
-            self.media_log_message(f"Error finding media pairs in '{folder_path}': {e}")
-            return []
-
     def media_preview_changes(self):
         if not self.merger_selected_folder.get():
             messagebox.showerror("Error", "Please select a folder first")
@@ -1435,63 +1100,8 @@ class ImportFolderCleanup:
 
         selected = self._merger_get_selected_subfolder_names()
 
-        preview_items = []  # list of dict: {folder, file_renames, pairs}
-        
-        # Determine which folders to process
-        folders_to_process = []
-        
-        if selected is None:
-            # No subfolders selected - check if the selected folder has subfolders
-            subfolders = [item for item in root_folder.iterdir() if item.is_dir()]
-            if subfolders:
-                # Has subfolders - process all subfolders
-                folders_to_process = subfolders
-            else:
-                # No subfolders - process the selected folder itself
-                folders_to_process = [root_folder]
-        else:
-            # Specific subfolders selected
-            folders_to_process = [root_folder / name for name in selected if (root_folder / name).exists() and (root_folder / name).is_dir()]
-        
-        for item in folders_to_process:            
-            # Preview file renames that will happen first
-            file_renames = []
-            files = [f for f in item.iterdir() if f.is_file()]
-            files.sort()
-            folder_name = item.name
-            
-            for i, file_path in enumerate(files):
-                file_ext = file_path.suffix
-                if i == 0:
-                    new_file_name = f"{folder_name}{file_ext}"
-                else:
-                    new_file_name = f"{folder_name} {i + 1}{file_ext}"
-                
-                if new_file_name != file_path.name:
-                    # Check for conflicts and adjust name if needed
-                    new_file_path = item / new_file_name
-                    if new_file_path.exists() and new_file_path != file_path:
-                        counter = 1
-                        while new_file_path.exists():
-                            if i == 0:
-                                new_file_name = f"{folder_name} ({counter}){file_ext}"
-                            else:
-                                new_file_name = f"{folder_name} {i + 1} ({counter}){file_ext}"
-                            new_file_path = item / new_file_name
-                            counter += 1
-                    file_renames.append((file_path.name, new_file_name))
-            
-            # Preview merges that will happen after renaming
-            # Note: We can't accurately preview pairs after renaming without actually renaming,
-            # so we'll show the current pairs and note that files will be renamed first
-            pairs = self.media_find_video_audio_pairs(item)
-            
-            if file_renames or pairs:
-                preview_items.append({
-                    'folder': item,
-                    'file_renames': file_renames,
-                    'pairs': pairs,
-                })
+        # list of dict: {folder, file_renames, pairs}
+        preview_items = MediaMerger(self.media_log_message).plan(root_folder, selected)
 
         if not preview_items:
             self.media_log_message("No changes would be made")
@@ -1569,85 +1179,10 @@ class ImportFolderCleanup:
         thread.daemon = True
         thread.start()
 
-    def _media_rename_files_in_folder(self, folder_path):
-        """Rename files in a folder to follow folder naming convention before merging"""
-        folder_name = folder_path.name
-        
-        # Get all files and sort for consistent numbering
-        files = [f for f in folder_path.iterdir() if f.is_file()]
-        files.sort()  # Sort for consistent numbering
-        
-        for i, file_path in enumerate(files):
-            file_ext = file_path.suffix
-            if i == 0:
-                new_file_name = f"{folder_name}{file_ext}"
-            else:
-                new_file_name = f"{folder_name} {i + 1}{file_ext}"
-                
-            try:
-                new_file_path = folder_path / new_file_name
-                if new_file_path != file_path:
-                    if new_file_path.exists():
-                        # Handle conflicts
-                        counter = 1
-                        while new_file_path.exists():
-                            if i == 0:
-                                new_file_name = f"{folder_name} ({counter}){file_ext}"
-                            else:
-                                new_file_name = f"{folder_name} {i + 1} ({counter}){file_ext}"
-                            new_file_path = folder_path / new_file_name
-                            counter += 1
-                            
-                    file_path.rename(new_file_path)
-                    self.media_log_message(f"Renamed file: '{file_path.name}' → '{new_file_name}'")
-            except Exception as e:
-                self.media_log_message(f"Error renaming file '{file_path.name}': {e}")
-
     def _media_process_folder(self):
         try:
             root_folder = Path(self.merger_selected_folder.get())
-            self.media_log_message("=== STARTING MEDIA MERGE ===")
-            
-            # Determine which folders to process
-            folders_to_process = []
-            
-            if self._merger_selected_at_apply is None:
-                # No subfolders selected - check if the selected folder has subfolders
-                subfolders = [item for item in root_folder.iterdir() if item.is_dir()]
-                if subfolders:
-                    # Has subfolders - process all subfolders
-                    folders_to_process = subfolders
-                else:
-                    # No subfolders - process the selected folder itself
-                    folders_to_process = [root_folder]
-            else:
-                # Specific subfolders selected
-                folders_to_process = [root_folder / name for name in self._merger_selected_at_apply if (root_folder / name).exists() and (root_folder / name).is_dir()]
-            
-            for item in folders_to_process:
-                # Step 1: Rename files to follow folder naming convention
-                self.media_log_message(f"Renaming files in '{item.name}'...")
-                self._media_rename_files_in_folder(item)
-                
-                # Step 2: Find pairs and merge after renaming
-                self.media_log_message(f"Finding media pairs in '{item.name}'...")
-                pairs = self.media_find_video_audio_pairs(item)
-                
-                if pairs:
-                    self.media_log_message(f"Found {len(pairs)} pair(s) to merge in '{item.name}'")
-                    for v, a, outp in pairs:
-                        try:
-                            ok = self.merge_video_audio(v, a, outp)
-                            if ok:
-                                self.media_log_message(f"Merged into '{outp.name}' in '{item.name}'")
-                            else:
-                                self.media_log_message(f"Failed to merge '{v.name}' and '{a.name}' in '{item.name}'")
-                        except Exception as e:
-                            self.media_log_message(f"Error merging in '{item.name}': {e}")
-                else:
-                    self.media_log_message(f"No media pairs found in '{item.name}'")
-
-            self.media_log_message("=== MEDIA MERGE COMPLETE ===")
+            MediaMerger(self.media_log_message).apply(root_folder, self._merger_selected_at_apply)
         except Exception as e:
             self.media_log_message(f"Error during media merge: {e}")
         finally:
@@ -1701,53 +1236,16 @@ class ImportFolderCleanup:
         self.sorter_log_text.see(tk.END)
         self.root.update_idletasks()
 
-    def _get_file_category(self, file_path: Path):
-        """Determine the category folder name for a file"""
-        extension = file_path.suffix.lower()
-        
-        if not extension:
-            return "no_extension"
-        
-        # Handle image separation
-        if self.separate_images_var.get():
-            image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.svg', '.ico'}
-            if extension in image_extensions:
-                return extension[1:]  # Remove the dot
-        
-        # Group common image formats if not separating
-        if not self.separate_images_var.get():
-            image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.svg', '.ico'}
-            if extension in image_extensions:
-                return "images"
-        
-        # Return extension without the dot for other files
-        return extension[1:]
-
-    def _analyze_files_for_sorting(self, source_folder: Path):
-        """Analyze files and return sorting plan"""
-        sorting_plan = {}  # category -> list of files
-        
-        try:
-            files = [f for f in source_folder.iterdir() if f.is_file()]
-            
-            for file_path in files:
-                # Check if we should process this file
-                if self.sort_mode_var.get() == "specific":
-                    target_ext = self.specific_extension_var.get().lower()
-                    if not target_ext.startswith('.'):
-                        target_ext = '.' + target_ext
-                    if file_path.suffix.lower() != target_ext:
-                        continue
-                
-                category = self._get_file_category(file_path)
-                if category not in sorting_plan:
-                    sorting_plan[category] = []
-                sorting_plan[category].append(file_path)
-            
-            return sorting_plan
-        except Exception as e:
-            self.sorter_log_message(f"Error analyzing files: {e}")
-            return {}
+    def _sort_options(self):
+        """Build SortOptions from the sorter tab's widgets"""
+        return SortOptions(
+            sort_mode=self.sort_mode_var.get(),
+            specific_extension=self.specific_extension_var.get(),
+            separate_images=self.separate_images_var.get(),
+            output_mode=self.output_mode_var.get(),
+            export_folder=self.sorter_export_folder.get(),
+            export_operation=self.export_operation_var.get(),
+        )
 
     def sorter_preview_changes(self):
         if not self.sorter_selected_folder.get():
@@ -1764,7 +1262,7 @@ class ImportFolderCleanup:
             return
 
         self.sorter_log_message("=== PREVIEW MODE ===")
-        sorting_plan = self._analyze_files_for_sorting(source_folder)
+        sorting_plan = FileSorter(self._sort_options(), self.sorter_log_message).analyze(source_folder)
 
         if not sorting_plan:
             self.sorter_log_message("No files found to sort")
@@ -1849,72 +1347,14 @@ class ImportFolderCleanup:
         self.sorter_is_processing = True
         self.sorter_progress_var.set("Processing...")
 
-        thread = threading.Thread(target=self._sorter_process_files)
+        thread = threading.Thread(target=self._sorter_process_files, args=(self._sort_options(),))
         thread.daemon = True
         thread.start()
 
-    def _sorter_process_files(self):
+    def _sorter_process_files(self, options):
         try:
             source_folder = Path(self.sorter_selected_folder.get())
-            self.sorter_log_message("=== STARTING FILE SORTING ===")
-            
-            sorting_plan = self._analyze_files_for_sorting(source_folder)
-            
-            if not sorting_plan:
-                self.sorter_log_message("No files found to sort")
-                return
-
-            # Determine destination base and operation
-            if self.output_mode_var.get() == "in_place":
-                dest_base = source_folder
-                operation = "move"
-            else:
-                dest_base = Path(self.sorter_export_folder.get())
-                operation = self.export_operation_var.get()  # "copy" or "move" based on user choice
-
-            total_files = sum(len(files) for files in sorting_plan.values())
-            processed_files = 0
-
-            for category, files in sorting_plan.items():
-                # Create category folder
-                category_folder = dest_base / category
-                try:
-                    category_folder.mkdir(parents=True, exist_ok=True)
-                    self.sorter_log_message(f"Created category folder: {category}")
-                except Exception as e:
-                    self.sorter_log_message(f"Error creating folder '{category}': {e}")
-                    continue
-
-                # Move/copy files
-                for file_path in files:
-                    try:
-                        dest_file = category_folder / file_path.name
-                        
-                        # Handle name conflicts
-                        if dest_file.exists():
-                            counter = 1
-                            name_part = file_path.stem
-                            ext_part = file_path.suffix
-                            while dest_file.exists():
-                                new_name = f"{name_part} ({counter}){ext_part}"
-                                dest_file = category_folder / new_name
-                                counter += 1
-
-                        if operation == "move":
-                            file_path.rename(dest_file)
-                            self.sorter_log_message(f"Moved: {file_path.name} → {category}/{dest_file.name}")
-                        else:  # copy
-                            import shutil
-                            shutil.copy2(file_path, dest_file)
-                            self.sorter_log_message(f"Copied: {file_path.name} → {category}/{dest_file.name}")
-                        
-                        processed_files += 1
-                        
-                    except Exception as e:
-                        self.sorter_log_message(f"Error processing '{file_path.name}': {e}")
-
-            self.sorter_log_message(f"=== SORTING COMPLETE: {processed_files}/{total_files} files processed ===")
-            
+            FileSorter(options, self.sorter_log_message).apply(source_folder)
         except Exception as e:
             self.sorter_log_message(f"Error during file sorting: {e}")
         finally:
@@ -1978,6 +1418,20 @@ class ImportFolderCleanup:
             # Uncheck the remove empty folders option when flatten folders is disabled
             self.remove_empty_folders_var.set(False)
 
+    def _cleanup_options(self):
+        """Build CleanupOptions from the cleanup tab's widgets"""
+        return CleanupOptions(
+            flatten_folders=self.flatten_folders_var.get(),
+            remove_empty_folders=self.remove_empty_folders_var.get(),
+            remove_broken_media=self.remove_broken_media_var.get(),
+            remove_no_thumbnail_videos=self.remove_no_thumbnail_videos_var.get(),
+            remove_empty_corrupted_mp4=self.remove_empty_corrupted_mp4_var.get(),
+            remove_empty_corrupted_images=self.remove_empty_corrupted_images_var.get(),
+            remove_temp_files=self.remove_temp_files_var.get(),
+            remove_custom_extensions=self.remove_custom_extensions_var.get(),
+            custom_extensions=self.custom_extensions_var.get(),
+        )
+
     def cleanup_preview_changes(self):
         """Preview all cleanup changes without applying them"""
         if not self.cleanup_selected_folder.get():
@@ -1992,24 +1446,10 @@ class ImportFolderCleanup:
             return
 
         selected_names = self._cleanup_get_selected_subfolder_names()
-        
-        # Determine which folders to process
-        folders_to_process = []
-        
-        if selected_names is None:
-            # No subfolders selected - check if the selected folder has subfolders
-            subfolders = [p for p in folder_path.iterdir() if p.is_dir()]
-            if subfolders:
-                # Has subfolders - process all subfolders
-                folders_to_process = subfolders
-            else:
-                # No subfolders - process the selected folder itself
-                folders_to_process = [folder_path]
-        else:
-            # Specific subfolders selected
-            folders_to_process = [folder_path / name for name in selected_names if (folder_path / name).exists() and (folder_path / name).is_dir()]
+        folders_to_process = resolve_target_folders(folder_path, selected_names)
 
-        preview_items = self._analyze_cleanup_changes(folders_to_process)
+        cleaner = FolderCleaner(self._cleanup_options(), self.cleanup_log_message, self.metadata_cache)
+        preview_items = cleaner.analyze(folders_to_process, selected_mode=selected_names is not None)
         
         if not preview_items:
             self.cleanup_log_message("No changes would be made")
@@ -2044,16 +1484,8 @@ class ImportFolderCleanup:
             return
 
         # Check if any cleanup options are selected
-        if not any([
-            self.flatten_folders_var.get(),
-            self.remove_broken_media_var.get(),
-            self.remove_no_thumbnail_videos_var.get(),
-            self.remove_empty_corrupted_mp4_var.get(),
-            self.remove_empty_corrupted_images_var.get(),
-            self.remove_temp_files_var.get(),
-            self.remove_custom_extensions_var.get(),
-            self.remove_empty_folders_var.get()
-        ]):
+        options = self._cleanup_options()
+        if not options.any_selected():
             messagebox.showwarning("Warning", "Please select at least one cleanup option")
             return
 
@@ -2065,155 +1497,15 @@ class ImportFolderCleanup:
         self.cleanup_progress_var.set("Processing...")
         self._cleanup_selected_at_apply = self._cleanup_get_selected_subfolder_names()
 
-        thread = threading.Thread(target=self._cleanup_process_folder)
+        thread = threading.Thread(target=self._cleanup_process_folder, args=(options,))
         thread.daemon = True
         thread.start()
 
-    def _analyze_cleanup_changes(self, folders_to_process):
-        """Analyze what changes would be made during cleanup"""
-        preview_items = {
-            "Flatten Files": [],
-            "Remove Empty Folders": [],
-            "Remove Broken Media": [],
-            "Remove No-Thumbnail Videos": [],
-            "Remove Empty/Corrupted MP4/MP3": [],
-            "Remove Empty/Corrupted Images": [],
-            "Remove Temp Files": [],
-            "Remove Custom Extensions": []
-        }
-
-        for folder in folders_to_process:
-            try:
-                # Analyze flatten folders
-                if self.flatten_folders_var.get():
-                    if self._cleanup_selected_at_apply is not None:
-                        # Specific subfolders selected - analyze flattening the selected folders themselves
-                        all_items = list(folder.iterdir())
-                        files = [item for item in all_items if item.is_file()]
-                        subdirs = [item for item in all_items if item.is_dir()]
-                        
-                        # Show files that will be moved
-                        preview_items["Flatten Files"].extend([(f, f"Move to parent folder") for f in files])
-                        # Show subdirectories that will be moved
-                        preview_items["Flatten Files"].extend([(d, f"Move to parent folder") for d in subdirs])
-                        # Show that the selected folder will be removed if it becomes empty
-                        if all_items:  # Only if there are items to move
-                            preview_items["Remove Empty Folders"].append((folder, f"Remove after flattening"))
-                    else:
-                        # No specific selection - analyze flattening subfolders within the folder
-                        flat_folders = self._find_flat_folders(folder)
-                        for flat_folder in flat_folders:
-                            files = [f for f in flat_folder.iterdir() if f.is_file()]
-                            preview_items["Flatten Files"].extend([(f, f"Move to {folder.name}") for f in files])
-                            # Also show that the empty folder will be removed
-                            if files:  # Only if there are files to move
-                                preview_items["Remove Empty Folders"].append((flat_folder, f"Remove after flattening"))
-
-                # Analyze broken media files
-                if self.remove_broken_media_var.get():
-                    broken_media = self._find_broken_media_files(folder)
-                    preview_items["Remove Broken Media"].extend([(f, "0 bytes or corrupted") for f in broken_media])
-
-                # Analyze no-thumbnail videos
-                if self.remove_no_thumbnail_videos_var.get():
-                    no_thumbnail_videos = self._find_no_thumbnail_videos(folder)
-                    preview_items["Remove No-Thumbnail Videos"].extend([(f, "Cannot generate thumbnail") for f in no_thumbnail_videos])
-
-                # Analyze empty/corrupted .mp4/.mp3 files
-                if self.remove_empty_corrupted_mp4_var.get():
-                    empty_corrupted_mp4_mp3 = self._find_empty_corrupted_mp4_mp3_files(folder)
-                    preview_items["Remove Empty/Corrupted MP4/MP3"].extend([(f, "Empty or corrupted .mp4/.mp3 file") for f in empty_corrupted_mp4_mp3])
-
-                # Analyze empty/corrupted image/gif files
-                if self.remove_empty_corrupted_images_var.get():
-                    empty_corrupted_images = self._find_empty_corrupted_images(folder)
-                    preview_items["Remove Empty/Corrupted Images"].extend([(f, "Empty or corrupted image/gif file") for f in empty_corrupted_images])
-
-                # Analyze temp files
-                if self.remove_temp_files_var.get():
-                    temp_files = self._find_temp_files(folder)
-                    preview_items["Remove Temp Files"].extend([(f, "Temporary/cache file") for f in temp_files])
-
-                # Analyze custom extensions
-                if self.remove_custom_extensions_var.get():
-                    custom_files = self._find_custom_extension_files(folder)
-                    preview_items["Remove Custom Extensions"].extend([(f, "Custom extension") for f in custom_files])
-
-                # Analyze empty folders (separate from flattening)
-                if self.remove_empty_folders_var.get():
-                    empty_folders = self._find_empty_folders(folder)
-                    preview_items["Remove Empty Folders"].extend([(f, "Empty folder") for f in empty_folders])
-
-            except Exception as e:
-                self.cleanup_log_message(f"Error analyzing folder '{folder}': {e}")
-
-        # Remove empty categories
-        return {k: v for k, v in preview_items.items() if v}
-
-    def _cleanup_process_folder(self):
+    def _cleanup_process_folder(self, options):
         """Process folder cleanup in background thread"""
         try:
             folder_path = Path(self.cleanup_selected_folder.get())
-            self.cleanup_log_message("=== STARTING CLEANUP ===")
-            
-            # Determine which folders to process
-            folders_to_process = []
-            
-            if self._cleanup_selected_at_apply is None:
-                # No subfolders selected - check if the selected folder has subfolders
-                subfolders = [p for p in folder_path.iterdir() if p.is_dir()]
-                if subfolders:
-                    # Has subfolders - process all subfolders
-                    folders_to_process = subfolders
-                else:
-                    # No subfolders - process the selected folder itself
-                    folders_to_process = [folder_path]
-            else:
-                # Specific subfolders selected
-                folders_to_process = [folder_path / name for name in self._cleanup_selected_at_apply if (folder_path / name).exists() and (folder_path / name).is_dir()]
-
-            for folder in folders_to_process:
-                self.cleanup_log_message(f"Processing folder: {folder.name}")
-                
-                # Step 1: Flatten folders
-                if self.flatten_folders_var.get():
-                    if self._cleanup_selected_at_apply is not None:
-                        # Specific subfolders selected - flatten the selected folders themselves
-                        self._flatten_selected_folder(folder, folder_path)
-                    else:
-                        # No specific selection - flatten subfolders within the folder
-                        self._flatten_folders_in_path(folder)
-                
-                # Step 2: Remove broken media files
-                if self.remove_broken_media_var.get():
-                    self._remove_broken_media_files(folder)
-                
-                # Step 3: Remove no-thumbnail videos
-                if self.remove_no_thumbnail_videos_var.get():
-                    self._remove_no_thumbnail_videos(folder)
-                
-                # Step 4: Remove empty/corrupted .mp4/.mp3 files
-                if self.remove_empty_corrupted_mp4_var.get():
-                    self._remove_empty_corrupted_mp4_mp3_files(folder)
-                
-                # Step 5: Remove empty/corrupted image/gif files
-                if self.remove_empty_corrupted_images_var.get():
-                    self._remove_empty_corrupted_images(folder)
-                
-                # Step 6: Remove temp files
-                if self.remove_temp_files_var.get():
-                    self._remove_temp_files(folder)
-                
-                # Step 7: Remove custom extension files
-                if self.remove_custom_extensions_var.get():
-                    self._remove_custom_extension_files(folder)
-                
-                # Step 8: Remove empty folders (after all other operations)
-                if self.remove_empty_folders_var.get():
-                    self._remove_empty_folders(folder)
-
-            self.cleanup_log_message("=== CLEANUP COMPLETE ===")
-            
+            FolderCleaner(options, self.cleanup_log_message, self.metadata_cache).apply(folder_path, self._cleanup_selected_at_apply)
         except Exception as e:
             self.cleanup_log_message(f"Error during cleanup: {e}")
         finally:
@@ -2224,636 +1516,6 @@ class ImportFolderCleanup:
             except Exception:
                 pass
 
-    # ========================= Cleanup Helper Methods =========================
-    def _find_flat_folders(self, parent_folder):
-        """Find folders that contain only files (no subfolders)"""
-        flat_folders = []
-        try:
-            for item in parent_folder.iterdir():
-                if item.is_dir():
-                    # Check if this folder contains only files (no subdirectories)
-                    contents = list(item.iterdir())
-                    if contents and all(f.is_file() for f in contents):
-                        flat_folders.append(item)
-        except Exception as e:
-            self.cleanup_log_message(f"Error finding flat folders in '{parent_folder}': {e}")
-        return flat_folders
-
-    def _find_broken_media_files(self, folder):
-        """Find broken or empty media files"""
-        broken_files = []
-        media_extensions = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v',
-                           '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.svg', '.ico'}
-        
-        try:
-            for item in folder.rglob('*'):
-                if item.is_file() and item.suffix.lower() in media_extensions:
-                    # Check if file is 0 bytes
-                    if item.stat().st_size == 0:
-                        broken_files.append(item)
-                        continue
-                    
-                    # Check video files with ffprobe
-                    if item.suffix.lower() in {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v'}:
-                        if self._is_broken_video(item):
-                            broken_files.append(item)
-                    
-                    # Check image files
-                    elif item.suffix.lower() in {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}:
-                        if self._is_broken_image(item):
-                            broken_files.append(item)
-                            
-        except Exception as e:
-            self.cleanup_log_message(f"Error finding broken media files in '{folder}': {e}")
-        
-        return broken_files
-
-    def _find_no_thumbnail_videos(self, folder):
-        """Find .mp4 files that can't generate a thumbnail (audio-only files)"""
-        no_thumbnail_videos = []
-        
-        try:
-            for item in folder.rglob('*.mp4'):
-                if item.is_file():
-                    # Skip 0-byte files (handled by broken media detection)
-                    if item.stat().st_size == 0:
-                        continue
-                    
-                    # Check if file can generate a thumbnail
-                    if not self._can_generate_thumbnail(item):
-                        no_thumbnail_videos.append(item)
-                            
-        except Exception as e:
-            self.cleanup_log_message(f"Error finding no-thumbnail videos in '{folder}': {e}")
-        
-        return no_thumbnail_videos
-
-    def _find_empty_corrupted_mp4_mp3_files(self, folder):
-        """Find empty or corrupted .mp4/.mp3 files"""
-        empty_corrupted_files = []
-        
-        try:
-            # Check .mp4 files
-            for item in folder.rglob('*.mp4'):
-                if item.is_file():
-                    # Check if file is 0 bytes
-                    if item.stat().st_size == 0:
-                        empty_corrupted_files.append(item)
-                        continue
-                    
-                    # Check if file is corrupted using ffprobe
-                    if self._is_broken_video(item):
-                        empty_corrupted_files.append(item)
-            
-            # Check .mp3 files
-            for item in folder.rglob('*.mp3'):
-                if item.is_file():
-                    # Check if file is 0 bytes
-                    if item.stat().st_size == 0:
-                        empty_corrupted_files.append(item)
-                        continue
-                    
-                    # For .mp3 files, we can also check if they're corrupted using ffprobe
-                    if self._is_broken_audio(item):
-                        empty_corrupted_files.append(item)
-                            
-        except Exception as e:
-            self.cleanup_log_message(f"Error finding empty/corrupted .mp4/.mp3 files in '{folder}': {e}")
-        
-        return empty_corrupted_files
-
-    def _find_empty_corrupted_images(self, folder):
-        """Find empty or corrupted image/gif files"""
-        empty_corrupted_images = []
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.svg', '.ico'}
-        
-        try:
-            for item in folder.rglob('*'):
-                if item.is_file() and item.suffix.lower() in image_extensions:
-                    # Check if file is 0 bytes
-                    if item.stat().st_size == 0:
-                        empty_corrupted_images.append(item)
-                        continue
-                    
-                    # Check if image is corrupted
-                    if self._is_broken_image(item):
-                        empty_corrupted_images.append(item)
-                            
-        except Exception as e:
-            self.cleanup_log_message(f"Error finding empty/corrupted images in '{folder}': {e}")
-        
-        return empty_corrupted_images
-
-    def _can_generate_thumbnail(self, video_path):
-        """Check if video file can generate a thumbnail using ffmpeg"""
-        import tempfile
-        
-        try:
-            # Create a temporary file for the thumbnail
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                temp_thumbnail = temp_file.name
-            
-            try:
-                # Try to extract the first frame as a thumbnail
-                cmd = [
-                    get_ffmpeg_path(),
-                    '-i', str(video_path),
-                    '-vframes', '1',
-                    '-f', 'image2',
-                    '-y',  # Overwrite output file
-                    '-v', 'quiet',  # Suppress output
-                    temp_thumbnail
-                ]
-                
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-                
-                # Check if thumbnail was created and has content
-                if result.returncode == 0:
-                    try:
-                        import os
-                        # Check if file exists and has reasonable size (not just a tiny error image)
-                        if os.path.exists(temp_thumbnail) and os.path.getsize(temp_thumbnail) > 1000:
-                            return True
-                    except Exception:
-                        pass
-                
-                return False
-                
-            finally:
-                # Clean up temporary file
-                try:
-                    import os
-                    if os.path.exists(temp_thumbnail):
-                        os.unlink(temp_thumbnail)
-                except Exception:
-                    pass
-                
-        except subprocess.TimeoutExpired:
-            return False  # Timeout suggests issues
-        except Exception:
-            # If ffmpeg is not available, assume it's a valid video
-            return True
-
-    def _is_broken_video(self, video_path):
-        """Check if video file is broken using ffprobe"""
-        try:
-            cmd = [
-                get_ffmpeg_path().replace('ffmpeg', 'ffprobe').replace('ffmpeg.exe', 'ffprobe.exe'),
-                '-v', 'quiet',
-                '-show_entries', 'format=duration',
-                '-of', 'csv=p=0',
-                str(video_path)
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode != 0:
-                return True  # ffprobe failed, likely corrupted
-            
-            # Check if duration is 0 or invalid
-            try:
-                duration = float(result.stdout.strip())
-                return duration <= 0
-            except (ValueError, TypeError):
-                return True  # Invalid duration output
-                
-        except subprocess.TimeoutExpired:
-            return True  # Timeout suggests corruption
-        except Exception:
-            # If ffprobe is not available, skip video checking
-            return False
-
-    def _is_broken_image(self, image_path):
-        """Check if image file is broken"""
-        if Image is None:
-            # PIL not available, only check file size
-            return False
-        
-        try:
-            with Image.open(image_path) as img:
-                img.verify()  # Verify the image
-            return False
-        except Exception:
-            return True  # Image is corrupted or unreadable
-
-    def _is_broken_audio(self, audio_path):
-        """Check if audio file is broken using ffprobe"""
-        try:
-            cmd = [
-                get_ffmpeg_path().replace('ffmpeg', 'ffprobe').replace('ffmpeg.exe', 'ffprobe.exe'),
-                '-v', 'quiet',
-                '-show_entries', 'format=duration',
-                '-of', 'csv=p=0',
-                str(audio_path)
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode != 0:
-                return True  # ffprobe failed, likely corrupted
-            
-            # Check if duration is 0 or invalid
-            try:
-                duration = float(result.stdout.strip())
-                return duration <= 0
-            except (ValueError, TypeError):
-                return True  # Invalid duration, likely corrupted
-                
-        except Exception:
-            return True  # Error occurred, assume corrupted
-
-    def _find_temp_files(self, folder):
-        """Find temporary and cache files"""
-        temp_files = []
-        temp_extensions = {'.tmp', '.temp', '.part', '.download', '.crdownload', '.partial', '.old'}
-        temp_names = {'thumbs.db', '.ds_store', '.ds_store', 'desktop.ini', '.localized', '.fseventsd', '.spotlight-v100', '.trashes'}
-        
-        try:
-            for item in folder.rglob('*'):
-                if item.is_file():
-                    # Check by extension
-                    if item.suffix.lower() in temp_extensions:
-                        temp_files.append(item)
-                    # Check by filename (case-insensitive) - including both .ds_store and .DS_Store
-                    elif item.name.lower() in temp_names or item.name == '.DS_Store':
-                        temp_files.append(item)
-                    # Check for browser temp files
-                    elif item.name.startswith('.') and any(x in item.name.lower() for x in ['cache', 'temp', 'tmp']):
-                        temp_files.append(item)
-                        
-        except Exception as e:
-            self.cleanup_log_message(f"Error finding temp files in '{folder}': {e}")
-        
-        return temp_files
-
-    def _find_custom_extension_files(self, folder):
-        """Find files with custom extensions specified by user"""
-        custom_files = []
-        
-        try:
-            # Parse custom extensions
-            extensions_text = self.custom_extensions_var.get().strip()
-            if not extensions_text:
-                return custom_files
-            
-            extensions = [ext.strip().lower() for ext in extensions_text.split(',')]
-            # Ensure extensions start with dot
-            extensions = [ext if ext.startswith('.') else f'.{ext}' for ext in extensions if ext]
-            
-            if not extensions:
-                return custom_files
-            
-            for item in folder.rglob('*'):
-                if item.is_file() and item.suffix.lower() in extensions:
-                    custom_files.append(item)
-                    
-        except Exception as e:
-            self.cleanup_log_message(f"Error finding custom extension files in '{folder}': {e}")
-        
-        return custom_files
-
-    def _find_empty_folders(self, parent_folder):
-        """Find empty folders"""
-        empty_folders = []
-        
-        try:
-            # Get all directories in reverse order (deepest first)
-            all_dirs = [d for d in parent_folder.rglob('*') if d.is_dir()]
-            all_dirs.sort(key=lambda x: len(x.parts), reverse=True)
-            
-            for folder in all_dirs:
-                try:
-                    # Check if folder is empty
-                    if not any(folder.iterdir()):
-                        empty_folders.append(folder)
-                except Exception:
-                    continue
-                    
-        except Exception as e:
-            self.cleanup_log_message(f"Error finding empty folders in '{parent_folder}': {e}")
-        
-        return empty_folders
-
-    def _flatten_folders_in_path(self, parent_folder):
-        """Flatten folders by moving files from flat subfolders up one level"""
-        try:
-            flat_folders = self._find_flat_folders(parent_folder)
-            
-            for flat_folder in flat_folders:
-                self.cleanup_log_message(f"Flattening folder: {flat_folder.name}")
-                
-                files = [f for f in flat_folder.iterdir() if f.is_file()]
-                moved_count = 0
-                
-                for file_path in files:
-                    try:
-                        # Determine destination path
-                        dest_path = parent_folder / file_path.name
-                        
-                        # Handle name conflicts
-                        if dest_path.exists():
-                            counter = 1
-                            name_part = file_path.stem
-                            ext_part = file_path.suffix
-                            while dest_path.exists():
-                                new_name = f"{name_part} ({counter}){ext_part}"
-                                dest_path = parent_folder / new_name
-                                counter += 1
-                        
-                        # Move the file
-                        file_path.rename(dest_path)
-                        moved_count += 1
-                        
-                    except Exception as e:
-                        self.cleanup_log_message(f"Error moving file '{file_path.name}': {e}")
-                
-                self.cleanup_log_message(f"Moved {moved_count} files from '{flat_folder.name}'")
-                
-                # Remove the now-empty folder after moving all files (only if option is enabled)
-                if self.remove_empty_folders_var.get():
-                    try:
-                        if moved_count > 0:  # Only remove if we successfully moved files
-                            # Double-check the folder is actually empty
-                            remaining_items = list(flat_folder.iterdir())
-                            if not remaining_items:
-                                flat_folder.rmdir()
-                                self.cleanup_log_message(f"Removed empty folder: {flat_folder.name}")
-                            else:
-                                self.cleanup_log_message(f"Folder '{flat_folder.name}' not removed - still contains {len(remaining_items)} items")
-                    except Exception as e:
-                        self.cleanup_log_message(f"Error removing empty folder '{flat_folder.name}': {e}")
-                else:
-                    if moved_count > 0:
-                        remaining_items = list(flat_folder.iterdir())
-                        if not remaining_items:
-                            self.cleanup_log_message(f"Folder '{flat_folder.name}' is now empty (not removed - option disabled)")
-                
-        except Exception as e:
-            self.cleanup_log_message(f"Error flattening folders in '{parent_folder}': {e}")
-
-    def _flatten_selected_folder(self, selected_folder, parent_folder):
-        """Flatten a specific selected folder by moving its contents to the parent folder"""
-        try:
-            self.cleanup_log_message(f"Flattening selected folder: {selected_folder.name}")
-            
-            # Get all items in the selected folder (files and subdirectories)
-            all_items = list(selected_folder.iterdir())
-            files = [item for item in all_items if item.is_file()]
-            subdirs = [item for item in all_items if item.is_dir()]
-            
-            moved_count = 0
-            
-            # Move all files to parent folder
-            for file_path in files:
-                try:
-                    # Determine destination path
-                    dest_path = parent_folder / file_path.name
-                    
-                    # Handle name conflicts
-                    if dest_path.exists():
-                        counter = 1
-                        name_part = file_path.stem
-                        ext_part = file_path.suffix
-                        while dest_path.exists():
-                            new_name = f"{name_part} ({counter}){ext_part}"
-                            dest_path = parent_folder / new_name
-                            counter += 1
-                    
-                    # Move the file
-                    file_path.rename(dest_path)
-                    moved_count += 1
-                    
-                except Exception as e:
-                    self.cleanup_log_message(f"Error moving file '{file_path.name}': {e}")
-            
-            # Move all subdirectories to parent folder
-            for subdir in subdirs:
-                try:
-                    # Determine destination path
-                    dest_path = parent_folder / subdir.name
-                    
-                    # Handle name conflicts
-                    if dest_path.exists():
-                        counter = 1
-                        base_name = subdir.name
-                        while dest_path.exists():
-                            new_name = f"{base_name} ({counter})"
-                            dest_path = parent_folder / new_name
-                            counter += 1
-                    
-                    # Move the subdirectory
-                    subdir.rename(dest_path)
-                    moved_count += 1
-                    
-                except Exception as e:
-                    self.cleanup_log_message(f"Error moving folder '{subdir.name}': {e}")
-            
-            self.cleanup_log_message(f"Moved {moved_count} items from '{selected_folder.name}'")
-            
-            # Remove the now-empty selected folder if all items were moved successfully (only if option is enabled)
-            if self.remove_empty_folders_var.get():
-                try:
-                    remaining_items = list(selected_folder.iterdir())
-                    if not remaining_items:
-                        selected_folder.rmdir()
-                        self.cleanup_log_message(f"Removed empty folder: {selected_folder.name}")
-                    else:
-                        self.cleanup_log_message(f"Folder '{selected_folder.name}' not removed - still contains {len(remaining_items)} items")
-                except Exception as e:
-                    self.cleanup_log_message(f"Error removing empty folder '{selected_folder.name}': {e}")
-            else:
-                remaining_items = list(selected_folder.iterdir())
-                if not remaining_items:
-                    self.cleanup_log_message(f"Folder '{selected_folder.name}' is now empty (not removed - option disabled)")
-                
-        except Exception as e:
-            self.cleanup_log_message(f"Error flattening selected folder '{selected_folder}': {e}")
-
-    def _remove_broken_media_files(self, folder):
-        """Remove broken or empty media files"""
-        try:
-            self.cleanup_log_message(f"Scanning for broken media files in: {folder.name}")
-            broken_files = self._find_broken_media_files(folder)
-            self.cleanup_log_message(f"Found {len(broken_files)} broken media files")
-            
-            removed_count = 0
-            
-            for file_path in broken_files:
-                try:
-                    file_path.unlink()
-                    self.cleanup_log_message(f"Removed broken media file: {file_path.name}")
-                    removed_count += 1
-                except Exception as e:
-                    self.cleanup_log_message(f"Error removing broken file '{file_path.name}': {e}")
-            
-            if removed_count > 0:
-                self.cleanup_log_message(f"Removed {removed_count} broken media files")
-            else:
-                self.cleanup_log_message("No broken media files found to remove")
-                
-        except Exception as e:
-            self.cleanup_log_message(f"Error removing broken media files in '{folder}': {e}")
-
-    def _remove_no_thumbnail_videos(self, folder):
-        """Remove .mp4 files that can't generate thumbnails (audio-only files)"""
-        try:
-            self.cleanup_log_message(f"Scanning for .mp4 files without thumbnails in: {folder.name}")
-            no_thumbnail_videos = self._find_no_thumbnail_videos(folder)
-            self.cleanup_log_message(f"Found {len(no_thumbnail_videos)} .mp4 files without thumbnails")
-            
-            removed_count = 0
-            
-            for file_path in no_thumbnail_videos:
-                try:
-                    file_path.unlink()
-                    self.cleanup_log_message(f"Removed .mp4 file without thumbnail: {file_path.name}")
-                    removed_count += 1
-                except Exception as e:
-                    self.cleanup_log_message(f"Error removing .mp4 file '{file_path.name}': {e}")
-            
-            if removed_count > 0:
-                self.cleanup_log_message(f"Removed {removed_count} .mp4 files without thumbnails")
-            else:
-                self.cleanup_log_message("No .mp4 files without thumbnails found to remove")
-                
-        except Exception as e:
-            self.cleanup_log_message(f"Error removing .mp4 files without thumbnails in '{folder}': {e}")
-
-    def _remove_empty_corrupted_mp4_mp3_files(self, folder):
-        """Remove empty or corrupted .mp4/.mp3 files"""
-        try:
-            self.cleanup_log_message(f"Scanning for empty/corrupted .mp4/.mp3 files in: {folder.name}")
-            empty_corrupted_files = self._find_empty_corrupted_mp4_mp3_files(folder)
-            self.cleanup_log_message(f"Found {len(empty_corrupted_files)} empty/corrupted .mp4/.mp3 files")
-            
-            removed_count = 0
-            
-            for file_path in empty_corrupted_files:
-                try:
-                    file_path.unlink()
-                    self.cleanup_log_message(f"Removed empty/corrupted .mp4/.mp3 file: {file_path.name}")
-                    removed_count += 1
-                except Exception as e:
-                    self.cleanup_log_message(f"Error removing .mp4/.mp3 file '{file_path.name}': {e}")
-            
-            if removed_count > 0:
-                self.cleanup_log_message(f"Removed {removed_count} empty/corrupted .mp4/.mp3 files")
-            else:
-                self.cleanup_log_message("No empty/corrupted .mp4/.mp3 files found to remove")
-                
-        except Exception as e:
-            self.cleanup_log_message(f"Error removing empty/corrupted .mp4/.mp3 files in '{folder}': {e}")
-
-    def _remove_empty_corrupted_images(self, folder):
-        """Remove empty or corrupted image/gif files"""
-        try:
-            self.cleanup_log_message(f"Scanning for empty/corrupted image/gif files in: {folder.name}")
-            empty_corrupted_images = self._find_empty_corrupted_images(folder)
-            self.cleanup_log_message(f"Found {len(empty_corrupted_images)} empty/corrupted image/gif files")
-            
-            removed_count = 0
-            
-            for file_path in empty_corrupted_images:
-                try:
-                    file_path.unlink()
-                    self.cleanup_log_message(f"Removed empty/corrupted image/gif file: {file_path.name}")
-                    removed_count += 1
-                except Exception as e:
-                    self.cleanup_log_message(f"Error removing image/gif file '{file_path.name}': {e}")
-            
-            if removed_count > 0:
-                self.cleanup_log_message(f"Removed {removed_count} empty/corrupted image/gif files")
-            else:
-                self.cleanup_log_message("No empty/corrupted image/gif files found to remove")
-                
-        except Exception as e:
-            self.cleanup_log_message(f"Error removing empty/corrupted image/gif files in '{folder}': {e}")
-
-    def _remove_temp_files(self, folder):
-        """Remove temporary and cache files"""
-        try:
-            self.cleanup_log_message(f"Scanning for temporary files in: {folder.name}")
-            temp_files = self._find_temp_files(folder)
-            self.cleanup_log_message(f"Found {len(temp_files)} temporary files")
-            
-            # Debug: list all found temp files
-            for temp_file in temp_files:
-                self.cleanup_log_message(f"  - {temp_file.name}")
-            
-            removed_count = 0
-            
-            for file_path in temp_files:
-                try:
-                    # Special handling for .ds_store files - they might be recreated by the system
-                    if file_path.name.lower() in ['.ds_store', '.ds_store']:
-                        self.cleanup_log_message(f"Attempting to remove .ds_store file: {file_path.name}")
-                        # Try to remove with force
-                        file_path.unlink()
-                        self.cleanup_log_message(f"Successfully removed .ds_store file: {file_path.name}")
-                    else:
-                        file_path.unlink()
-                        self.cleanup_log_message(f"Removed temp file: {file_path.name}")
-                    removed_count += 1
-                except PermissionError as e:
-                    self.cleanup_log_message(f"Permission denied removing temp file '{file_path.name}': {e}")
-                except FileNotFoundError:
-                    self.cleanup_log_message(f"Temp file '{file_path.name}' already removed")
-                except Exception as e:
-                    self.cleanup_log_message(f"Error removing temp file '{file_path.name}': {e}")
-            
-            if removed_count > 0:
-                self.cleanup_log_message(f"Removed {removed_count} temporary files")
-            else:
-                self.cleanup_log_message("No temporary files found to remove")
-                
-        except Exception as e:
-            self.cleanup_log_message(f"Error removing temp files in '{folder}': {e}")
-
-    def _remove_custom_extension_files(self, folder):
-        """Remove files with custom extensions"""
-        try:
-            self.cleanup_log_message(f"Scanning for custom extension files in: {folder.name}")
-            custom_files = self._find_custom_extension_files(folder)
-            self.cleanup_log_message(f"Found {len(custom_files)} custom extension files")
-            
-            removed_count = 0
-            
-            for file_path in custom_files:
-                try:
-                    file_path.unlink()
-                    self.cleanup_log_message(f"Removed custom extension file: {file_path.name}")
-                    removed_count += 1
-                except Exception as e:
-                    self.cleanup_log_message(f"Error removing custom file '{file_path.name}': {e}")
-            
-            if removed_count > 0:
-                self.cleanup_log_message(f"Removed {removed_count} custom extension files")
-            else:
-                self.cleanup_log_message("No custom extension files found to remove")
-                
-        except Exception as e:
-            self.cleanup_log_message(f"Error removing custom extension files in '{folder}': {e}")
-
-    def _remove_empty_folders(self, parent_folder):
-        """Remove empty folders"""
-        try:
-            empty_folders = self._find_empty_folders(parent_folder)
-            removed_count = 0
-            
-            for folder_path in empty_folders:
-                try:
-                    folder_path.rmdir()
-                    self.cleanup_log_message(f"Removed empty folder: {folder_path.name}")
-                    removed_count += 1
-                except Exception as e:
-                    self.cleanup_log_message(f"Error removing empty folder '{folder_path.name}': {e}")
-            
-            if removed_count > 0:
-                self.cleanup_log_message(f"Removed {removed_count} empty folders")
-                
-        except Exception as e:
-            self.cleanup_log_message(f"Error removing empty folders in '{parent_folder}': {e}")
-
     # ========================= Duplicate File Finder Tab Logic =========================
     def duplicate_browse_folder(self):
         folder = filedialog.askdirectory(title="Select Folder to Scan for Duplicates")
@@ -2861,6 +1523,40 @@ class ImportFolderCleanup:
             self.duplicate_selected_folder.set(folder)
             self.duplicate_log_message(f"Selected folder: {folder}")
 
+    def duplicate_index_library(self):
+        """Add or refresh a reference library folder in the library index"""
+        if self.duplicate_is_processing:
+            messagebox.showinfo("Info", "Duplicate scan is already in progress")
+            return
+        folder = filedialog.askdirectory(title="Select Reference Library Folder to Index")
+        if not folder:
+            return
+
+        self.duplicate_is_processing = True
+        self.duplicate_progress_var.set("Indexing library...")
+        options = self._duplicate_options()
+        thread = threading.Thread(target=self._duplicate_index_worker, args=(Path(folder), options))
+        thread.daemon = True
+        thread.start()
+
+    def _duplicate_index_worker(self, folder, options):
+        """Worker thread for library indexing; Cancel Scan stops it, keeping the files hashed so far"""
+        try:
+            finder = DuplicateFinder(options, self.duplicate_log_message, self.duplicate_progress_var.set)
+            self.duplicate_finder = finder
+            with LibraryIndex() as library:
+                library.update(folder, options.hash_algorithm, options.full_hash_workers,
+                               self.duplicate_log_message, self.duplicate_progress_var.set, finder=finder)
+                for info in library.roots():
+                    self.duplicate_log_message(f"Library {info['root']}: {info['files']} files, "
+                                               f"{format_file_size(info['bytes'])} ({info['algorithm']})")
+        except Exception as e:
+            self.duplicate_log_message(f"Error indexing library: {e}")
+        finally:
+            self.duplicate_finder = None
+            self.duplicate_is_processing = False
+            self.duplicate_progress_var.set("Ready")
+
     def duplicate_log_message(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
         self.duplicate_log_text.insert(tk.END, f"[{timestamp}] {message}\n")
@@ -2877,259 +1573,284 @@ class ImportFolderCleanup:
             messagebox.showinfo("Info", "Duplicate scan is already in progress")
             return
 
+        # Tk variables are read here; the worker only gets plain values
+        options = self._duplicate_options()
+        folder_path = Path(self.duplicate_selected_folder.get())
+        use_library = self.duplicate_use_library_var.get()
+        if options.folder_mode and (options.similar_images or options.similar_videos or options.similar_audio
+                                    or options.truncated_files or use_library):
+            messagebox.showerror("Error", "Duplicate folders are found from exact file hashes and cannot be combined "
+                                          "with truncated files, the library check or the similar modes.\n\n"
+                                          "Run them as separate scans.")
+            return
+        checkpoint = ScanCheckpoint()
+        state = None
+        # Only the exact scan keeps checkpoints
+        exact_scan = not (options.similar_images or options.similar_videos or options.similar_audio
+                          or options.truncated_files or use_library)
+        if exact_scan:
+            try:
+                state = checkpoint.load(ScanCheckpoint.scan_id(folder_path, options))
+            except Exception:
+                state = None
+        if state is not None:
+            saved_at = datetime.fromtimestamp(state['saved_at']).strftime("%Y-%m-%d %H:%M")
+            if not messagebox.askyesno("Resume Scan",
+                                       f"An interrupted scan of this folder was saved on {saved_at}.\n\n"
+                                       f"Resume it? Choose No to start over."):
+                checkpoint.clear()
+
         self.duplicate_is_processing = True
         self.duplicate_progress_var.set("Scanning...")
+        self.duplicate_results_tier = options.tier if exact_scan else "full"
         
         # Clear previous results
+        self._clear_duplicate_results()
+
+        self._start_duplicate_scan(options, checkpoint, folder_path, use_library)
+
+    def duplicate_upgrade_results(self):
+        """Re-check the current results at the selected tier without scanning the folder again"""
+        if self.duplicate_is_processing:
+            messagebox.showinfo("Info", "Duplicate scan is already in progress")
+            return
+        groups = self.duplicate_results.path_groups()
+        if not groups:
+            messagebox.showinfo("Info", "No results to verify. Please scan for duplicates first.")
+            return
+
+        options = self._duplicate_options()
+        self.duplicate_is_processing = True
+        self.duplicate_progress_var.set("Verifying...")
+        self.duplicate_results_tier = options.tier
+        self._clear_duplicate_results()
+        self._start_duplicate_scan(options, None, upgrade_groups=groups)
+
+    def duplicate_estimate_space(self):
+        """Estimate the reclaimable space from a 30 second sample before committing to a full scan"""
+        if not self.duplicate_selected_folder.get():
+            messagebox.showerror("Error", "Please select a folder first")
+            return
+
+        if self.duplicate_is_processing:
+            messagebox.showinfo("Info", "Duplicate scan is already in progress")
+            return
+
+        options = self._duplicate_options()
+        folder_path = Path(self.duplicate_selected_folder.get())
+        self.duplicate_is_processing = True
+        self.duplicate_progress_var.set("Estimating...")
+        thread = threading.Thread(target=self._duplicate_estimate_worker, args=(folder_path, options))
+        thread.daemon = True
+        thread.start()
+
+    def _duplicate_estimate_worker(self, folder_path, options):
+        """Worker thread for the reclaimable space estimate; results go to the log"""
+        try:
+            finder = DuplicateFinder(options, self.duplicate_log_message, self.duplicate_progress_var.set,
+                                     self.metadata_cache)
+            self.duplicate_finder = finder
+            finder.estimate(folder_path)
+        except Exception as e:
+            self.duplicate_log_message(f"Error during estimate: {e}")
+        finally:
+            self.duplicate_finder = None
+            self.duplicate_is_processing = False
+            self.duplicate_progress_var.set("Ready")
+
+    def duplicate_cancel_scan(self):
+        """Stop the running scan; an exact scan can be resumed from its checkpoint later"""
+        if not self.duplicate_is_processing or self.duplicate_finder is None:
+            return
+        self.duplicate_finder.cancel()
+        self.duplicate_progress_var.set("Cancelling...")
+        self.duplicate_log_message("Cancelling scan...")
+
+    def _clear_duplicate_results(self):
+        """Empty the results model and the treeview"""
+        self.duplicate_results.clear()
+        self.duplicate_tree_records.clear()
+        self.duplicate_tree_groups.clear()
         for item in self.duplicate_tree.get_children():
             self.duplicate_tree.delete(item)
 
-        thread = threading.Thread(target=self._duplicate_scan_worker)
+    def _start_duplicate_scan(self, options, checkpoint, folder_path=None, use_library=False, upgrade_groups=None):
+        """Start the scan thread and the Tk-side loop that shows groups as they arrive"""
+        self.duplicate_group_count = 0
+        thread = threading.Thread(target=self._duplicate_scan_worker,
+                                  args=(options, checkpoint, folder_path, use_library, upgrade_groups))
         thread.daemon = True
         thread.start()
+        self.root.after(100, self._poll_duplicate_results)
 
-    def _duplicate_scan_worker(self):
-        """Worker thread for duplicate scanning"""
+    def _poll_duplicate_results(self):
+        """Insert groups queued by the scan thread; reschedules itself until the scan ends"""
+        # Read the flag first: the worker clears it only after queuing its last group
+        scanning = self.duplicate_is_processing
         try:
-            folder_path = Path(self.duplicate_selected_folder.get())
-            self.duplicate_log_message("=== STARTING DUPLICATE SCAN ===")
-            
-            # Get minimum file size
+            while True:
+                self._insert_duplicate_group(self.duplicate_results_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if scanning:
+            self.root.after(200, self._poll_duplicate_results)
+
+    def _duplicate_options(self):
+        """Build DuplicateOptions from the duplicate finder tab's widgets"""
+        try:
+            min_size_kb = int(self.duplicate_min_size_var.get())
+        except ValueError:
+            min_size_kb = 100  # Default 100KB
+
+        def int_field(var, default, minimum):
             try:
-                min_size_kb = int(self.duplicate_min_size_var.get())
-                min_size_bytes = min_size_kb * 1024
+                return max(minimum, int(var.get()))
             except ValueError:
-                min_size_bytes = 100 * 1024  # Default 100KB
-            
-            # Step 1: Collect all files and group by size
-            self.duplicate_log_message("Step 1: Collecting files and grouping by size...")
-            size_groups = self._collect_files_by_size(folder_path, min_size_bytes)
-            
-            # Step 2: Filter out unique sizes (optimization)
-            self.duplicate_log_message("Step 2: Filtering unique file sizes...")
-            potential_duplicates = {size: files for size, files in size_groups.items() if len(files) > 1}
-            
-            if not potential_duplicates:
-                self.duplicate_log_message("No potential duplicates found (no files with matching sizes)")
-                return
-            
-            self.duplicate_log_message(f"Found {sum(len(files) for files in potential_duplicates.values())} files with matching sizes")
-            
-            # Step 3: Quick hash check (first few KB)
-            self.duplicate_log_message("Step 3: Performing quick hash check...")
-            quick_hash_groups = self._quick_hash_check(potential_duplicates)
-            
-            # Step 4: Full hash for final confirmation
-            self.duplicate_log_message("Step 4: Full hash verification...")
-            duplicate_groups = self._full_hash_check(quick_hash_groups)
-            
-            # Step 5: Display results
-            self._display_duplicate_results(duplicate_groups)
-            
-            total_duplicates = sum(len(group) - 1 for group in duplicate_groups.values())  # -1 because we keep one original
-            self.duplicate_log_message(f"=== SCAN COMPLETE: Found {total_duplicates} duplicate files in {len(duplicate_groups)} groups ===")
-            
+                return default
+
+        return DuplicateOptions(
+            scan_all_files=self.duplicate_scan_all_files_var.get(),
+            include_subfolders=self.duplicate_include_subfolders_var.get(),
+            min_size_kb=min_size_kb,
+            hash_algorithm=self.duplicate_hash_algorithm_var.get(),
+            quick_hash_workers=int_field(self.duplicate_quick_workers_var, DuplicateOptions.quick_hash_workers, 1),
+            full_hash_workers=int_field(self.duplicate_full_workers_var, DuplicateOptions.full_hash_workers, 1),
+            similar_images=self.duplicate_similar_images_var.get(),
+            similarity_distance=int_field(self.duplicate_similarity_var, DuplicateOptions.similarity_distance, 0),
+            similar_videos=self.duplicate_similar_videos_var.get(),
+            similar_audio=self.duplicate_similar_audio_var.get(),
+            content_only=self.duplicate_content_only_var.get(),
+            tier=self.duplicate_tier_var.get(),
+            exclude_patterns=tuple(p.strip() for p in self.duplicate_exclude_var.get().split(',') if p.strip()),
+            folder_mode=self.duplicate_folder_mode_var.get(),
+            truncated_files=self.duplicate_truncated_var.get(),
+        )
+
+    def _duplicate_scan_worker(self, options, checkpoint, folder_path, use_library, upgrade_groups=None):
+        """Worker thread for duplicate scanning, or for re-checking ``upgrade_groups`` at the options' tier"""
+        library = None
+        try:
+            if upgrade_groups is None and use_library:
+                library = LibraryIndex()
+
+            def on_group(key, files):
+                # Build the group's records here, off the Tk thread; the tree only gets its ID.
+                # Library matches, the folder holding a subset folder and complete files of truncated
+                # copies come first and stay the original.
+                group_id = self.duplicate_results.add_group(
+                    key, files, finder.file_stat, keep_first=library is not None or key.startswith(ORIGINAL_FIRST_KEYS))
+                if group_id is not None:
+                    self.duplicate_results_queue.put(group_id)
+
+            finder = DuplicateFinder(options, self.duplicate_log_message, self.duplicate_progress_var.set,
+                                     self.metadata_cache, on_group=on_group, library=library, checkpoint=checkpoint)
+            self.duplicate_finder = finder
+            # Groups reach the tree through duplicate_results_queue while the scan runs
+            if upgrade_groups is not None:
+                finder.upgrade(upgrade_groups, options.tier)
+            else:
+                finder.scan_selected(folder_path)
+
+            # Hardlinks share one copy on disk, so they are listed in the log rather than offered for removal
+            for paths in finder.hardlink_groups:
+                self.duplicate_log_message(f"Hardlinked: {paths[0]} = " + ", ".join(str(p) for p in paths[1:]))
+
         except Exception as e:
             self.duplicate_log_message(f"Error during duplicate scan: {e}")
         finally:
+            if library is not None:
+                library.close()
+            self.duplicate_finder = None
             self.duplicate_is_processing = False
             self.duplicate_progress_var.set("Ready")
 
-    def _collect_files_by_size(self, folder_path, min_size_bytes):
-        """Collect all files and group them by size"""
-        size_groups = defaultdict(list)
-        
+    def _insert_duplicate_group(self, group_id):
+        """Add one group of the results model to the treeview"""
         try:
-            # Determine scan pattern
-            if self.duplicate_include_subfolders_var.get():
-                pattern = "**/*"
-            else:
-                pattern = "*"
-            
-            # Media file extensions for filtering
-            media_extensions = {
-                '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.svg', '.ico',  # Images
-                '.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.m2ts', '.ts',   # Videos
-                '.mp3', '.wav', '.flac', '.aac', '.m4a', '.ogg', '.wma'  # Audio
-            }
-            
-            for file_path in folder_path.glob(pattern):
-                if file_path.is_file():
-                    try:
-                        file_size = file_path.stat().st_size
-                        
-                        # Skip files smaller than minimum
-                        if file_size < min_size_bytes:
-                            continue
-                        
-                        # Filter by file type if needed
-                        if not self.duplicate_scan_all_files_var.get():
-                            if file_path.suffix.lower() not in media_extensions:
-                                continue
-                        
-                        size_groups[file_size].append(file_path)
-                        
-                    except Exception as e:
-                        self.duplicate_log_message(f"Error accessing file '{file_path}': {e}")
-                        continue
-            
-            self.duplicate_log_message(f"Collected {sum(len(files) for files in size_groups.values())} files")
-            
-        except Exception as e:
-            self.duplicate_log_message(f"Error collecting files: {e}")
-        
-        return size_groups
+            if len(self.duplicate_results.records(group_id)) < 2:
+                return
 
-    def _quick_hash_check(self, size_groups):
-        """Perform quick hash check on first few KB of files"""
-        quick_hash_groups = defaultdict(list)
-        hash_algorithm = self.duplicate_hash_algorithm_var.get()
-        
-        try:
-            total_files = sum(len(files) for files in size_groups.values())
-            processed = 0
-            
-            for size, files in size_groups.items():
-                for file_path in files:
-                    try:
-                        # Calculate quick hash (first 64KB)
-                        quick_hash = self._calculate_quick_hash(file_path, hash_algorithm)
-                        if quick_hash:
-                            # Use size + quick_hash as key for better grouping
-                            key = f"{size}_{quick_hash}"
-                            quick_hash_groups[key].append(file_path)
-                        
-                        processed += 1
-                        if processed % 50 == 0:  # Update progress every 50 files
-                            self.duplicate_progress_var.set(f"Quick hash: {processed}/{total_files}")
-                        
-                    except Exception as e:
-                        self.duplicate_log_message(f"Error quick hashing '{file_path}': {e}")
-                        continue
-            
-            # Filter out groups with only one file
-            quick_hash_groups = {key: files for key, files in quick_hash_groups.items() if len(files) > 1}
-            self.duplicate_log_message(f"Quick hash found {len(quick_hash_groups)} potential duplicate groups")
+            self.duplicate_group_count += 1
+
+            # Create group node
+            group_node = self.duplicate_tree.insert('', tk.END, text="", values=("", "", ""))
+            self.duplicate_tree_groups[group_id] = (group_node, self.duplicate_group_count)
+            self._fill_duplicate_group(group_id)
             
+            # Expand group
+            self.duplicate_tree.item(group_node, open=True)
+                
         except Exception as e:
-            self.duplicate_log_message(f"Error in quick hash check: {e}")
-        
-        return quick_hash_groups
+            self.duplicate_log_message(f"Error displaying results: {e}")
+
+    def _fill_duplicate_group(self, group_id):
+        """(Re)build the file rows of a group node from the results model"""
+        group_node, group_num = self.duplicate_tree_groups[group_id]
+        for item in self.duplicate_tree.get_children(group_node):
+            self.duplicate_tree_records.pop(item, None)
+            self.duplicate_tree.delete(item)
 
-    def _full_hash_check(self, quick_hash_groups):
-        """Perform full hash check for final confirmation"""
-        duplicate_groups = defaultdict(list)
-        hash_algorithm = self.duplicate_hash_algorithm_var.get()
+        records = self.duplicate_results.records(group_id)
+        kind = "folders" if records and records[0].key.startswith(("folder:", "subset:")) else "files"
+        self.duplicate_tree.item(group_node, text=f"Group {group_num} ({len(records)} {kind})")
         
-        try:
-            total_files = sum(len(files) for files in quick_hash_groups.values())
-            processed = 0
-            
-            for quick_key, files in quick_hash_groups.items():
-                for file_path in files:
-                    try:
-                        # Calculate full file hash
-                        full_hash = self._calculate_full_hash(file_path, hash_algorithm)
-                        if full_hash:
-                            duplicate_groups[full_hash].append(file_path)
-                        
-                        processed += 1
-                        if processed % 20 == 0:  # Update progress every 20 files
-                            self.duplicate_progress_var.set(f"Full hash: {processed}/{total_files}")
-                        
-                    except Exception as e:
-                        self.duplicate_log_message(f"Error full hashing '{file_path}': {e}")
-                        continue
-            
-            # Filter out groups with only one file
-            duplicate_groups = {hash_val: files for hash_val, files in duplicate_groups.items() if len(files) > 1}
+        # Add files to group in order_group's order; the first is kept as original
+        for i, record in enumerate(records):
+            if i == 0:
+                file_name = f"📁 {record.path.name} (Original)"
+            else:
+                file_name = f"🔄 {record.path.name} (Duplicate)"
             
-        except Exception as e:
-            self.duplicate_log_message(f"Error in full hash check: {e}")
-        
-        return duplicate_groups
+            item = self.duplicate_tree.insert(group_node, tk.END, text="", 
+                                            values=(file_name, format_file_size(record.size), str(record.path.parent)))
+            self.duplicate_tree_records[item] = record
 
-    def _calculate_quick_hash(self, file_path, algorithm):
-        """Calculate hash of first 64KB of file"""
+    def _update_duplicate_results(self, handled_paths):
+        """Remove acted-on files from the results and refresh only the groups they were in"""
         try:
-            hasher = hashlib.new(algorithm)
-            with open(file_path, 'rb') as f:
-                # Read first 64KB
-                chunk = f.read(65536)
-                hasher.update(chunk)
-            return hasher.hexdigest()
-        except Exception:
-            return None
+            touched = self.duplicate_results.remove_paths(handled_paths)
+            # Other files of those groups may have changed too; a re-stat is enough to tell
+            self.duplicate_results.recheck(touched)
 
-    def _calculate_full_hash(self, file_path, algorithm):
-        """Calculate hash of entire file"""
-        try:
-            hasher = hashlib.new(algorithm)
-            with open(file_path, 'rb') as f:
-                # Read file in chunks to handle large files
-                while True:
-                    chunk = f.read(65536)  # 64KB chunks
-                    if not chunk:
-                        break
-                    hasher.update(chunk)
-            return hasher.hexdigest()
-        except Exception:
-            return None
-
-    def _display_duplicate_results(self, duplicate_groups):
-        """Display duplicate results in the treeview"""
-        try:
-            group_num = 1
-            for hash_value, files in duplicate_groups.items():
-                if len(files) < 2:
+            for group_id in touched:
+                if group_id not in self.duplicate_tree_groups:
                     continue
-                
-                # Sort files by path for consistent ordering
-                files.sort(key=lambda x: str(x))
-                
-                # Create group node
-                group_name = f"Group {group_num} ({len(files)} files)"
-                group_node = self.duplicate_tree.insert('', tk.END, text=group_name, values=("", "", ""))
-                
-                # Add files to group
-                for i, file_path in enumerate(files):
-                    try:
-                        file_size = file_path.stat().st_size
-                        size_str = self._format_file_size(file_size)
-                        
-                        # Mark duplicates (keep first as original)
-                        if i == 0:
-                            file_name = f"📁 {file_path.name} (Original)"
-                        else:
-                            file_name = f"🔄 {file_path.name} (Duplicate)"
-                        
-                        self.duplicate_tree.insert(group_node, tk.END, text="", 
-                                                 values=(file_name, size_str, str(file_path.parent)))
-                    except Exception as e:
-                        self.duplicate_log_message(f"Error displaying file '{file_path}': {e}")
-                
-                # Expand group
-                self.duplicate_tree.item(group_node, open=True)
-                group_num += 1
-                
+                if self.duplicate_results.records(group_id):
+                    self._fill_duplicate_group(group_id)
+                else:
+                    # No duplicates left in this group
+                    group_node, _ = self.duplicate_tree_groups.pop(group_id)
+                    for item in self.duplicate_tree.get_children(group_node):
+                        self.duplicate_tree_records.pop(item, None)
+                    self.duplicate_tree.delete(group_node)
+
+            self.clear_preview()
+            self.duplicate_log_message(f"Results updated: {len(self.duplicate_results)} groups, "
+                                       f"{self.duplicate_results.duplicate_count()} duplicates remaining")
         except Exception as e:
-            self.duplicate_log_message(f"Error displaying results: {e}")
+            self.duplicate_log_message(f"Error updating results: {e}")
 
-    def _format_file_size(self, size_bytes):
-        """Format file size in human readable format"""
-        if size_bytes < 1024:
-            return f"{size_bytes} B"
-        elif size_bytes < 1024 * 1024:
-            return f"{size_bytes / 1024:.1f} KB"
-        elif size_bytes < 1024 * 1024 * 1024:
-            return f"{size_bytes / (1024 * 1024):.1f} MB"
-        else:
-            return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
+    def duplicate_export_report(self):
+        """Write the current duplicate results to a CSV or JSONL report"""
+        if not self.duplicate_results:
+            messagebox.showinfo("Info", "No duplicate results to export")
+            return
+        path = filedialog.asksaveasfilename(title="Export Duplicate Report", defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")])
+        if not path:
+            return
+        try:
+            with DuplicateReportWriter(path) as report:
+                report.write_results(self.duplicate_results)
+            self.duplicate_log_message(f"Exported {report.groups} groups ({report.duplicates} duplicates) to {path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not write report: {e}")
 
     def duplicate_apply_actions(self):
         """Apply selected action to duplicate files"""
-        # Get duplicate groups from tree
-        duplicate_groups = self._extract_duplicate_groups_from_tree()
+        # Get duplicate groups from the results model
+        duplicate_groups = self.duplicate_results.path_groups()
         
         if not duplicate_groups:
             messagebox.showinfo("Info", "No duplicates found. Please scan for duplicates first.")
@@ -3140,6 +1861,12 @@ class ImportFolderCleanup:
         if action == "flag":
             messagebox.showinfo("Info", "Duplicates are set to flag only. Select the delete or move option to make changes. No files were modified.")
             return
+
+        if self.duplicate_results_tier not in (None, "full"):
+            messagebox.showerror("Error", f"These results were matched by the {self.duplicate_results_tier} tier, "
+                                          f"confidence {DUPLICATE_TIER_CONFIDENCE[self.duplicate_results_tier]}.\n\n"
+                                          f"Select 'full' and click Verify Results before changing any files.")
+            return
         
         # Confirm action
         total_duplicates = sum(len(group) - 1 for group in duplicate_groups)  # -1 for original
@@ -3147,6 +1874,10 @@ class ImportFolderCleanup:
             msg = f"Delete {total_duplicates} duplicate files? This cannot be undone."
         elif action == "move":
             msg = f"Move {total_duplicates} duplicate files to 'Duplicates' subfolder?"
+        elif action == "hardlink":
+            msg = f"Replace {total_duplicates} duplicate files with hardlinks to their originals? Each file is verified first."
+        elif action == "reflink":
+            msg = f"Replace {total_duplicates} duplicate files with reflinks to their originals? Each file is verified first."
         
         if not messagebox.askyesno("Confirm", msg):
             return
@@ -3155,86 +1886,32 @@ class ImportFolderCleanup:
         self.duplicate_is_processing = True
         self.duplicate_progress_var.set("Applying actions...")
         
-        thread = threading.Thread(target=self._apply_duplicate_actions_worker, args=(duplicate_groups, action))
+        # Tk variables are read here; the worker only gets plain values
+        options = self._duplicate_options()
+        base_folder = Path(self.duplicate_selected_folder.get())
+        thread = threading.Thread(target=self._apply_duplicate_actions_worker,
+                                  args=(duplicate_groups, action, options, base_folder))
         thread.daemon = True
         thread.start()
 
-    def _extract_duplicate_groups_from_tree(self):
-        """Extract duplicate file groups from the treeview"""
-        duplicate_groups = []
-        
-        try:
-            for group_item in self.duplicate_tree.get_children():
-                group_files = []
-                for file_item in self.duplicate_tree.get_children(group_item):
-                    values = self.duplicate_tree.item(file_item, 'values')
-                    if len(values) >= 3:
-                        file_name = values[0].replace("📁 ", "").replace("🔄 ", "").replace(" (Original)", "").replace(" (Duplicate)", "")
-                        file_location = values[2]
-                        file_path = Path(file_location) / file_name
-                        group_files.append(file_path)
-                
-                if len(group_files) > 1:
-                    duplicate_groups.append(group_files)
-                    
-        except Exception as e:
-            self.duplicate_log_message(f"Error extracting duplicate groups: {e}")
-        
-        return duplicate_groups
-
-    def _apply_duplicate_actions_worker(self, duplicate_groups, action):
+    def _apply_duplicate_actions_worker(self, duplicate_groups, action, options, base_folder):
         """Worker thread for applying actions to duplicates"""
         try:
-            self.duplicate_log_message(f"=== APPLYING {action.upper()} ACTION ===")
-            
-            if action == "move":
-                # Create duplicates folder
-                base_folder = Path(self.duplicate_selected_folder.get())
-                duplicates_folder = base_folder / "Duplicates"
-                duplicates_folder.mkdir(exist_ok=True)
-                self.duplicate_log_message(f"Created duplicates folder: {duplicates_folder}")
-            
-            processed = 0
-            total_files = sum(len(group) - 1 for group in duplicate_groups)  # -1 for original
-            
-            for group in duplicate_groups:
-                # Skip first file (original), process the rest as duplicates
-                for duplicate_file in group[1:]:
-                    try:
-                        if action == "delete":
-                            duplicate_file.unlink()
-                            self.duplicate_log_message(f"Deleted: {duplicate_file.name}")
-                        elif action == "move":
-                            dest_path = duplicates_folder / duplicate_file.name
-                            # Handle name conflicts
-                            counter = 1
-                            while dest_path.exists():
-                                name_part = duplicate_file.stem
-                                ext_part = duplicate_file.suffix
-                                dest_path = duplicates_folder / f"{name_part} ({counter}){ext_part}"
-                                counter += 1
-                            
-                            duplicate_file.rename(dest_path)
-                            self.duplicate_log_message(f"Moved: {duplicate_file.name} → Duplicates/{dest_path.name}")
-                        
-                        processed += 1
-                        self.duplicate_progress_var.set(f"{action.title()}: {processed}/{total_files}")
-                        
-                    except Exception as e:
-                        self.duplicate_log_message(f"Error processing '{duplicate_file}': {e}")
-            
-            self.duplicate_log_message(f"=== {action.upper()} COMPLETE: {processed} files processed ===")
+            finder = DuplicateFinder(options, self.duplicate_log_message,
+                                     self.duplicate_progress_var.set, self.metadata_cache)
+            handled = finder.apply_actions(duplicate_groups, action, base_folder)
+            processed = len(handled)
             
             # Show completion message to user
             if processed > 0:
+                # Update the results in place on the Tk thread instead of rescanning
+                self.root.after(0, self._update_duplicate_results, handled)
                 if action == "delete":
-                    messagebox.showinfo("Success", f"Successfully deleted {processed} duplicate files!\n\nRefreshing scan to show updated results...")
+                    messagebox.showinfo("Success", f"Successfully deleted {processed} duplicate files!")
                 elif action == "move":
-                    messagebox.showinfo("Success", f"Successfully moved {processed} duplicate files to 'Duplicates' folder!\n\nRefreshing scan to show updated results...")
-                
-                self.duplicate_log_message("Refreshing duplicate scan to show updated results...")
-                # Clear current results first
-                self.root.after(100, self._clear_and_refresh_duplicates)
+                    messagebox.showinfo("Success", f"Successfully moved {processed} duplicate files to 'Duplicates' folder!")
+                else:
+                    messagebox.showinfo("Success", f"Successfully replaced {processed} duplicate files with {action}s!")
             else:
                 messagebox.showwarning("Warning", "No files were processed. Please check the log for details.")
             
@@ -3244,28 +1921,6 @@ class ImportFolderCleanup:
             self.duplicate_is_processing = False
             self.duplicate_progress_var.set("Ready")
 
-    def _clear_and_refresh_duplicates(self):
-        """Clear the duplicate tree view and refresh the scan"""
-        try:
-            # Clear the tree view
-            for item in self.duplicate_tree.get_children():
-                self.duplicate_tree.delete(item)
-            
-            # Show visual feedback
-            self.duplicate_progress_var.set("Refreshing scan...")
-            self.duplicate_log_message("Cleared previous results, starting fresh scan...")
-            
-            # Start a new scan in background
-            self.duplicate_is_processing = True
-            thread = threading.Thread(target=self._duplicate_scan_worker)
-            thread.daemon = True
-            thread.start()
-            
-        except Exception as e:
-            self.duplicate_log_message(f"Error refreshing duplicates: {e}")
-            self.duplicate_is_processing = False
-            self.duplicate_progress_var.set("Ready")
-
 def main():
     root = tk.Tk()
     app = ImportFolderCleanup(root)
@@ -0,0 +1,216 @@
+"""Persistent per-file metadata cache for the Bulk Media Organizer.
+
+Hashes, ffprobe durations and thumbnail checks are stored in SQLite keyed by
+``(st_dev, st_ino, st_size, st_mtime_ns)``. A file that is modified, replaced
+or truncated gets a new key, so stale results are never returned. Rows for
+the old version of an inode are dropped the next time it is stored.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+SCHEMA_VERSION = 1
+
+# Default upper bound on cached rows (roughly 150 bytes each on disk)
+DEFAULT_MAX_ENTRIES = 2_000_000
+
+# Pending writes are committed in batches of this size
+FLUSH_EVERY = 500
+
+
+def default_cache_path():
+    """Return the cache location: $MEDIA_ORGANIZER_CACHE or a file in the user's home"""
+    override = os.environ.get('MEDIA_ORGANIZER_CACHE')
+    if override:
+        return Path(override)
+    return Path.home() / '.bulk_media_organizer' / 'metadata_cache.sqlite'
+
+
+def stat_key(st):
+    """Return the cache key for an os.stat_result"""
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class MetadataCache:
+    """SQLite-backed cache of per-file results, safe to share between threads.
+
+    Values are stored as JSON under a ``kind`` such as ``'full:sha256'`` or
+    ``'duration'``. Writes are batched; call :meth:`close` (or use the cache as
+    a context manager) to commit the last batch.
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = Path(path) if path else default_cache_path()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pending = {}   # (dev, ino, size, mtime_ns, kind) -> json value
+        self._touched = set()  # keys read since the last flush
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS metadata")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (dev, ino, kind, size, mtime_ns)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)")
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._conn.commit()
+
+    # ------------------------- Lookups -------------------------
+    def get(self, st, kind):
+        """Return the cached value for a stat result, or None on a miss"""
+        key = stat_key(st) + (kind,)
+        with self._lock:
+            value = self._pending.get(key)
+            if value is None:
+                row = self._conn.execute(
+                    "SELECT value FROM metadata WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND kind=?",
+                    key).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                value = row[0]
+                self._touched.add(key)
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, st, kind, value):
+        """Store a JSON-serializable value for a stat result"""
+        key = stat_key(st) + (kind,)
+        with self._lock:
+            self._pending[key] = json.dumps(value)
+            if len(self._pending) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def lookup(self, file_path, kind, compute, st=None):
+        """Return the cached value for ``file_path`` or compute and store it.
+
+        ``compute`` is called with no arguments; a None result is returned but
+        not cached. ``st`` may pass an already known stat result.
+        """
+        if st is None:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                return compute()
+
+        value = self.get(st, kind)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(st, kind, value)
+        return value
+
+    def invalidate(self, st):
+        """Drop every cached value for the inode behind a stat result"""
+        with self._lock:
+            self._pending = {k: v for k, v in self._pending.items() if k[:2] != (st.st_dev, st.st_ino)}
+            self._conn.execute("DELETE FROM metadata WHERE dev=? AND ino=?", (st.st_dev, st.st_ino))
+            self._conn.commit()
+
+    # ------------------------- Maintenance -------------------------
+    def flush(self):
+        """Commit pending writes and last-used times"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        now = int(time.time())
+        with self._conn:
+            if self._pending:
+                rows = [key + (value, now) for key, value in self._pending.items()]
+                # Drop rows for older versions of the same inode before storing the new one
+                self._conn.executemany(
+                    "DELETE FROM metadata WHERE dev=? AND ino=? AND kind=? AND (size<>? OR mtime_ns<>?)",
+                    [(r[0], r[1], r[4], r[2], r[3]) for r in rows])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO metadata (dev, ino, size, mtime_ns, kind, value, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self._pending.clear()
+            if self._touched:
+                self._conn.executemany(
+                    "UPDATE metadata SET last_used=? WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND kind=?",
+                    [(now,) + key for key in self._touched])
+                self._touched.clear()
+
+    def prune(self, max_age_days=None, max_entries=None):
+        """Delete rows unused for ``max_age_days`` and trim to ``max_entries``.
+
+        ``max_entries`` defaults to the limit the cache was opened with; the
+        least recently used rows go first. Returns the number of rows removed.
+        """
+        if max_entries is None:
+            max_entries = self.max_entries
+        removed = 0
+        with self._lock:
+            self._flush_locked()
+            with self._conn:
+                if max_age_days is not None:
+                    cutoff = int(time.time() - max_age_days * 86400)
+                    removed += self._conn.execute("DELETE FROM metadata WHERE last_used < ?", (cutoff,)).rowcount
+                if max_entries is not None:
+                    count = self._conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+                    excess = count - max_entries
+                    if excess > 0:
+                        removed += self._conn.execute(
+                            "DELETE FROM metadata WHERE (dev, ino, kind, size, mtime_ns) IN ("
+                            "SELECT dev, ino, kind, size, mtime_ns FROM metadata ORDER BY last_used LIMIT ?)",
+                            (excess,)).rowcount
+        return removed
+
+    def clear(self):
+        """Delete every cached row"""
+        with self._lock:
+            self._pending.clear()
+            self._touched.clear()
+            with self._conn:
+                self._conn.execute("DELETE FROM metadata")
+            self._conn.execute("VACUUM")
+
+    def stats(self):
+        """Return a dict with the row count per kind and the database size"""
+        with self._lock:
+            self._flush_locked()
+            kinds = dict(self._conn.execute("SELECT kind, COUNT(*) FROM metadata GROUP BY kind").fetchall())
+        try:
+            size_bytes = self.path.stat().st_size
+        except OSError:
+            size_bytes = 0
+        return {'entries': sum(kinds.values()), 'kinds': kinds, 'size_bytes': size_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        """Commit pending writes, enforce the size limit and close the database"""
+        if self._conn is None:
+            return
+        self.prune()
+        with self._lock:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
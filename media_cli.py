@@ -0,0 +1,566 @@
+"""Command-line entry point for the Bulk Media Organizer.
+
+Runs the same engines as the desktop tabs without a display, e.g.::
+
+    python media_cli.py rename  /imports --remove-first 3 --apply
+    python media_cli.py merge   /imports --apply
+    python media_cli.py sort    /imports --export-to /sorted --operation move --apply
+    python media_cli.py cleanup /imports --temp-files --empty-folders --apply
+    python media_cli.py duplicates /imports --media-only --action move
+    python media_cli.py library update /master
+    python media_cli.py duplicates /imports --library --action delete
+    python media_cli.py cache stats
+    python media_cli.py benchmark /imports/big_video.mp4
+
+Every command previews by default and only changes files with ``--apply``
+(or, for ``duplicates``, with ``--action delete|move|hardlink|reflink``).
+"""
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from media_engine import (
+    RenameOptions, FolderRenamer,
+    MediaMerger,
+    SortOptions, FileSorter,
+    CleanupOptions, FolderCleaner,
+    DuplicateOptions, DuplicateFinder, DuplicateResults, ScanCheckpoint,
+    DUPLICATE_TIERS, DUPLICATE_TIER_CONFIDENCE, ORIGINAL_FIRST_KEYS,
+    HASH_READ_STRATEGIES, benchmark_hashing, default_block_size,
+    format_file_size, resolve_target_folders,
+)
+from media_cache import MetadataCache
+from media_library import LibraryIndex
+from media_report import REPORT_FORMATS, DuplicateReportWriter, read_report
+
+
+def log_message(message):
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+
+def progress_message(message):
+    print(f"  {message}", file=sys.stderr, flush=True)
+
+
+def _no_progress(message):
+    pass
+
+
+def _selected_names(args):
+    """Return the --subfolder selection as a set, or None meaning all"""
+    return set(args.subfolder) if args.subfolder else None
+
+
+def _open_cache(args):
+    """Open the metadata cache selected by --cache/--no-cache, or None"""
+    if args.no_cache:
+        return None
+    try:
+        return MetadataCache(args.cache)
+    except Exception as e:
+        log_message(f"Metadata cache unavailable, continuing without it: {e}")
+        return None
+
+
+def _existing_folder(value):
+    path = Path(value)
+    if not path.is_dir():
+        raise argparse.ArgumentTypeError(f"folder does not exist: {value}")
+    return path
+
+
+# ========================= Commands =========================
+def run_rename(args):
+    options = RenameOptions(
+        remove_first=args.remove_first,
+        remove_last=args.remove_last,
+        before_char=args.before_char,
+        after_char=args.after_char,
+        remove_digits=args.remove_digits,
+        remove_special=args.remove_special,
+        replace_underscores=not args.keep_underscores,
+        title_case=not args.no_title_case,
+        rename_files=not args.no_rename_files,
+    )
+    renamer = FolderRenamer(options, log_message)
+
+    if args.apply:
+        renamer.apply(args.folder, _selected_names(args))
+        return 0
+
+    log_message("=== PREVIEW MODE ===")
+    preview_items = renamer.plan(args.folder, _selected_names(args))
+    if not preview_items:
+        log_message("No changes would be made")
+    for item in preview_items:
+        print(f"Folder: {item['old_name']} → {item['final_folder_name']}")
+        for old_name, new_name in item['file_changes']:
+            print(f"    File: {old_name} → {new_name}")
+    return 0
+
+
+def run_merge(args):
+    merger = MediaMerger(log_message)
+
+    if args.apply:
+        merger.apply(args.folder, _selected_names(args))
+        return 0
+
+    log_message("=== PREVIEW MODE ===")
+    preview_items = merger.plan(args.folder, _selected_names(args))
+    if not preview_items:
+        log_message("No changes would be made")
+    for item in preview_items:
+        print(f"Folder: {item['folder']}")
+        for old_name, new_name in item['file_renames']:
+            print(f"    Rename: {old_name} → {new_name}")
+        for video, audio, output in item['pairs']:
+            print(f"    Merge: {video.name} + {audio.name} → {output.name}")
+    return 0
+
+
+def run_sort(args):
+    options = SortOptions(
+        sort_mode="specific" if args.extension else "all",
+        specific_extension=args.extension or ".mp4",
+        separate_images=args.separate_images,
+        output_mode="export" if args.export_to else "in_place",
+        export_folder=str(args.export_to or ""),
+        export_operation=args.operation,
+    )
+    sorter = FileSorter(options, log_message)
+
+    if args.apply:
+        sorter.apply(args.folder)
+        return 0
+
+    log_message("=== PREVIEW MODE ===")
+    sorting_plan = sorter.analyze(args.folder)
+    if not sorting_plan:
+        log_message("No files found to sort")
+        return 0
+
+    dest_base = sorter.destination_base(args.folder)
+    for category, files in sorted(sorting_plan.items()):
+        print(f"{category} ({len(files)} files) → {dest_base / category}")
+        for file_path in files:
+            print(f"    {file_path.name}")
+    total_files = sum(len(files) for files in sorting_plan.values())
+    log_message(f"Preview: {total_files} files in {len(sorting_plan)} categories")
+    return 0
+
+
+def run_cleanup(args):
+    options = CleanupOptions(
+        flatten_folders=args.flatten,
+        remove_empty_folders=args.empty_folders,
+        remove_broken_media=args.broken_media,
+        remove_no_thumbnail_videos=args.no_thumbnail_videos,
+        remove_empty_corrupted_mp4=args.corrupted_mp4_mp3,
+        remove_empty_corrupted_images=args.corrupted_images,
+        remove_temp_files=args.temp_files,
+        remove_custom_extensions=bool(args.extensions),
+        custom_extensions=args.extensions or "",
+    )
+    if not options.any_selected():
+        print("error: select at least one cleanup option", file=sys.stderr)
+        return 2
+
+    cache = _open_cache(args)
+    cleaner = FolderCleaner(options, log_message, cache)
+    selected_names = _selected_names(args)
+
+    try:
+        if args.apply:
+            cleaner.apply(args.folder, selected_names)
+            return 0
+
+        log_message("=== PREVIEW MODE ===")
+        folders_to_process = resolve_target_folders(args.folder, selected_names)
+        preview_items = cleaner.analyze(folders_to_process, selected_mode=selected_names is not None)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    if not preview_items:
+        log_message("No changes would be made")
+    for action, items in preview_items.items():
+        print(f"{action} ({len(items)} items)")
+        for item_path, details in items:
+            print(f"    {item_path}  [{details}]")
+    return 0
+
+
+def run_duplicates(args):
+    options = DuplicateOptions(
+        scan_all_files=not args.media_only,
+        include_subfolders=not args.no_subfolders,
+        min_size_kb=args.min_size_kb,
+        hash_algorithm=args.algorithm,
+        quick_hash_workers=args.quick_workers,
+        full_hash_workers=args.full_workers,
+        hdd_workers=args.hdd_workers,
+        content_only=args.content_only,
+        tier=args.tier,
+        exclude_patterns=tuple(args.exclude),
+        folder_mode=args.folders,
+        sample_count=args.samples,
+        lockstep_max_group=args.lockstep,
+        read_strategy=args.read_strategy,
+        block_size_kb=args.block_size_kb,
+        similar_images=args.similar_images,
+        similarity_distance=args.max_distance,
+        similar_videos=args.similar_videos,
+        video_frame_count=args.video_frames,
+        video_distance=args.video_distance,
+        duration_tolerance=args.duration_tolerance,
+        similar_audio=args.similar_audio,
+        audio_bit_error=args.audio_bit_error,
+        truncated_files=args.truncated,
+    )
+    similar = options.similar_images or options.similar_videos or options.similar_audio
+    if options.folder_mode and (similar or args.truncated or args.library):
+        print("error: --folders compares folders by exact file hashes and cannot be combined with --truncated, "
+              "--library or the similar modes; run them as separate scans", file=sys.stderr)
+        return 2
+    if args.action != "flag" and options.tier != "full" and not (similar or args.library or args.truncated):
+        print(f"error: --action {args.action} needs byte-verified results; the {options.tier} tier's confidence is "
+              f"{DUPLICATE_TIER_CONFIDENCE[options.tier]}. Upgrade with --tier full --upgrade-from REPORT first.",
+              file=sys.stderr)
+        return 2
+    if args.upgrade_from is not None and not args.upgrade_from.is_file():
+        print(f"error: report does not exist: {args.upgrade_from}", file=sys.stderr)
+        return 2
+
+    progress = progress_message if args.progress else _no_progress
+    cache = _open_cache(args)
+    if args.estimate is not None:
+        # Sampling only: no groups, report or checkpoint, so a saved scan stays resumable
+        finder = DuplicateFinder(options, log_message, progress, cache)
+        try:
+            finder.estimate(args.folder, args.estimate)
+        except KeyboardInterrupt:
+            print("Estimate interrupted", file=sys.stderr)
+            return 130
+        finally:
+            if cache is not None:
+                cache.close()
+        return 0
+
+    library = LibraryIndex(args.library_index) if args.library else None
+    checkpoint = ScanCheckpoint(args.checkpoint)
+    if not args.resume:
+        checkpoint.clear()
+    results = DuplicateResults()
+    report = DuplicateReportWriter(args.report, args.report_format) if args.report else None
+    # With a report and nothing to apply, groups go straight to the file instead of being kept in memory
+    keep_results = report is None or args.action != "flag"
+
+    def on_group(key, files):
+        # Library checks list the library copy first, subset folders the folder holding them and
+        # truncated files the complete one; it is the one kept
+        keep_first = library is not None or key.startswith(ORIGINAL_FIRST_KEYS)
+        if keep_results:
+            results.add_group(key, files, finder.file_stat, keep_first=keep_first)
+        if report is not None:
+            report.write_group(key, files, finder.file_stat, keep_first=keep_first)
+
+    finder = DuplicateFinder(options, log_message, progress, cache, on_group=on_group,
+                             library=library, checkpoint=checkpoint)
+    try:
+        if args.upgrade_from is not None:
+            finder.upgrade(read_report(args.upgrade_from), options.tier)
+        else:
+            finder.scan_selected(args.folder)
+    except KeyboardInterrupt:
+        print("Scan interrupted; run the same command with --resume to continue", file=sys.stderr)
+        return 130
+    finally:
+        if cache is not None:
+            cache.close()
+        if library is not None:
+            library.close()
+        if report is not None:
+            report.close()
+
+    for group_num, records in enumerate(results.groups.values(), start=1):
+        # Records are in order_group's order; the first one is kept
+        key = records[0].key
+        if similar:
+            # Similar-mode keys are "image_N", "video_N" or "audio_N"
+            print(f"Group {group_num} ({len(records)} similar {key.split('_')[0]} files)")
+        elif key.startswith("truncated:"):
+            print(f"Group {group_num} (complete file and {len(records) - 1} truncated copies)")
+        elif key.startswith("subset:"):
+            print(f"Group {group_num} (folder with all its files in another, {format_file_size(records[1].size)})")
+        elif key.startswith("folder:"):
+            print(f"Group {group_num} ({len(records)} folders, {format_file_size(records[0].size)} each)")
+        else:
+            print(f"Group {group_num} ({len(records)} files, {format_file_size(records[0].size)} each) {key}")
+        for i, record in enumerate(records):
+            size = f"  ({format_file_size(record.size)})" if similar or key.startswith("truncated:") else ""
+            print(f"    {'Original ' if i == 0 else 'Duplicate'}  {record.path}{size}")
+
+    if finder.hardlink_groups:
+        print(f"Hardlinks ({len(finder.hardlink_groups)} files with several names; not duplicates)")
+        for paths in finder.hardlink_groups:
+            print(f"    {paths[0]}")
+            for linked_path in paths[1:]:
+                print(f"        = {linked_path}")
+
+    if report is not None:
+        log_message(f"Report written to {report.path}: {report.groups} groups, {report.duplicates} duplicates, "
+                    f"{format_file_size(report.reclaimable_bytes)} reclaimable")
+    elif results:
+        log_message(f"{results.duplicate_count()} duplicates, {format_file_size(results.reclaimable_bytes())} reclaimable")
+    if args.action != "flag" and results:
+        finder.apply_actions(results.path_groups(), args.action, args.folder)
+    return 0
+
+
+def run_cache(args):
+    with MetadataCache(args.cache) as cache:
+        if args.cache_command == "prune":
+            removed = cache.prune(args.max_age_days, args.max_entries)
+            log_message(f"Removed {removed} cached entries")
+        elif args.cache_command == "clear":
+            cache.clear()
+            log_message(f"Cleared {cache.path}")
+
+        stats = cache.stats()
+        print(f"Cache: {cache.path}")
+        print(f"Entries: {stats['entries']} ({format_file_size(stats['size_bytes'])} on disk)")
+        for kind, count in sorted(stats['kinds'].items()):
+            print(f"    {kind}: {count}")
+    return 0
+
+
+def run_library(args):
+    with LibraryIndex(args.library_index) as library:
+        if args.library_command == "update":
+            for root in args.roots:
+                if not root.is_dir():
+                    print(f"error: folder does not exist: {root}", file=sys.stderr)
+                    return 2
+                progress = progress_message if args.progress else _no_progress
+                library.update(root, args.algorithm, args.workers, log_message, progress)
+        elif args.library_command == "remove":
+            for root in args.roots:
+                if not library.remove_root(root):
+                    log_message(f"Not a registered library: {root}")
+
+        roots = library.roots()
+        if not roots:
+            print("No libraries indexed")
+        for info in roots:
+            indexed_at = datetime.fromtimestamp(info['indexed_at']).strftime("%Y-%m-%d %H:%M")
+            print(f"{info['root']}: {info['files']} files, {format_file_size(info['bytes'])}, "
+                  f"{info['algorithm']}, indexed {indexed_at}")
+    return 0
+
+
+def run_benchmark(args):
+    if not args.file.is_file():
+        print(f"error: not a file: {args.file}", file=sys.stderr)
+        return 2
+
+    auto_size = default_block_size(args.file.stat().st_dev)
+    block_sizes = [kb * 1024 for kb in args.block_sizes_kb] if args.block_sizes_kb else None
+    log_message(f"Hashing {args.file.name} ({format_file_size(args.file.stat().st_size)}) with {args.algorithm}")
+    log_message(f"Automatic block size for this device: {format_file_size(auto_size)}")
+    results = benchmark_hashing(args.file, args.algorithm, block_sizes, log_message)
+
+    strategy, block_size, speed = max(results, key=lambda result: result[2])
+    log_message(f"Fastest: {strategy} with {format_file_size(block_size)} blocks ({speed:.1f} MB/s)")
+    return 0
+
+
+# ========================= Argument parsing =========================
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="media_cli",
+        description="Headless Bulk Media Organizer. Commands preview by default.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_folder(sub, with_subfolders=True):
+        sub.add_argument("folder", type=_existing_folder, help="Folder to process")
+        if with_subfolders:
+            sub.add_argument("--subfolder", action="append", default=[], metavar="NAME",
+                             help="Limit changes to this subfolder (repeatable; default: all)")
+
+    def add_apply(sub):
+        sub.add_argument("--apply", action="store_true", help="Apply the changes instead of previewing them")
+
+    def add_library_index(sub):
+        sub.add_argument("--library-index", type=Path, metavar="FILE",
+                         help="Library index database (default: $MEDIA_ORGANIZER_LIBRARY or ~/.bulk_media_organizer)")
+
+    def add_cache(sub, with_disable=True):
+        sub.add_argument("--cache", type=Path, metavar="FILE",
+                         help="Metadata cache database (default: $MEDIA_ORGANIZER_CACHE or ~/.bulk_media_organizer)")
+        if with_disable:
+            sub.add_argument("--no-cache", action="store_true", help="Do not read or store cached hashes and probe results")
+
+    # Bulk Folder Renamer
+    rename = subparsers.add_parser("rename", help="Rename folders and the files inside them")
+    add_folder(rename)
+    rename.add_argument("--remove-first", type=int, default=0, metavar="N", help="Remove first N characters")
+    rename.add_argument("--remove-last", type=int, default=0, metavar="N", help="Remove last N characters")
+    rename.add_argument("--before-char", default="", metavar="C", help="Remove everything before character")
+    rename.add_argument("--after-char", default="", metavar="C", help="Remove everything after character")
+    rename.add_argument("--remove-digits", action="store_true", help="Remove all digits")
+    rename.add_argument("--remove-special", action="store_true", help="Remove special characters")
+    rename.add_argument("--keep-underscores", action="store_true", help="Do not replace underscores with spaces")
+    rename.add_argument("--no-title-case", action="store_true", help="Do not convert to title case")
+    rename.add_argument("--no-rename-files", action="store_true", help="Do not rename files to folder name")
+    add_apply(rename)
+    rename.set_defaults(func=run_rename)
+
+    # Media Merger
+    merge = subparsers.add_parser("merge", help="Merge split .mp4 files and video/audio pairs")
+    add_folder(merge)
+    add_apply(merge)
+    merge.set_defaults(func=run_merge)
+
+    # File Sorter
+    sort = subparsers.add_parser("sort", help="Sort files into per-type folders")
+    add_folder(sort, with_subfolders=False)
+    sort.add_argument("--extension", metavar="EXT", help="Only sort files with this extension")
+    sort.add_argument("--separate-images", action="store_true", help="Separate images into individual categories")
+    sort.add_argument("--export-to", type=Path, metavar="FOLDER", help="Create category folders here instead of in place")
+    sort.add_argument("--operation", choices=["copy", "move"], default="copy", help="Export mode (default: copy)")
+    add_apply(sort)
+    sort.set_defaults(func=run_sort)
+
+    # Folder Cleanup
+    cleanup = subparsers.add_parser("cleanup", help="Flatten folders and remove unwanted files")
+    add_folder(cleanup)
+    cleanup.add_argument("--flatten", action="store_true", help="Flatten folders")
+    cleanup.add_argument("--empty-folders", action="store_true", help="Remove empty folders")
+    cleanup.add_argument("--broken-media", action="store_true", help="Remove broken/empty media files")
+    cleanup.add_argument("--no-thumbnail-videos", action="store_true", help="Remove .mp4 files that can't generate thumbnails")
+    cleanup.add_argument("--corrupted-mp4-mp3", action="store_true", help="Remove empty or corrupted .mp4/.mp3 files")
+    cleanup.add_argument("--corrupted-images", action="store_true", help="Remove empty or corrupted image/gif files")
+    cleanup.add_argument("--temp-files", action="store_true", help="Remove temporary/cache files")
+    cleanup.add_argument("--extensions", metavar="LIST", help="Remove files with these extensions, e.g. '.bak, .log'")
+    add_cache(cleanup)
+    add_apply(cleanup)
+    cleanup.set_defaults(func=run_cleanup)
+
+    # Duplicate File Finder
+    duplicates = subparsers.add_parser("duplicates", help="Find duplicate files")
+    add_folder(duplicates, with_subfolders=False)
+    duplicates.add_argument("--media-only", action="store_true", help="Scan media files only (images, videos, audio)")
+    duplicates.add_argument("--no-subfolders", action="store_true", help="Do not include subfolders in scan")
+    duplicates.add_argument("--min-size-kb", type=int, default=100, metavar="KB", help="Minimum file size (default: 100)")
+    duplicates.add_argument("--algorithm", choices=["md5", "sha1", "sha256"], default="sha256", help="Hash algorithm")
+    duplicates.add_argument("--quick-workers", type=int, default=DuplicateOptions.quick_hash_workers, metavar="N",
+                            help=f"Files quick-hashed in parallel (default: {DuplicateOptions.quick_hash_workers})")
+    duplicates.add_argument("--full-workers", type=int, default=DuplicateOptions.full_hash_workers, metavar="N",
+                            help=f"Files fully hashed in parallel per SSD (default: {DuplicateOptions.full_hash_workers})")
+    duplicates.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                            help="Skip files and folders matching GLOB (name or path under FOLDER); repeatable. "
+                                 "The Duplicates folder, .git, @eaDir and snapshot folders are always skipped")
+    duplicates.add_argument("--tier", choices=DUPLICATE_TIERS, default=DuplicateOptions.tier,
+                            help="How far to check: name, size and name_size read no file contents, quick hashes "
+                                 "the first 64 KB, full compares every byte (default: full)")
+    duplicates.add_argument("--upgrade-from", type=Path, metavar="REPORT",
+                            help="Re-check the groups of an earlier --report at --tier instead of scanning FOLDER")
+    duplicates.add_argument("--folders", action="store_true",
+                            help="Report identical folders, and folders whose files all exist in another folder, "
+                                 "as one group each; --action then deletes or moves the whole folder")
+    duplicates.add_argument("--estimate", type=float, metavar="SEC",
+                            help="Instead of scanning, estimate the reclaimable space with a 95%% confidence interval "
+                                 "by quick hashing a weighted sample of size groups for about SEC seconds")
+    duplicates.add_argument("--truncated", action="store_true",
+                            help="Find truncated copies (interrupted downloads) whose content is the start of a larger "
+                                 "file instead of identical files; the complete file is kept")
+    duplicates.add_argument("--content-only", action="store_true",
+                            help="Compare only the image/audio/video data of JPEG, MP4/MOV and MP3 files, "
+                                 "ignoring EXIF, MP4 and ID3 tags")
+    duplicates.add_argument("--hdd-workers", type=int, default=DuplicateOptions.hdd_workers, metavar="N",
+                            help=f"Files hashed at once on each spinning disk, in on-disk order (default: {DuplicateOptions.hdd_workers})")
+    duplicates.add_argument("--samples", type=int, default=DuplicateOptions.sample_count, metavar="N",
+                            help=f"Evenly spaced samples compared before full hashing; 0 to skip (default: {DuplicateOptions.sample_count})")
+    duplicates.add_argument("--lockstep", type=int, default=DuplicateOptions.lockstep_max_group, metavar="N",
+                            help="Compare candidate groups of up to N files byte by byte, stopping at the first "
+                                 f"difference; 0 always hashes (default: {DuplicateOptions.lockstep_max_group})")
+    duplicates.add_argument("--read-strategy", choices=HASH_READ_STRATEGIES, default=DuplicateOptions.read_strategy,
+                            help=f"How full hashes read files (default: {DuplicateOptions.read_strategy})")
+    duplicates.add_argument("--block-size-kb", type=int, default=0, metavar="KB",
+                            help="Full-hash read size; 0 picks one per device (default: 0)")
+    duplicates.add_argument("--similar-images", action="store_true",
+                            help="Find visually similar images (re-encodes, resizes) instead of identical files; needs Pillow")
+    duplicates.add_argument("--max-distance", type=int, default=DuplicateOptions.similarity_distance, metavar="BITS",
+                            help=f"Similar images: largest perceptual hash difference out of 64 bits (default: {DuplicateOptions.similarity_distance})")
+    duplicates.add_argument("--similar-videos", action="store_true",
+                            help="Find re-encoded or re-muxed copies of videos by comparing sampled frames; needs FFmpeg")
+    duplicates.add_argument("--video-frames", type=int, default=DuplicateOptions.video_frame_count, metavar="N",
+                            help=f"Similar videos: frames sampled per video (default: {DuplicateOptions.video_frame_count})")
+    duplicates.add_argument("--video-distance", type=int, default=DuplicateOptions.video_distance, metavar="BITS",
+                            help=f"Similar videos: largest mean frame hash difference (default: {DuplicateOptions.video_distance})")
+    duplicates.add_argument("--duration-tolerance", type=float, default=DuplicateOptions.duration_tolerance, metavar="SEC",
+                            help="Similar videos: only compare videos whose lengths differ by at most this many seconds, "
+                                 f"or this percent of the length if larger (default: {DuplicateOptions.duration_tolerance})")
+    duplicates.add_argument("--similar-audio", action="store_true",
+                            help="Find the same recording in different audio formats; needs FFmpeg and NumPy")
+    duplicates.add_argument("--audio-bit-error", type=float, default=DuplicateOptions.audio_bit_error, metavar="RATE",
+                            help=f"Similar audio: largest fraction of differing fingerprint bits (default: {DuplicateOptions.audio_bit_error})")
+    duplicates.add_argument("--action", choices=["flag", "delete", "move", "hardlink", "reflink"], default="flag",
+                            help="What to do with duplicates; the first file of each group is kept, and hardlink/reflink "
+                                 "replace the others with links to it (default: flag)")
+    duplicates.add_argument("--progress", action="store_true", help="Report hashing progress on stderr")
+    duplicates.add_argument("--report", type=Path, metavar="FILE",
+                            help="Write each group to a CSV or JSONL report as it is confirmed; "
+                                 "with --action flag the groups are not listed or kept in memory")
+    duplicates.add_argument("--report-format", choices=REPORT_FORMATS,
+                            help="Report format (default: from the file name, .jsonl for JSONL, otherwise CSV)")
+    duplicates.add_argument("--resume", action="store_true",
+                            help="Continue an interrupted scan of the same folder and options from its checkpoint")
+    duplicates.add_argument("--checkpoint", type=Path, metavar="FILE",
+                            help="Scan state file (default: ~/.bulk_media_organizer/duplicate_scan_checkpoint.json)")
+    duplicates.add_argument("--library", action="store_true",
+                            help="Only report files already in the indexed reference libraries (see 'library update')")
+    add_cache(duplicates)
+    add_library_index(duplicates)
+    duplicates.set_defaults(func=run_duplicates)
+
+    # Reference library index
+    library = subparsers.add_parser("library", help="Index reference libraries that imports are checked against")
+    library.add_argument("library_command", choices=["update", "list", "remove"], help="Index operation")
+    library.add_argument("roots", nargs="*", type=Path, metavar="ROOT", help="Library folders (update/remove)")
+    library.add_argument("--algorithm", choices=["md5", "sha1", "sha256"], default="sha256", help="Hash algorithm")
+    library.add_argument("--workers", type=int, default=DuplicateOptions.full_hash_workers, metavar="N",
+                         help=f"Files hashed in parallel (default: {DuplicateOptions.full_hash_workers})")
+    library.add_argument("--progress", action="store_true", help="Report indexing progress on stderr")
+    add_library_index(library)
+    library.set_defaults(func=run_library)
+
+    # Metadata cache maintenance
+    cache = subparsers.add_parser("cache", help="Inspect, prune or clear the metadata cache")
+    cache.add_argument("cache_command", choices=["stats", "prune", "clear"], help="Cache operation")
+    cache.add_argument("--max-age-days", type=float, metavar="DAYS", help="prune: drop entries unused for this long")
+    cache.add_argument("--max-entries", type=int, metavar="N", help="prune: keep at most N most recently used entries")
+    add_cache(cache, with_disable=False)
+    cache.set_defaults(func=run_cache)
+
+    # Hashing micro-benchmark
+    benchmark = subparsers.add_parser("benchmark", help="Measure hashing speed of each read strategy on a file")
+    benchmark.add_argument("file", type=Path, help="A large file on the disk to measure")
+    benchmark.add_argument("--algorithm", choices=["md5", "sha1", "sha256"], default="sha256", help="Hash algorithm")
+    benchmark.add_argument("--block-sizes-kb", type=int, nargs="+", metavar="KB",
+                           help="Block sizes to try (default: 64 1024 4096)")
+    benchmark.set_defaults(func=run_benchmark)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3672 @@
+"""Tk-free processing engine for the Bulk Media Organizer.
+
+Each tab of the desktop app has a matching engine class here.  Engines take a
+plain option object plus ``log``/``progress`` callbacks, so the same code runs
+from the GUI worker threads and from ``media_cli.py`` on a headless server.
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import mmap
+import time
+import queue
+import struct
+import threading
+import hashlib
+import subprocess
+import tempfile
+import filecmp
+import fnmatch
+import itertools
+import math
+import random
+import statistics
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from stat import S_ISDIR, S_ISREG
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import media_similarity
+from media_payload import PAYLOAD_EXTENSIONS, hash_payload, open_payload, payload_ranges
+from media_similarity import (
+    AUDIO_EXCERPT_SECONDS, AUDIO_SAMPLE_RATE, HASH_SIZE, PERCEPTUAL_IMAGE_EXTENSIONS,
+    audio_excerpt_offset, audio_fingerprint, dhash, dhash_from_pixels,
+    group_similar, group_similar_audio, group_similar_videos,
+)
+
+# Video/Audio file extensions used by the Media Merger
+VIDEO_EXTENSIONS = {'.mp4', '.webm', '.avi', '.mov', '.mkv'}
+AUDIO_EXTENSIONS = {'.m4a', '.aac', '.mp3', '.wav', '.flac', '.audio'}
+
+# Image extensions used by the sorter and the cleanup detectors
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.svg', '.ico'}
+
+# Extensions checked by the Folder Cleanup media detectors
+CLEANUP_VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v'}
+CLEANUP_DECODABLE_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
+
+# Temporary/cache file markers for the Folder Cleanup
+TEMP_EXTENSIONS = {'.tmp', '.temp', '.part', '.download', '.crdownload', '.partial', '.old'}
+TEMP_NAMES = {'thumbs.db', '.ds_store', 'desktop.ini', '.localized', '.fseventsd', '.spotlight-v100', '.trashes'}
+
+# Media file extensions for the Duplicate Finder "media only" filter
+DUPLICATE_MEDIA_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.svg', '.ico',  # Images
+    '.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.m2ts', '.ts',   # Videos
+    '.mp3', '.wav', '.flac', '.aac', '.m4a', '.ogg', '.wma'  # Audio
+}
+# Videos fingerprinted by the Duplicate Finder's similar-video mode
+DUPLICATE_VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.m2ts', '.ts'}
+# Audio fingerprinted by the similar-audio mode: the merger's formats plus the other common ones
+DUPLICATE_AUDIO_EXTENSIONS = AUDIO_EXTENSIONS | {'.ogg', '.opus', '.wma'}
+# Folder the "move" action creates under the scan root; never scanned, so moved files are not found again
+DUPLICATES_FOLDER_NAME = "Duplicates"
+# Folders the Duplicate Finder never enters: version control, Synology thumbnails, NAS/ZFS snapshots
+DUPLICATE_EXCLUDED_DIRS = {'.git', '.svn', '.hg', '@eadir', '.snapshot', '.snapshots', '~snapshot', '#snapshot', '.zfs'}
+
+# Bytes read from each end of a file for the head and tail fingerprints
+QUICK_HASH_BYTES = 65536
+# Bytes read at each evenly spaced sample point
+SAMPLE_HASH_BYTES = 16384
+
+# Linux ioctl that makes a file share another file's extents (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+# Linux ioctl that maps a file's logical ranges to physical disk extents
+FS_IOC_FIEMAP = 0xC020660B
+
+# Full-file hashing backends: one reused buffer, a memory map, or plain read() calls
+HASH_READ_STRATEGIES = ("readinto", "mmap", "read")
+# Automatic block sizes: spinning disks get longer reads so interleaved workers seek less
+SSD_BLOCK_SIZE = 1024 * 1024
+HDD_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Duplicate scan tiers, cheapest first: the first three read no file contents, "quick" stops after
+# the head hash, "full" confirms every byte
+DUPLICATE_TIERS = ("name", "size", "name_size", "quick", "full")
+DUPLICATE_TIER_CONFIDENCE = {
+    "name": "low (same file name, contents not read)",
+    "size": "low (same size, contents not read)",
+    "name_size": "medium (same name and size, contents not read)",
+    "quick": "high (same size and first 64 KB)",
+    "full": "certain (every byte compared)",
+}
+
+# Truncated file scan: head groups larger than this are split by small blocks at doubling gaps after
+# the head before files are paired, and each file is compared with at most this many larger files
+TRUNCATED_INDEX_BUCKET = 16
+TRUNCATED_BLOCK_BYTES = 4096
+TRUNCATED_MAX_CANDIDATES = 32
+
+# Group keys whose first file is the one to keep (the containing folder, the complete file) instead of the first by path
+ORIGINAL_FIRST_KEYS = ("subset:", "truncated:")
+
+# Size groups the reclaimable space estimate draws at a time, and the seconds between refined estimates
+ESTIMATE_DRAW_BATCH = 256
+ESTIMATE_UPDATE_SECONDS = 1.0
+
+# Seconds between metadata cache flushes while hashing, so a crash loses little work
+CHECKPOINT_SECONDS = 60
+# Candidate bytes and files in the exact scan's first batch of size groups; each later batch doubles both
+STREAM_BATCH_BYTES = 64 * 1024 * 1024
+STREAM_BATCH_FILES = 1024
+
+LogCallback = Callable[[str], None]
+
+
+def _no_log(message):
+    pass
+
+
+def get_ffmpeg_path():
+    """Return a path/command to ffmpeg that works for source and PyInstaller builds.
+
+    Resolution order (Windows-friendly):
+    - If frozen (PyInstaller): try bundled location via sys._MEIPASS and beside the executable
+    - Same directory as this script
+    - On PATH via shutil.which('ffmpeg')
+    - Fallback to 'ffmpeg' (let subprocess rely on PATH)
+    """
+    candidates = []
+
+    # PyInstaller bundled temporary dir
+    if getattr(sys, 'frozen', False):
+        try:
+            meipass_dir = getattr(sys, '_MEIPASS', None)
+            if meipass_dir:
+                candidates.append(os.path.join(meipass_dir, 'ffmpeg.exe'))
+                candidates.append(os.path.join(meipass_dir, 'ffmpeg'))
+        except Exception:
+            pass
+        # Directory of the executable
+        exe_dir = os.path.dirname(sys.executable)
+        candidates.append(os.path.join(exe_dir, 'ffmpeg.exe'))
+        candidates.append(os.path.join(exe_dir, 'ffmpeg'))
+
+    # Directory of this source file
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        candidates.append(os.path.join(here, 'ffmpeg.exe'))
+        candidates.append(os.path.join(here, 'ffmpeg'))
+    except Exception:
+        pass
+
+    # PATH resolution
+    which_ffmpeg = shutil.which('ffmpeg')
+    if which_ffmpeg:
+        candidates.append(which_ffmpeg)
+
+    # Pick the first existing/accessible candidate
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+
+    # Fallback: rely on PATH
+    return 'ffmpeg'
+
+
+def get_ffprobe_path():
+    """Return the ffprobe command that sits next to the resolved ffmpeg"""
+    return get_ffmpeg_path().replace('ffmpeg', 'ffprobe').replace('ffmpeg.exe', 'ffprobe.exe')
+
+
+def probe_duration(media_path, cache=None, st=None):
+    """Return the ffprobe duration in seconds, or -1.0 if ffprobe cannot read the file.
+
+    Raises when ffprobe is missing or times out; those outcomes are not cached.
+    """
+    def probe():
+        cmd = [
+            get_ffprobe_path(),
+            '-v', 'quiet',
+            '-show_entries', 'format=duration',
+            '-of', 'csv=p=0',
+            str(media_path)
+        ]
+
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+
+        if result.returncode != 0:
+            return -1.0  # ffprobe failed, likely corrupted
+
+        try:
+            return float(result.stdout.strip())
+        except (ValueError, TypeError):
+            return -1.0  # Invalid duration output
+
+    return _cached(cache, media_path, 'duration', probe, st)
+
+
+def format_file_size(size_bytes):
+    """Format file size in human readable format"""
+    if size_bytes < 1024:
+        return f"{size_bytes} B"
+    elif size_bytes < 1024 * 1024:
+        return f"{size_bytes / 1024:.1f} KB"
+    elif size_bytes < 1024 * 1024 * 1024:
+        return f"{size_bytes / (1024 * 1024):.1f} MB"
+    else:
+        return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
+
+
+def resolve_target_folders(root_folder: Path, selected_names: Optional[Set[str]]) -> List[Path]:
+    """Return the folders a tab operates on.
+
+    With no subfolder selection every subfolder is processed, or the root folder
+    itself when it has none. Otherwise only the selected subfolders that exist.
+    """
+    if selected_names is None:
+        subfolders = [p for p in root_folder.iterdir() if p.is_dir()]
+        if subfolders:
+            return subfolders
+        return [root_folder]
+    return [root_folder / name for name in selected_names if (root_folder / name).is_dir()]
+
+
+def _cached(cache, file_path, kind, compute, st=None):
+    """Return compute() through a MetadataCache, or directly when there is none"""
+    if cache is None:
+        return compute()
+    return cache.lookup(file_path, kind, compute, st)
+
+
+def _unique_sibling(folder: Path, stem: str, suffix: str) -> Path:
+    """Return folder/'stem suffix', adding ' (n)' until the name is free"""
+    candidate = folder / f"{stem}{suffix}"
+    counter = 1
+    while candidate.exists():
+        candidate = folder / f"{stem} ({counter}){suffix}"
+        counter += 1
+    return candidate
+
+
+class FileEntry(NamedTuple):
+    """A file found by FileInventory, with its stat result cached"""
+    path: Path
+    suffix: str  # lowercase, including the dot
+    stat: os.stat_result
+
+    @property
+    def size(self):
+        return self.stat.st_size
+
+
+class FileInventory:
+    """Every file and subfolder under a root, collected in one os.scandir walk.
+
+    Stat results are cached on the entries so detectors can filter by name,
+    extension and size without touching the filesystem again. Symlinked
+    folders are not followed.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.files: Dict[Path, FileEntry] = {}
+        self.dirs: List[Path] = []  # every subfolder, not the root itself
+        self._child_counts: Dict[Path, int] = {}
+
+    @classmethod
+    def scan(cls, root: Path, log: LogCallback = _no_log):
+        inventory = cls(root)
+        if not root.is_dir():
+            return inventory
+
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            count = 0
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        count += 1
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subfolder = Path(entry.path)
+                                inventory.dirs.append(subfolder)
+                                stack.append(subfolder)
+                            elif entry.is_file():
+                                path = Path(entry.path)
+                                inventory.files[path] = FileEntry(path, path.suffix.lower(), entry.stat())
+                        except OSError as e:
+                            log(f"Error accessing '{entry.path}': {e}")
+            except OSError as e:
+                # Unreadable folders are never reported as empty
+                log(f"Error scanning folder '{current}': {e}")
+                continue
+            inventory._child_counts[current] = count
+
+        return inventory
+
+    def with_suffix(self, suffixes):
+        """Yield the entries whose lowercase extension is in ``suffixes``"""
+        for entry in self.files.values():
+            if entry.suffix in suffixes:
+                yield entry
+
+    def discard(self, path: Path):
+        """Forget a file that has been removed from disk"""
+        if self.files.pop(path, None) is not None:
+            parent = path.parent
+            if parent in self._child_counts:
+                self._child_counts[parent] -= 1
+
+    def empty_dirs(self):
+        """Return the subfolders that had no entries, deepest first"""
+        empty = [d for d in self.dirs if self._child_counts.get(d) == 0]
+        empty.sort(key=lambda x: len(x.parts), reverse=True)
+        return empty
+
+
+def rename_files_to_folder_name(folder_path: Path, log: LogCallback = _no_log):
+    """Rename every file in a folder to '<folder name>', '<folder name> 2', ..."""
+    folder_name = folder_path.name
+
+    files = [f for f in folder_path.iterdir() if f.is_file()]
+    files.sort()  # Sort for consistent numbering
+
+    for i, file_path in enumerate(files):
+        file_ext = file_path.suffix
+        if i == 0:
+            new_file_name = f"{folder_name}{file_ext}"
+        else:
+            new_file_name = f"{folder_name} {i + 1}{file_ext}"
+
+        try:
+            new_file_path = folder_path / new_file_name
+            if new_file_path != file_path:
+                if new_file_path.exists():
+                    # Handle conflicts
+                    counter = 1
+                    while new_file_path.exists():
+                        if i == 0:
+                            new_file_name = f"{folder_name} ({counter}){file_ext}"
+                        else:
+                            new_file_name = f"{folder_name} {i + 1} ({counter}){file_ext}"
+                        new_file_path = folder_path / new_file_name
+                        counter += 1
+
+                file_path.rename(new_file_path)
+                log(f"Renamed file: '{file_path.name}' → '{new_file_name}'")
+        except Exception as e:
+            log(f"Error renaming file '{file_path.name}': {e}")
+
+
+# ========================= Bulk Folder Renamer =========================
+@dataclass
+class RenameOptions:
+    """Folder renaming rules of the Bulk Folder Renamer tab"""
+    remove_first: int = 0
+    remove_last: int = 0
+    before_char: str = ''
+    after_char: str = ''
+    remove_digits: bool = False
+    remove_special: bool = False
+    replace_underscores: bool = True
+    title_case: bool = True
+    rename_files: bool = True
+
+
+class FolderRenamer:
+    """Rename folders by rule and their files after the folder name"""
+
+    def __init__(self, options: RenameOptions, log: LogCallback = _no_log):
+        self.options = options
+        self.log = log
+
+    def clean_folder_name(self, folder_name):
+        """Apply renaming rules to folder name"""
+        opts = self.options
+        cleaned = folder_name
+
+        # Remove first X characters
+        if opts.remove_first > 0:
+            cleaned = cleaned[opts.remove_first:]
+
+        # Remove last X characters
+        if opts.remove_last > 0:
+            if opts.remove_last >= len(cleaned):
+                cleaned = ''
+            else:
+                cleaned = cleaned[:-opts.remove_last]
+
+        # Remove everything before character
+        if opts.before_char:
+            char = opts.before_char
+            if char in cleaned:
+                cleaned = cleaned[cleaned.find(char) + len(char):]
+
+        # Remove everything after character
+        if opts.after_char:
+            char = opts.after_char
+            if char in cleaned:
+                cleaned = cleaned[:cleaned.find(char)]
+
+        # Remove digits
+        if opts.remove_digits:
+            cleaned = re.sub(r'\d+', '', cleaned)
+
+        # Remove special characters
+        if opts.remove_special:
+            cleaned = re.sub(r'[^\w\s-]', '', cleaned)
+
+        # Replace underscores with spaces
+        if opts.replace_underscores:
+            cleaned = cleaned.replace('_', ' ')
+
+        # Title case
+        if opts.title_case:
+            cleaned = cleaned.title()
+
+        # Clean up extra spaces
+        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+
+        return cleaned
+
+    def plan(self, folder_path: Path, selected_names: Optional[Set[str]]):
+        """Simulate the rename and return a list of preview items.
+
+        Each item is a dict with folder_path, old_name, final_folder_name,
+        folder_will_change and file_changes ([(old, new), ...]).
+        """
+        preview_items = []
+        folders_to_process = resolve_target_folders(folder_path, selected_names)
+
+        # Prepare folder rename simulation to reflect conflict handling and case-insensitive FS
+        planned = []
+        for p in folders_to_process:
+            if p == folder_path:
+                # Processing the selected folder itself - don't rename it, just process its files
+                planned.append((p, p.name))
+            else:
+                # Processing subfolders - apply renaming rules
+                planned.append((p, self.clean_folder_name(p.name)))
+
+        # Order by original name length (longest first), matching processing
+        planned.sort(key=lambda x: len(x[0].name), reverse=True)
+
+        def norm_name(name: str) -> str:
+            return os.path.normcase(name)
+
+        occupied = {norm_name(p.name) for p in folders_to_process}
+
+        folder_final_names = {}
+
+        for folder, target_name in planned:
+            old_name = folder.name
+            old_norm = norm_name(old_name)
+            target_norm = norm_name(target_name)
+            final_name = target_name
+
+            # Don't rename the root selected folder
+            if folder == folder_path:
+                final_name = old_name
+            elif old_name != target_name:
+                if target_norm in occupied:
+                    if target_norm == old_norm:
+                        # Same folder (case-only or similar) – allow
+                        final_name = target_name
+                    else:
+                        counter = 1
+                        while norm_name(f"{target_name} ({counter})") in occupied:
+                            counter += 1
+                        final_name = f"{target_name} ({counter})"
+                # Update occupied names to reflect rename
+                occupied.discard(old_norm)
+                occupied.add(norm_name(final_name))
+            else:
+                # No change
+                final_name = old_name
+            folder_final_names[folder] = final_name
+
+        for folder, final_name in folder_final_names.items():
+            old_name = folder.name
+            folder_will_change = (old_name != final_name)
+
+            file_changes = []
+            if self.options.rename_files:
+                files = [f for f in folder.iterdir() if f.is_file()]
+                files.sort()
+                existing_names = {f.name for f in files}
+                planned_names = set()
+                for i, file_path in enumerate(files):
+                    base = final_name if i == 0 else f"{final_name} {i + 1}"
+                    file_ext = file_path.suffix
+                    candidate = f"{base}{file_ext}"
+                    new_name = candidate
+                    if new_name != file_path.name:
+                        # Check conflicts with existing and planned
+                        if (new_name in existing_names) or (new_name in planned_names):
+                            counter = 1
+                            conflict_candidate = f"{base} ({counter}){file_ext}"
+                            while (conflict_candidate in existing_names) or (conflict_candidate in planned_names):
+                                counter += 1
+                                conflict_candidate = f"{base} ({counter}){file_ext}"
+                            new_name = conflict_candidate
+                    planned_names.add(new_name)
+                    if new_name != file_path.name:
+                        file_changes.append((file_path.name, new_name))
+
+            if folder_will_change or file_changes:
+                preview_items.append({
+                    'folder_path': folder,
+                    'old_name': old_name,
+                    'final_folder_name': final_name,
+                    'folder_will_change': folder_will_change,
+                    'file_changes': file_changes,
+                })
+
+        return preview_items
+
+    def apply(self, folder_path: Path, selected_names: Optional[Set[str]]):
+        """Rename the target folders, then rename the files inside them"""
+        self.log("=== STARTING PROCESSING ===")
+
+        folders_to_process = resolve_target_folders(folder_path, selected_names)
+
+        # Step 1: Rename folders (but not the root selected folder)
+        self.log("Step 1: Renaming folders...")
+        folders_to_rename = []
+
+        for item in folders_to_process:
+            if item != folder_path:  # Don't rename the root selected folder
+                old_name = item.name
+                new_name = self.clean_folder_name(old_name)
+
+                if old_name != new_name:
+                    folders_to_rename.append((item, new_name))
+
+        # Sort by name length (longest first) to avoid conflicts
+        folders_to_rename.sort(key=lambda x: len(x[0].name), reverse=True)
+
+        for folder, new_name in folders_to_rename:
+            try:
+                new_path = folder.parent / new_name
+                if new_path.exists():
+                    # If the existing path is the same folder (case-only change on Windows), allow it
+                    is_same = False
+                    try:
+                        is_same = new_path.samefile(folder)
+                    except Exception:
+                        # Fallback for Windows when samefile may fail
+                        is_same = os.path.normcase(os.fspath(new_path)) == os.path.normcase(os.fspath(folder))
+                    if not is_same:
+                        # Handle conflicts by adding number
+                        counter = 1
+                        candidate = folder.parent / f"{new_name} ({counter})"
+                        while candidate.exists():
+                            counter += 1
+                            candidate = folder.parent / f"{new_name} ({counter})"
+                        new_path = candidate
+
+                try:
+                    folder.rename(new_path)
+                except OSError as e:
+                    # Handle Windows case-change edge case by renaming via a temp name
+                    if os.name == 'nt' and "already exists" in str(e).lower():
+                        temp_path = folder.parent / f"{new_name}.__tmp_case__"
+                        folder.rename(temp_path)
+                        temp_path.rename(new_path)
+                    else:
+                        raise
+                self.log(f"Renamed folder: '{folder.name}' → '{new_path.name}'")
+            except Exception as e:
+                self.log(f"Error renaming folder '{folder.name}': {e}")
+
+        # Step 2: Rename files
+        self.log("Step 2: Processing files...")
+
+        if self.options.rename_files:
+            # Re-scan folders after renaming
+            if selected_names is None:
+                current_folders = resolve_target_folders(folder_path, None)
+            else:
+                # After renaming, we need to find the renamed folders
+                current_folders = [p for p in folder_path.iterdir() if p.is_dir()]
+                if not current_folders and folder_path.exists():
+                    current_folders = [folder_path]
+
+            for item in current_folders:
+                rename_files_to_folder_name(item, self.log)
+
+        self.log("=== PROCESSING COMPLETE ===")
+
+
+# ========================= Media Merger =========================
+class MediaMerger:
+    """Pair split or separate video/audio files and merge them with ffmpeg"""
+
+    def __init__(self, log: LogCallback = _no_log):
+        self.log = log
+
+    def find_video_audio_pairs(self, folder_path: Path):
+        """Return list of (video_path, audio_path, output_path) pairs for a folder.
+        Rules:
+        - Handle split .mp4 files (files ending with ' 2' that pair with base name)
+        - Prefer files with matching stem names across video/audio sets
+        - If exactly one video and one audio exist, pair them
+        - Output name based on video stem with video extension; ensure no conflict by suffixing (n)
+        """
+        try:
+            files = [f for f in folder_path.iterdir() if f.is_file()]
+            videos = [f for f in files if f.suffix.lower() in VIDEO_EXTENSIONS]
+            audios = [f for f in files if f.suffix.lower() in AUDIO_EXTENSIONS]
+
+            pairs = []
+            used_videos = set()
+            used_audio = set()
+
+            # First, handle split .mp4 files (files ending with ' 2')
+            mp4_files = [f for f in files if f.suffix.lower() == ".mp4"]
+            split_mp4_pairs = {}
+
+            for f in mp4_files:
+                name_no_ext = f.stem
+                if name_no_ext.endswith(" 2"):
+                    base = name_no_ext[:-2]
+                    split_mp4_pairs.setdefault(base, {})['second'] = f
+                else:
+                    split_mp4_pairs.setdefault(name_no_ext, {})['first'] = f
+
+            # Process split .mp4 pairs
+            for base, parts in split_mp4_pairs.items():
+                first = parts.get('first')
+                second = parts.get('second')
+                if first and second:
+                    output = _unique_sibling(folder_path, base, ".mp4")
+                    pairs.append((first, second, output))
+                    used_videos.add(first)
+                    used_videos.add(second)
+
+            # Then handle regular video/audio pairs
+            audio_by_stem = {}
+            for a in audios:
+                audio_by_stem.setdefault(a.stem, []).append(a)
+
+            for v in videos:
+                if v in used_videos:
+                    continue  # Skip if already used in split mp4 pairs
+
+                candidates = audio_by_stem.get(v.stem, [])
+                if candidates:
+                    a = candidates[0]
+                    if a not in used_audio:
+                        used_audio.add(a)
+                        output = _unique_sibling(folder_path, v.stem, v.suffix)
+                        pairs.append((v, a, output))
+                        used_videos.add(v)
+
+            # If none matched by stem and there is exactly one video and one audio left
+            remaining_videos = [v for v in videos if v not in used_videos]
+            remaining_audios = [a for a in audios if a not in used_audio]
+            if len(remaining_videos) == 1 and len(remaining_audios) == 1:
+                v = remaining_videos[0]
+                a = remaining_audios[0]
+                output = _unique_sibling(folder_path, v.stem, v.suffix)
+                pairs.append((v, a, output))
+
+            return pairs
+        except Exception as e:
+            self.log(f"Error finding media pairs in '{folder_path}': {e}")
+            return []
+
+    def merge_video_audio(self, video_path, audio_path, output_path):
+        """Merge video and audio files using FFmpeg"""
+        try:
+            cmd = [
+                get_ffmpeg_path(), '-y',
+                '-i', str(video_path),
+                '-i', str(audio_path),
+                '-c:v', 'copy',
+                '-c:a', 'aac',
+                '-map', '0:v:0',
+                '-map', '1:a:0',
+                str(output_path)
+            ]
+
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+
+            if result.returncode == 0:
+                # Remove original files
+                video_path.unlink()
+                audio_path.unlink()
+                return True
+            else:
+                self.log(f"FFmpeg error: {result.stderr}")
+                return False
+
+        except subprocess.TimeoutExpired:
+            self.log("FFmpeg operation timed out")
+            return False
+        except Exception as e:
+            self.log(f"Error merging files: {e}")
+            return False
+
+    def plan(self, root_folder: Path, selected_names: Optional[Set[str]]):
+        """Return preview items: dicts with folder, file_renames and pairs"""
+        preview_items = []
+
+        for item in resolve_target_folders(root_folder, selected_names):
+            # Preview file renames that will happen first
+            file_renames = []
+            files = [f for f in item.iterdir() if f.is_file()]
+            files.sort()
+            folder_name = item.name
+
+            for i, file_path in enumerate(files):
+                file_ext = file_path.suffix
+                if i == 0:
+                    new_file_name = f"{folder_name}{file_ext}"
+                else:
+                    new_file_name = f"{folder_name} {i + 1}{file_ext}"
+
+                if new_file_name != file_path.name:
+                    # Check for conflicts and adjust name if needed
+                    new_file_path = item / new_file_name
+                    if new_file_path.exists() and new_file_path != file_path:
+                        counter = 1
+                        while new_file_path.exists():
+                            if i == 0:
+                                new_file_name = f"{folder_name} ({counter}){file_ext}"
+                            else:
+                                new_file_name = f"{folder_name} {i + 1} ({counter}){file_ext}"
+                            new_file_path = item / new_file_name
+                            counter += 1
+                    file_renames.append((file_path.name, new_file_name))
+
+            # Preview merges that will happen after renaming
+            # Note: We can't accurately preview pairs after renaming without actually renaming,
+            # so we'll show the current pairs and note that files will be renamed first
+            pairs = self.find_video_audio_pairs(item)
+
+            if file_renames or pairs:
+                preview_items.append({
+                    'folder': item,
+                    'file_renames': file_renames,
+                    'pairs': pairs,
+                })
+
+        return preview_items
+
+    def apply(self, root_folder: Path, selected_names: Optional[Set[str]]):
+        """Rename files after their folder, then merge the pairs found"""
+        self.log("=== STARTING MEDIA MERGE ===")
+
+        for item in resolve_target_folders(root_folder, selected_names):
+            # Step 1: Rename files to follow folder naming convention
+            self.log(f"Renaming files in '{item.name}'...")
+            rename_files_to_folder_name(item, self.log)
+
+            # Step 2: Find pairs and merge after renaming
+            self.log(f"Finding media pairs in '{item.name}'...")
+            pairs = self.find_video_audio_pairs(item)
+
+            if pairs:
+                self.log(f"Found {len(pairs)} pair(s) to merge in '{item.name}'")
+                for v, a, outp in pairs:
+                    try:
+                        ok = self.merge_video_audio(v, a, outp)
+                        if ok:
+                            self.log(f"Merged into '{outp.name}' in '{item.name}'")
+                        else:
+                            self.log(f"Failed to merge '{v.name}' and '{a.name}' in '{item.name}'")
+                    except Exception as e:
+                        self.log(f"Error merging in '{item.name}': {e}")
+            else:
+                self.log(f"No media pairs found in '{item.name}'")
+
+        self.log("=== MEDIA MERGE COMPLETE ===")
+
+
+# ========================= File Sorter =========================
+@dataclass
+class SortOptions:
+    """Options of the File Sorter tab"""
+    sort_mode: str = "all"  # "all" or "specific"
+    specific_extension: str = ".mp4"
+    separate_images: bool = False
+    output_mode: str = "in_place"  # "in_place" or "export"
+    export_folder: str = ""
+    export_operation: str = "copy"  # "copy" or "move"
+
+
+class FileSorter:
+    """Move or copy files into per-type category folders"""
+
+    def __init__(self, options: SortOptions, log: LogCallback = _no_log):
+        self.options = options
+        self.log = log
+
+    def get_file_category(self, file_path: Path):
+        """Determine the category folder name for a file"""
+        extension = file_path.suffix.lower()
+
+        if not extension:
+            return "no_extension"
+
+        if extension in IMAGE_EXTENSIONS:
+            # Separate images by type, or group common image formats together
+            if self.options.separate_images:
+                return extension[1:]  # Remove the dot
+            return "images"
+
+        # Return extension without the dot for other files
+        return extension[1:]
+
+    def destination_base(self, source_folder: Path):
+        """Return the folder category folders are created in"""
+        if self.options.output_mode == "in_place":
+            return source_folder
+        return Path(self.options.export_folder)
+
+    def analyze(self, source_folder: Path):
+        """Analyze files and return sorting plan"""
+        sorting_plan = {}  # category -> list of files
+
+        try:
+            files = [f for f in source_folder.iterdir() if f.is_file()]
+
+            target_ext = None
+            if self.options.sort_mode == "specific":
+                target_ext = self.options.specific_extension.lower()
+                if not target_ext.startswith('.'):
+                    target_ext = '.' + target_ext
+
+            for file_path in files:
+                # Check if we should process this file
+                if target_ext is not None and file_path.suffix.lower() != target_ext:
+                    continue
+
+                category = self.get_file_category(file_path)
+                sorting_plan.setdefault(category, []).append(file_path)
+
+            return sorting_plan
+        except Exception as e:
+            self.log(f"Error analyzing files: {e}")
+            return {}
+
+    def apply(self, source_folder: Path):
+        """Sort the files; returns (processed_files, total_files)"""
+        self.log("=== STARTING FILE SORTING ===")
+
+        sorting_plan = self.analyze(source_folder)
+
+        if not sorting_plan:
+            self.log("No files found to sort")
+            return 0, 0
+
+        # Determine destination base and operation
+        dest_base = self.destination_base(source_folder)
+        if self.options.output_mode == "in_place":
+            operation = "move"
+        else:
+            operation = self.options.export_operation  # "copy" or "move" based on user choice
+
+        total_files = sum(len(files) for files in sorting_plan.values())
+        processed_files = 0
+
+        for category, files in sorting_plan.items():
+            # Create category folder
+            category_folder = dest_base / category
+            try:
+                category_folder.mkdir(parents=True, exist_ok=True)
+                self.log(f"Created category folder: {category}")
+            except Exception as e:
+                self.log(f"Error creating folder '{category}': {e}")
+                continue
+
+            # Move/copy files
+            for file_path in files:
+                try:
+                    dest_file = category_folder / file_path.name
+
+                    # Handle name conflicts
+                    if dest_file.exists():
+                        dest_file = _unique_sibling(category_folder, file_path.stem, file_path.suffix)
+
+                    if operation == "move":
+                        file_path.rename(dest_file)
+                        self.log(f"Moved: {file_path.name} → {category}/{dest_file.name}")
+                    else:  # copy
+                        shutil.copy2(file_path, dest_file)
+                        self.log(f"Copied: {file_path.name} → {category}/{dest_file.name}")
+
+                    processed_files += 1
+
+                except Exception as e:
+                    self.log(f"Error processing '{file_path.name}': {e}")
+
+        self.log(f"=== SORTING COMPLETE: {processed_files}/{total_files} files processed ===")
+        return processed_files, total_files
+
+
+# ========================= Folder Cleanup =========================
+@dataclass
+class CleanupOptions:
+    """Options of the Folder Cleanup tab"""
+    flatten_folders: bool = False
+    remove_empty_folders: bool = False
+    remove_broken_media: bool = False
+    remove_no_thumbnail_videos: bool = False
+    remove_empty_corrupted_mp4: bool = False
+    remove_empty_corrupted_images: bool = False
+    remove_temp_files: bool = False
+    remove_custom_extensions: bool = False
+    custom_extensions: str = ".bak, .log, .tmp"
+
+    def any_selected(self):
+        return any([
+            self.flatten_folders,
+            self.remove_broken_media,
+            self.remove_no_thumbnail_videos,
+            self.remove_empty_corrupted_mp4,
+            self.remove_empty_corrupted_images,
+            self.remove_temp_files,
+            self.remove_custom_extensions,
+            self.remove_empty_folders,
+        ])
+
+
+class FolderCleaner:
+    """Flatten folders and remove broken, temporary or unwanted files.
+
+    The file detectors share one FileInventory per folder, so a run walks
+    each tree once no matter how many options are enabled. Pass a
+    MetadataCache to reuse ffprobe/ffmpeg results across runs.
+    """
+
+    def __init__(self, options: CleanupOptions, log: LogCallback = _no_log, cache=None):
+        self.options = options
+        self.log = log
+        self.cache = cache
+        self._inventories: Dict[Path, FileInventory] = {}
+
+    def _inventory(self, folder):
+        """Return the cached inventory of ``folder``, walking it on first use"""
+        inventory = self._inventories.get(folder)
+        if inventory is None:
+            inventory = FileInventory.scan(folder, self.log)
+            self._inventories[folder] = inventory
+        return inventory
+
+    def analyze(self, folders_to_process, selected_mode=False):
+        """Analyze what changes would be made during cleanup.
+
+        ``selected_mode`` is True when the user picked specific subfolders, in
+        which case flattening moves the selected folders' own contents up.
+        """
+        opts = self.options
+        self._inventories.clear()
+        preview_items = {
+            "Flatten Files": [],
+            "Remove Empty Folders": [],
+            "Remove Broken Media": [],
+            "Remove No-Thumbnail Videos": [],
+            "Remove Empty/Corrupted MP4/MP3": [],
+            "Remove Empty/Corrupted Images": [],
+            "Remove Temp Files": [],
+            "Remove Custom Extensions": []
+        }
+
+        for folder in folders_to_process:
+            try:
+                # Analyze flatten folders
+                if opts.flatten_folders:
+                    if selected_mode:
+                        # Specific subfolders selected - analyze flattening the selected folders themselves
+                        all_items = list(folder.iterdir())
+                        files = [item for item in all_items if item.is_file()]
+                        subdirs = [item for item in all_items if item.is_dir()]
+
+                        # Show files that will be moved
+                        preview_items["Flatten Files"].extend([(f, "Move to parent folder") for f in files])
+                        # Show subdirectories that will be moved
+                        preview_items["Flatten Files"].extend([(d, "Move to parent folder") for d in subdirs])
+                        # Show that the selected folder will be removed if it becomes empty
+                        if all_items:  # Only if there are items to move
+                            preview_items["Remove Empty Folders"].append((folder, "Remove after flattening"))
+                    else:
+                        # No specific selection - analyze flattening subfolders within the folder
+                        flat_folders = self._find_flat_folders(folder)
+                        for flat_folder in flat_folders:
+                            files = [f for f in flat_folder.iterdir() if f.is_file()]
+                            preview_items["Flatten Files"].extend([(f, f"Move to {folder.name}") for f in files])
+                            # Also show that the empty folder will be removed
+                            if files:  # Only if there are files to move
+                                preview_items["Remove Empty Folders"].append((flat_folder, "Remove after flattening"))
+
+                # Analyze broken media files
+                if opts.remove_broken_media:
+                    broken_media = self._find_broken_media_files(folder)
+                    preview_items["Remove Broken Media"].extend([(f, "0 bytes or corrupted") for f in broken_media])
+
+                # Analyze no-thumbnail videos
+                if opts.remove_no_thumbnail_videos:
+                    no_thumbnail_videos = self._find_no_thumbnail_videos(folder)
+                    preview_items["Remove No-Thumbnail Videos"].extend([(f, "Cannot generate thumbnail") for f in no_thumbnail_videos])
+
+                # Analyze empty/corrupted .mp4/.mp3 files
+                if opts.remove_empty_corrupted_mp4:
+                    empty_corrupted_mp4_mp3 = self._find_empty_corrupted_mp4_mp3_files(folder)
+                    preview_items["Remove Empty/Corrupted MP4/MP3"].extend([(f, "Empty or corrupted .mp4/.mp3 file") for f in empty_corrupted_mp4_mp3])
+
+                # Analyze empty/corrupted image/gif files
+                if opts.remove_empty_corrupted_images:
+                    empty_corrupted_images = self._find_empty_corrupted_images(folder)
+                    preview_items["Remove Empty/Corrupted Images"].extend([(f, "Empty or corrupted image/gif file") for f in empty_corrupted_images])
+
+                # Analyze temp files
+                if opts.remove_temp_files:
+                    temp_files = self._find_temp_files(folder)
+                    preview_items["Remove Temp Files"].extend([(f, "Temporary/cache file") for f in temp_files])
+
+                # Analyze custom extensions
+                if opts.remove_custom_extensions:
+                    custom_files = self._find_custom_extension_files(folder)
+                    preview_items["Remove Custom Extensions"].extend([(f, "Custom extension") for f in custom_files])
+
+                # Analyze empty folders (separate from flattening)
+                if opts.remove_empty_folders:
+                    empty_folders = self._find_empty_folders(folder)
+                    preview_items["Remove Empty Folders"].extend([(f, "Empty folder") for f in empty_folders])
+
+            except Exception as e:
+                self.log(f"Error analyzing folder '{folder}': {e}")
+
+        if self.cache is not None:
+            self.cache.flush()
+
+        # Remove empty categories
+        return {k: v for k, v in preview_items.items() if v}
+
+    def apply(self, folder_path: Path, selected_names: Optional[Set[str]]):
+        """Run every enabled cleanup step on the target folders"""
+        opts = self.options
+        self.log("=== STARTING CLEANUP ===")
+
+        for folder in resolve_target_folders(folder_path, selected_names):
+            self.log(f"Processing folder: {folder.name}")
+
+            # Step 1: Flatten folders
+            if opts.flatten_folders:
+                if selected_names is not None:
+                    # Specific subfolders selected - flatten the selected folders themselves
+                    self._flatten_selected_folder(folder, folder_path)
+                else:
+                    # No specific selection - flatten subfolders within the folder
+                    self._flatten_folders_in_path(folder)
+
+            # Walk the tree once, after flattening has moved things around
+            self._inventories.pop(folder, None)
+
+            # Step 2: Remove broken media files
+            if opts.remove_broken_media:
+                self._remove_broken_media_files(folder)
+
+            # Step 3: Remove no-thumbnail videos
+            if opts.remove_no_thumbnail_videos:
+                self._remove_no_thumbnail_videos(folder)
+
+            # Step 4: Remove empty/corrupted .mp4/.mp3 files
+            if opts.remove_empty_corrupted_mp4:
+                self._remove_empty_corrupted_mp4_mp3_files(folder)
+
+            # Step 5: Remove empty/corrupted image/gif files
+            if opts.remove_empty_corrupted_images:
+                self._remove_empty_corrupted_images(folder)
+
+            # Step 6: Remove temp files
+            if opts.remove_temp_files:
+                self._remove_temp_files(folder)
+
+            # Step 7: Remove custom extension files
+            if opts.remove_custom_extensions:
+                self._remove_custom_extension_files(folder)
+
+            # Step 8: Remove empty folders (after all other operations)
+            if opts.remove_empty_folders:
+                self._remove_empty_folders(folder)
+
+        if self.cache is not None:
+            self.cache.flush()
+
+        self.log("=== CLEANUP COMPLETE ===")
+
+    # ------------------------- Detectors -------------------------
+    def _find_flat_folders(self, parent_folder):
+        """Find folders that contain only files (no subfolders)"""
+        flat_folders = []
+        try:
+            for item in parent_folder.iterdir():
+                if item.is_dir():
+                    # Check if this folder contains only files (no subdirectories)
+                    contents = list(item.iterdir())
+                    if contents and all(f.is_file() for f in contents):
+                        flat_folders.append(item)
+        except Exception as e:
+            self.log(f"Error finding flat folders in '{parent_folder}': {e}")
+        return flat_folders
+
+    def _find_broken_media_files(self, folder):
+        """Find broken or empty media files"""
+        broken_files = []
+        media_extensions = CLEANUP_VIDEO_EXTENSIONS | IMAGE_EXTENSIONS
+
+        try:
+            for entry in self._inventory(folder).with_suffix(media_extensions):
+                item = entry.path
+                # Check if file is 0 bytes
+                if entry.size == 0:
+                    broken_files.append(item)
+                    continue
+
+                # Check video files with ffprobe
+                if entry.suffix in CLEANUP_VIDEO_EXTENSIONS:
+                    if self._is_broken_video(item, entry.stat):
+                        broken_files.append(item)
+
+                # Check image files
+                elif entry.suffix in CLEANUP_DECODABLE_IMAGE_EXTENSIONS:
+                    if self._is_broken_image(item):
+                        broken_files.append(item)
+
+        except Exception as e:
+            self.log(f"Error finding broken media files in '{folder}': {e}")
+
+        return broken_files
+
+    def _find_no_thumbnail_videos(self, folder):
+        """Find .mp4 files that can't generate a thumbnail (audio-only files)"""
+        no_thumbnail_videos = []
+
+        try:
+            for entry in self._inventory(folder).with_suffix({'.mp4'}):
+                # Skip 0-byte files (handled by broken media detection)
+                if entry.size == 0:
+                    continue
+
+                # Check if file can generate a thumbnail
+                if not self._can_generate_thumbnail(entry.path, entry.stat):
+                    no_thumbnail_videos.append(entry.path)
+
+        except Exception as e:
+            self.log(f"Error finding no-thumbnail videos in '{folder}': {e}")
+
+        return no_thumbnail_videos
+
+    def _find_empty_corrupted_mp4_mp3_files(self, folder):
+        """Find empty or corrupted .mp4/.mp3 files"""
+        empty_corrupted_files = []
+
+        try:
+            for entry in self._inventory(folder).with_suffix({'.mp4', '.mp3'}):
+                item = entry.path
+                # Check if file is 0 bytes
+                if entry.size == 0:
+                    empty_corrupted_files.append(item)
+                    continue
+
+                # Check if file is corrupted using ffprobe
+                if entry.suffix == '.mp4':
+                    if self._is_broken_video(item, entry.stat):
+                        empty_corrupted_files.append(item)
+                elif self._is_broken_audio(item, entry.stat):
+                    empty_corrupted_files.append(item)
+
+        except Exception as e:
+            self.log(f"Error finding empty/corrupted .mp4/.mp3 files in '{folder}': {e}")
+
+        return empty_corrupted_files
+
+    def _find_empty_corrupted_images(self, folder):
+        """Find empty or corrupted image/gif files"""
+        empty_corrupted_images = []
+
+        try:
+            for entry in self._inventory(folder).with_suffix(IMAGE_EXTENSIONS):
+                # Check if file is 0 bytes
+                if entry.size == 0:
+                    empty_corrupted_images.append(entry.path)
+                    continue
+
+                # Check if image is corrupted
+                if self._is_broken_image(entry.path):
+                    empty_corrupted_images.append(entry.path)
+
+        except Exception as e:
+            self.log(f"Error finding empty/corrupted images in '{folder}': {e}")
+
+        return empty_corrupted_images
+
+    def _can_generate_thumbnail(self, video_path, st=None):
+        """Check if video file can generate a thumbnail using ffmpeg"""
+        try:
+            return _cached(self.cache, video_path, 'thumbnail', lambda: self._extract_thumbnail(video_path), st)
+        except subprocess.TimeoutExpired:
+            return False  # Timeout suggests issues
+        except Exception:
+            # If ffmpeg is not available, assume it's a valid video
+            return True
+
+    def _extract_thumbnail(self, video_path):
+        """Try to extract the first frame; raises if ffmpeg is missing or times out"""
+        # Create a temporary file for the thumbnail
+        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
+            temp_thumbnail = temp_file.name
+
+        try:
+            # Try to extract the first frame as a thumbnail
+            cmd = [
+                get_ffmpeg_path(),
+                '-i', str(video_path),
+                '-vframes', '1',
+                '-f', 'image2',
+                '-y',  # Overwrite output file
+                '-v', 'quiet',  # Suppress output
+                temp_thumbnail
+            ]
+
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+
+            # Check if thumbnail was created and has content
+            if result.returncode == 0:
+                try:
+                    # Check if file exists and has reasonable size (not just a tiny error image)
+                    if os.path.exists(temp_thumbnail) and os.path.getsize(temp_thumbnail) > 1000:
+                        return True
+                except Exception:
+                    pass
+
+            return False
+
+        finally:
+            # Clean up temporary file
+            try:
+                if os.path.exists(temp_thumbnail):
+                    os.unlink(temp_thumbnail)
+            except Exception:
+                pass
+
+    def _probe_duration(self, media_path, st=None):
+        """Return the ffprobe duration in seconds, or -1.0 if ffprobe cannot read the file"""
+        return probe_duration(media_path, self.cache, st)
+
+    def _is_broken_video(self, video_path, st=None):
+        """Check if video file is broken using ffprobe"""
+        try:
+            # A duration of 0 or an unreadable file means it's broken
+            return self._probe_duration(video_path, st) <= 0
+        except subprocess.TimeoutExpired:
+            return True  # Timeout suggests corruption
+        except Exception:
+            # If ffprobe is not available, skip video checking
+            return False
+
+    def _is_broken_image(self, image_path):
+        """Check if image file is broken"""
+        if Image is None:
+            # PIL not available, only check file size
+            return False
+
+        try:
+            with Image.open(image_path) as img:
+                img.verify()  # Verify the image
+            return False
+        except Exception:
+            return True  # Image is corrupted or unreadable
+
+    def _is_broken_audio(self, audio_path, st=None):
+        """Check if audio file is broken using ffprobe"""
+        try:
+            # A duration of 0 or an unreadable file means it's broken
+            return self._probe_duration(audio_path, st) <= 0
+        except Exception:
+            return True  # Error occurred, assume corrupted
+
+    def _find_temp_files(self, folder):
+        """Find temporary and cache files"""
+        temp_files = []
+
+        try:
+            for entry in self._inventory(folder).files.values():
+                item = entry.path
+                # Check by extension
+                if entry.suffix in TEMP_EXTENSIONS:
+                    temp_files.append(item)
+                # Check by filename (case-insensitive) - including both .ds_store and .DS_Store
+                elif item.name.lower() in TEMP_NAMES:
+                    temp_files.append(item)
+                # Check for browser temp files
+                elif item.name.startswith('.') and any(x in item.name.lower() for x in ['cache', 'temp', 'tmp']):
+                    temp_files.append(item)
+
+        except Exception as e:
+            self.log(f"Error finding temp files in '{folder}': {e}")
+
+        return temp_files
+
+    def _parse_custom_extensions(self):
+        """Return the user's custom extensions as a set of lowercase '.ext' strings"""
+        extensions_text = self.options.custom_extensions.strip()
+        if not extensions_text:
+            return set()
+
+        extensions = [ext.strip().lower() for ext in extensions_text.split(',')]
+        # Ensure extensions start with dot
+        return {ext if ext.startswith('.') else f'.{ext}' for ext in extensions if ext}
+
+    def _find_custom_extension_files(self, folder):
+        """Find files with custom extensions specified by user"""
+        custom_files = []
+
+        try:
+            extensions = self._parse_custom_extensions()
+            if not extensions:
+                return custom_files
+
+            custom_files = [entry.path for entry in self._inventory(folder).with_suffix(extensions)]
+
+        except Exception as e:
+            self.log(f"Error finding custom extension files in '{folder}': {e}")
+
+        return custom_files
+
+    def _find_empty_folders(self, parent_folder):
+        """Find empty folders"""
+        empty_folders = []
+
+        try:
+            # Deepest first, from entry counts recorded during the walk
+            empty_folders = self._inventory(parent_folder).empty_dirs()
+        except Exception as e:
+            self.log(f"Error finding empty folders in '{parent_folder}': {e}")
+
+        return empty_folders
+
+    # ------------------------- Actions -------------------------
+    def _flatten_folders_in_path(self, parent_folder):
+        """Flatten folders by moving files from flat subfolders up one level"""
+        try:
+            flat_folders = self._find_flat_folders(parent_folder)
+
+            for flat_folder in flat_folders:
+                self.log(f"Flattening folder: {flat_folder.name}")
+
+                files = [f for f in flat_folder.iterdir() if f.is_file()]
+                moved_count = 0
+
+                for file_path in files:
+                    try:
+                        # Determine destination path, handling name conflicts
+                        dest_path = parent_folder / file_path.name
+                        if dest_path.exists():
+                            dest_path = _unique_sibling(parent_folder, file_path.stem, file_path.suffix)
+
+                        # Move the file
+                        file_path.rename(dest_path)
+                        moved_count += 1
+
+                    except Exception as e:
+                        self.log(f"Error moving file '{file_path.name}': {e}")
+
+                self.log(f"Moved {moved_count} files from '{flat_folder.name}'")
+
+                # Remove the now-empty folder after moving all files (only if option is enabled)
+                if self.options.remove_empty_folders:
+                    try:
+                        if moved_count > 0:  # Only remove if we successfully moved files
+                            # Double-check the folder is actually empty
+                            remaining_items = list(flat_folder.iterdir())
+                            if not remaining_items:
+                                flat_folder.rmdir()
+                                self.log(f"Removed empty folder: {flat_folder.name}")
+                            else:
+                                self.log(f"Folder '{flat_folder.name}' not removed - still contains {len(remaining_items)} items")
+                    except Exception as e:
+                        self.log(f"Error removing empty folder '{flat_folder.name}': {e}")
+                else:
+                    if moved_count > 0:
+                        remaining_items = list(flat_folder.iterdir())
+                        if not remaining_items:
+                            self.log(f"Folder '{flat_folder.name}' is now empty (not removed - option disabled)")
+
+        except Exception as e:
+            self.log(f"Error flattening folders in '{parent_folder}': {e}")
+
+    def _flatten_selected_folder(self, selected_folder, parent_folder):
+        """Flatten a specific selected folder by moving its contents to the parent folder"""
+        try:
+            self.log(f"Flattening selected folder: {selected_folder.name}")
+
+            # Get all items in the selected folder (files and subdirectories)
+            all_items = list(selected_folder.iterdir())
+            files = [item for item in all_items if item.is_file()]
+            subdirs = [item for item in all_items if item.is_dir()]
+
+            moved_count = 0
+
+            # Move all files to parent folder
+            for file_path in files:
+                try:
+                    dest_path = parent_folder / file_path.name
+                    if dest_path.exists():
+                        dest_path = _unique_sibling(parent_folder, file_path.stem, file_path.suffix)
+
+                    file_path.rename(dest_path)
+                    moved_count += 1
+
+                except Exception as e:
+                    self.log(f"Error moving file '{file_path.name}': {e}")
+
+            # Move all subdirectories to parent folder
+            for subdir in subdirs:
+                try:
+                    dest_path = parent_folder / subdir.name
+                    if dest_path.exists():
+                        dest_path = _unique_sibling(parent_folder, subdir.name, "")
+
+                    subdir.rename(dest_path)
+                    moved_count += 1
+
+                except Exception as e:
+                    self.log(f"Error moving folder '{subdir.name}': {e}")
+
+            self.log(f"Moved {moved_count} items from '{selected_folder.name}'")
+
+            # Remove the now-empty selected folder if all items were moved successfully (only if option is enabled)
+            if self.options.remove_empty_folders:
+                try:
+                    remaining_items = list(selected_folder.iterdir())
+                    if not remaining_items:
+                        selected_folder.rmdir()
+                        self.log(f"Removed empty folder: {selected_folder.name}")
+                    else:
+                        self.log(f"Folder '{selected_folder.name}' not removed - still contains {len(remaining_items)} items")
+                except Exception as e:
+                    self.log(f"Error removing empty folder '{selected_folder.name}': {e}")
+            else:
+                remaining_items = list(selected_folder.iterdir())
+                if not remaining_items:
+                    self.log(f"Folder '{selected_folder.name}' is now empty (not removed - option disabled)")
+
+        except Exception as e:
+            self.log(f"Error flattening selected folder '{selected_folder}': {e}")
+
+    def _remove_files(self, folder, files, label):
+        """Unlink each file, logging per file and a summary using ``label``"""
+        inventory = self._inventory(folder)
+        removed_count = 0
+
+        for file_path in files:
+            try:
+                file_path.unlink()
+                inventory.discard(file_path)
+                self.log(f"Removed {label} file: {file_path.name}")
+                removed_count += 1
+            except PermissionError as e:
+                self.log(f"Permission denied removing {label} file '{file_path.name}': {e}")
+            except FileNotFoundError:
+                self.log(f"{label.capitalize()} file '{file_path.name}' already removed")
+            except Exception as e:
+                self.log(f"Error removing {label} file '{file_path.name}': {e}")
+
+        if removed_count > 0:
+            self.log(f"Removed {removed_count} {label} files")
+        else:
+            self.log(f"No {label} files found to remove")
+        return removed_count
+
+    def _remove_broken_media_files(self, folder):
+        """Remove broken or empty media files"""
+        try:
+            self.log(f"Scanning for broken media files in: {folder.name}")
+            broken_files = self._find_broken_media_files(folder)
+            self.log(f"Found {len(broken_files)} broken media files")
+            self._remove_files(folder, broken_files, "broken media")
+        except Exception as e:
+            self.log(f"Error removing broken media files in '{folder}': {e}")
+
+    def _remove_no_thumbnail_videos(self, folder):
+        """Remove .mp4 files that can't generate thumbnails (audio-only files)"""
+        try:
+            self.log(f"Scanning for .mp4 files without thumbnails in: {folder.name}")
+            no_thumbnail_videos = self._find_no_thumbnail_videos(folder)
+            self.log(f"Found {len(no_thumbnail_videos)} .mp4 files without thumbnails")
+            self._remove_files(folder, no_thumbnail_videos, "no-thumbnail .mp4")
+        except Exception as e:
+            self.log(f"Error removing .mp4 files without thumbnails in '{folder}': {e}")
+
+    def _remove_empty_corrupted_mp4_mp3_files(self, folder):
+        """Remove empty or corrupted .mp4/.mp3 files"""
+        try:
+            self.log(f"Scanning for empty/corrupted .mp4/.mp3 files in: {folder.name}")
+            empty_corrupted_files = self._find_empty_corrupted_mp4_mp3_files(folder)
+            self.log(f"Found {len(empty_corrupted_files)} empty/corrupted .mp4/.mp3 files")
+            self._remove_files(folder, empty_corrupted_files, "empty/corrupted .mp4/.mp3")
+        except Exception as e:
+            self.log(f"Error removing empty/corrupted .mp4/.mp3 files in '{folder}': {e}")
+
+    def _remove_empty_corrupted_images(self, folder):
+        """Remove empty or corrupted image/gif files"""
+        try:
+            self.log(f"Scanning for empty/corrupted image/gif files in: {folder.name}")
+            empty_corrupted_images = self._find_empty_corrupted_images(folder)
+            self.log(f"Found {len(empty_corrupted_images)} empty/corrupted image/gif files")
+            self._remove_files(folder, empty_corrupted_images, "empty/corrupted image/gif")
+        except Exception as e:
+            self.log(f"Error removing empty/corrupted image/gif files in '{folder}': {e}")
+
+    def _remove_temp_files(self, folder):
+        """Remove temporary and cache files"""
+        try:
+            self.log(f"Scanning for temporary files in: {folder.name}")
+            temp_files = self._find_temp_files(folder)
+            self.log(f"Found {len(temp_files)} temporary files")
+
+            # List all found temp files
+            for temp_file in temp_files:
+                self.log(f"  - {temp_file.name}")
+
+            self._remove_files(folder, temp_files, "temp")
+        except Exception as e:
+            self.log(f"Error removing temp files in '{folder}': {e}")
+
+    def _remove_custom_extension_files(self, folder):
+        """Remove files with custom extensions"""
+        try:
+            self.log(f"Scanning for custom extension files in: {folder.name}")
+            custom_files = self._find_custom_extension_files(folder)
+            self.log(f"Found {len(custom_files)} custom extension files")
+            self._remove_files(folder, custom_files, "custom extension")
+        except Exception as e:
+            self.log(f"Error removing custom extension files in '{folder}': {e}")
+
+    def _remove_empty_folders(self, parent_folder):
+        """Remove empty folders"""
+        try:
+            empty_folders = self._find_empty_folders(parent_folder)
+            removed_count = 0
+
+            for folder_path in empty_folders:
+                try:
+                    folder_path.rmdir()
+                    self.log(f"Removed empty folder: {folder_path.name}")
+                    removed_count += 1
+                except Exception as e:
+                    self.log(f"Error removing empty folder '{folder_path.name}': {e}")
+
+            if removed_count > 0:
+                self.log(f"Removed {removed_count} empty folders")
+
+        except Exception as e:
+            self.log(f"Error removing empty folders in '{parent_folder}': {e}")
+
+
+# ========================= Duplicate File Finder =========================
+@lru_cache(maxsize=None)
+def is_rotational(st_dev: int) -> bool:
+    """Whether a device is a spinning disk.
+
+    Linux reports the disk type under /sys/dev/block; elsewhere, or when the
+    device is not a local block device, it is treated as an SSD.
+    """
+    if sys.platform.startswith('linux'):
+        device = Path(f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}")
+        # Partitions keep the queue settings on their parent disk
+        for rotational in (device / 'queue' / 'rotational', device / '..' / 'queue' / 'rotational'):
+            try:
+                return rotational.read_text().strip() == '1'
+            except OSError:
+                continue
+    return False
+
+
+def default_block_size(st_dev: int) -> int:
+    """Pick a hashing block size for a device: larger reads on rotational disks"""
+    return HDD_BLOCK_SIZE if is_rotational(st_dev) else SSD_BLOCK_SIZE
+
+
+def physical_offset(file_path) -> Optional[int]:
+    """Return the disk byte offset of a file's first extent, or None where FIEMAP is unavailable"""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return None
+    # struct fiemap header (start, length, flags, mapped, count, reserved) plus room for one extent
+    request = bytearray(32 + 56)
+    struct.pack_into('=QQIIII', request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        with open(file_path, 'rb') as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request, True)
+    except OSError:
+        return None
+    mapped_extents = struct.unpack_from('=I', request, 20)[0]
+    if not mapped_extents:
+        return None  # Empty, sparse or inline data
+    return struct.unpack_from('=Q', request, 32 + 8)[0]
+
+
+def reflink_file(source: Path, destination: Path):
+    """Create ``destination`` as a copy-on-write clone of ``source``; raises OSError if unsupported"""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError("reflinks (FICLONE) are only supported on Linux")
+    with open(source, 'rb') as src, open(destination, 'xb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def hash_file(file_path, algorithm: str, strategy: str = "readinto", block_size: int = SSD_BLOCK_SIZE,
+              stop: Optional[threading.Event] = None) -> str:
+    """Return the hex digest of a whole file using one of HASH_READ_STRATEGIES.
+
+    Raises InterruptedError between blocks once ``stop`` is set.
+    """
+    hasher = hashlib.new(algorithm)
+
+    def check_stop():
+        if stop is not None and stop.is_set():
+            raise InterruptedError(f"hashing of '{file_path}' cancelled")
+
+    # Unbuffered, so readinto() fills our buffer straight from the kernel
+    with open(file_path, 'rb', buffering=0) as f:
+        if strategy == "mmap":
+            size = os.fstat(f.fileno()).st_size
+            if size:  # Empty files cannot be mapped
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if hasattr(mapped, 'madvise'):
+                        mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    with memoryview(mapped) as view:
+                        for start in range(0, size, block_size):
+                            check_stop()
+                            hasher.update(view[start:start + block_size])
+        elif strategy == "readinto":
+            buffer = bytearray(block_size)
+            with memoryview(buffer) as view:
+                while True:
+                    check_stop()
+                    count = f.readinto(buffer)
+                    if not count:
+                        break
+                    hasher.update(view[:count])
+        else:
+            while True:
+                check_stop()
+                chunk = f.read(block_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def benchmark_hashing(file_path: Path, algorithm: str = "sha256", block_sizes=None, log: LogCallback = _no_log):
+    """Time every read strategy and block size on one file; returns [(strategy, block_size, MB/s)].
+
+    The file is read once beforehand, so results compare the strategies on
+    cached data rather than the disk's own speed.
+    """
+    if block_sizes is None:
+        block_sizes = [65536, SSD_BLOCK_SIZE, HDD_BLOCK_SIZE]
+    size = file_path.stat().st_size
+    hash_file(file_path, algorithm, "read", SSD_BLOCK_SIZE)  # Warm the page cache
+
+    results = []
+    for strategy in HASH_READ_STRATEGIES:
+        for block_size in block_sizes:
+            start = time.perf_counter()
+            hash_file(file_path, algorithm, strategy, block_size)
+            elapsed = time.perf_counter() - start
+            speed = size / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+            log(f"{strategy:<9} {format_file_size(block_size):>9} blocks: {speed:8.1f} MB/s")
+            results.append((strategy, block_size, speed))
+    return results
+
+
+@dataclass
+class DuplicateOptions:
+    """Scan options of the Duplicate File Finder tab"""
+    scan_all_files: bool = True
+    include_subfolders: bool = True
+    min_size_kb: int = 100
+    hash_algorithm: str = "sha256"
+    # Files hashed at once per stage; 1 hashes serially on the calling thread
+    quick_hash_workers: int = 8
+    full_hash_workers: int = 2
+    # Evenly spaced samples hashed after head and tail; 0 skips the sample stage
+    sample_count: int = 8
+    # Candidate groups up to this size are compared byte by byte instead of hashed; 0 always hashes
+    lockstep_max_group: int = 3
+    # Full-hash backend from HASH_READ_STRATEGIES; block size 0 picks one per device
+    read_strategy: str = "readinto"
+    block_size_kb: int = 0
+    # Files hashed at once on each spinning disk (each device gets its own queue, read in disk order)
+    hdd_workers: int = 1
+    # Hash only the picture/sample data of JPEG, MP4/MOV and MP3 files, so copies that differ
+    # only in EXIF, MP4 or ID3 tags match
+    content_only: bool = False
+    # How far to check, from DUPLICATE_TIERS; cheaper tiers can be upgraded later with upgrade()
+    tier: str = "full"
+    # Glob patterns of files and folders to skip, matched against the name and the path under the root
+    exclude_patterns: Tuple[str, ...] = ()
+    # Report copies of whole folders (and folders contained in another) as one group each; every file
+    # is collected regardless of size and type so folder contents are complete
+    folder_mode: bool = False
+    # Similar-image mode: group images whose perceptual hashes differ by at most this many bits
+    similar_images: bool = False
+    similarity_distance: int = 6
+    # Similar-video mode: frames sampled per video, the mean frame hash difference allowed, and
+    # the duration difference (seconds, or percent of the length if larger) worth comparing
+    similar_videos: bool = False
+    video_frame_count: int = 5
+    video_distance: int = 10
+    duration_tolerance: float = 2.0
+    # Similar-audio mode: largest fraction of differing fingerprint bits (unrelated tracks sit near 0.5)
+    similar_audio: bool = False
+    audio_bit_error: float = 0.25
+    # Truncated-copy mode: find files whose whole content is the start of a larger file (interrupted downloads)
+    truncated_files: bool = False
+
+
+class PpsSample:
+    """Hansen-Hurwitz estimate of a population total from draws with replacement, probability proportional to size.
+
+    Each draw measures one member's found amount; the mean found/size share
+    times the total size is unbiased whatever the sizes, and its interval
+    tightens with every draw. A member drawn again reuses its measurement.
+    """
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.total = sum(sizes)
+        self._cumulative = list(itertools.accumulate(sizes))
+        self.measured = {}  # member index -> found amount
+        self.draws = 0
+        self._share_sum = self._share_sq = 0.0
+        self._found = self._covered = 0  # found amount and size of the measured members
+
+    def draw(self, rng, count):
+        """Return ``count`` member indices drawn with probability proportional to size"""
+        return rng.choices(range(len(self.sizes)), cum_weights=self._cumulative, k=count)
+
+    def measure(self, member, found):
+        self.measured[member] = found
+        self._found += found
+        self._covered += self.sizes[member]
+
+    def add(self, member):
+        """Count a draw of a measured member"""
+        share = self.measured[member] / self.sizes[member]
+        self.draws += 1
+        self._share_sum += share
+        self._share_sq += share * share
+
+    def estimate(self, z):
+        """Return (estimate, low, high), clamped to what the unmeasured members could still add"""
+        floor = self._found
+        ceiling = self._found + self.total - self._covered
+        if len(self.measured) == len(self.sizes):
+            return floor, floor, floor
+        if self.draws < 2:
+            # One draw says nothing about the spread; until there are two, anything is possible
+            return min(max(self._share_sum * self.total, floor), ceiling), floor, ceiling
+        mean = self._share_sum / self.draws
+        variance = max(self._share_sq - self.draws * mean * mean, 0.0) / (self.draws - 1)
+        spread = z * self.total * math.sqrt(variance / self.draws)
+        estimate = min(max(mean * self.total, floor), ceiling)
+        return estimate, max(estimate - spread, floor), min(estimate + spread, ceiling)
+
+
+class SpaceEstimate(NamedTuple):
+    """Reclaimable space projected by DuplicateFinder.estimate, with its confidence interval"""
+    reclaimable_bytes: int
+    low: int
+    high: int
+    groups_sampled: int
+    groups_total: int
+    candidate_bytes: int  # reclaimable if every file sharing a size were a duplicate
+    seconds: float
+
+    @property
+    def exact(self) -> bool:
+        """True once every size group has been hashed"""
+        return self.groups_sampled == self.groups_total
+
+
+class DuplicateFinder:
+    """Find byte-identical files: size grouping, quick hash, then full hash.
+
+    Pass a MetadataCache to reuse quick and full hashes of unchanged files.
+    Paths that are hardlinks to one inode are hashed once through a single
+    representative and reported in ``hardlink_groups`` instead of as duplicates.
+    ``on_group(key, files)`` is called from the scanning thread for each group
+    as soon as it is confirmed, smallest candidate groups first. With a
+    ``library`` index, scan_selected checks the folder against it instead.
+
+    cancel() may be called from any thread to stop a scan. With a
+    ScanCheckpoint, scan() saves its candidate groups after each step and
+    resumes from a saved state of the same folder and options.
+    """
+
+    def __init__(self, options: DuplicateOptions, log: LogCallback = _no_log,
+                 progress: LogCallback = _no_log, cache=None,
+                 on_group: Optional[Callable[[str, List[Path]], None]] = None, library=None,
+                 checkpoint=None):
+        self.options = options
+        self.log = log
+        self.progress = progress
+        self.cache = cache
+        self.on_group = on_group or (lambda key, files: None)  # called with each group once it is final
+        self.library = library  # a media_library.LibraryIndex for scan_against_library
+        self.checkpoint = checkpoint  # a ScanCheckpoint, or None to keep no state file
+        self._folder_stats: Dict[Path, os.stat_result] = {}  # folder mode: folders with their total size
+        self._cancel = threading.Event()
+        self._stats: Dict[Path, os.stat_result] = {}  # filled while collecting
+        self._locality: Dict[Path, tuple] = {}  # disk order sort keys, see _locality_key
+        self._payload: Dict[Path, list] = {}  # content-only mode: payload ranges of parsed media files
+        self.hardlink_groups: List[List[Path]] = []  # paths sharing one inode, first is the one scanned
+
+    def scan(self, folder_path: Path) -> Dict[str, List[Path]]:
+        """Return {key: [paths]} for every group of two or more files matching at the options' tier.
+
+        Keys are full hashes for the "full" tier and size/name/quick hash keys
+        for cheaper ones. In folder mode, duplicate folders come first under
+        "folder:"/"subset:" keys, followed by the file groups they do not cover.
+        """
+        if not self.options.folder_mode:
+            return self._scan_files(folder_path)
+        if self.options.tier != "full":
+            self.log("Folder mode needs the full tier; reporting file groups only")
+            return self._scan_files(folder_path)
+
+        # File groups are held back until the folders they belong to are known
+        on_group, self.on_group = self.on_group, (lambda key, files: None)
+        try:
+            file_groups = self._scan_files(folder_path)
+        finally:
+            self.on_group = on_group
+        if self._cancel.is_set():
+            groups = file_groups
+        else:
+            groups = self._group_folders(folder_path, file_groups)
+        for key, files in groups.items():
+            self.on_group(key, files)
+        return groups
+
+    def _scan_files(self, folder_path: Path) -> Dict[str, List[Path]]:
+        self.log("=== STARTING DUPLICATE SCAN ===")
+        tier = self.options.tier
+
+        scan_id = ScanCheckpoint.scan_id(folder_path, self.options)
+        stage, groups, confirmed = self._restore_checkpoint(scan_id)
+
+        if stage is None:
+            min_size_bytes = 0 if self.options.folder_mode else self.options.min_size_kb * 1024
+
+            # Step 1: Collect all files and group by size
+            self.log("Step 1: Collecting files and grouping by size...")
+            size_groups = self._collect_files_by_size(folder_path, min_size_bytes)
+            if self.options.content_only:
+                self.log("Locating media payloads (content-only mode)...")
+                size_groups = self._group_by_payload(size_groups)
+            if self._stop_if_cancelled():
+                return {}
+
+            if tier == "name":
+                # Names alone: every collected file counts, whatever its size
+                self.log("Step 2: Grouping files by name...")
+                all_files = [file_path for files in size_groups.values() for file_path in files]
+                return self._finish_tier(self._split_by_name({"": all_files}), tier, scan_id)
+
+            # Step 2: Filter out unique sizes (optimization)
+            self.log("Step 2: Filtering unique file sizes...")
+            groups = {str(size): files for size, files in size_groups.items() if len(files) > 1}
+
+            if not groups:
+                self.log("No potential duplicates found (no files with matching sizes)")
+                self._clear_checkpoint()
+                return {}
+
+            self.log(f"Found {sum(len(files) for files in groups.values())} files with matching sizes")
+            stage = "size"
+            if tier not in ("size", "name_size"):
+                self._save_checkpoint(scan_id, stage, groups)
+
+        return self._verify(groups, stage, tier, scan_id, confirmed)
+
+    def upgrade(self, path_groups: List[List[Path]], tier: str = "full") -> Dict[str, List[Path]]:
+        """Re-check the groups found by a cheaper tier at ``tier``, without walking the folder again.
+
+        Only the grouped files are stat'ed again and split by size, then they
+        go through the stages ``tier`` needs; each group is passed to on_group
+        as usual.
+        """
+        self.log(f"=== UPGRADING {len(path_groups)} GROUPS TO THE {tier.upper()} TIER ===")
+        self._locality.clear()
+        self._payload.clear()
+
+        groups = defaultdict(list)
+        for number, files in enumerate(path_groups):
+            for file_path in files:
+                try:
+                    st = file_path.stat()
+                except OSError as e:
+                    self.log(f"Error accessing file '{file_path}': {e}")
+                    continue
+                self._stats[file_path] = st
+                groups[f"{number}_{st.st_size}"].append(file_path)
+        if self.options.content_only:
+            groups = self._group_by_payload(groups)
+
+        groups = {str(key): files for key, files in groups.items() if len(files) > 1}
+        self.log(f"{sum(len(files) for files in groups.values())} files still share a size")
+        return self._verify(groups, "size", tier)
+
+    def _verify(self, groups, stage, tier, scan_id=None, confirmed=None):
+        """Run the steps after size grouping that ``tier`` needs, from ``stage`` on.
+
+        For the full tier, ``confirmed`` holds the duplicate groups a resumed
+        scan had already found; they are reported again before the rest.
+        """
+        if tier in ("name", "size", "name_size"):
+            if tier != "size":
+                self.log("Step 3: Splitting size groups by file name...")
+                groups = self._split_by_name(groups)
+            return self._finish_tier(groups, tier, scan_id)
+
+        if tier == "quick":
+            # Step 3: Quick hash check (first few KB)
+            self.log("Step 3: Performing quick hash check...")
+            groups = self._quick_hash_check(groups)
+            if self._stop_if_cancelled():
+                return {}
+            return self._finish_tier(groups, tier, scan_id)
+
+        duplicate_groups = defaultdict(list)
+        self._merge_groups(duplicate_groups, confirmed or {})
+        for key, files in (confirmed or {}).items():
+            self.on_group(key, files)
+
+        # Steps 3-5 run batch by batch, so the groups of small files are confirmed and reported
+        # before the big ones are even quick hashed
+        self.log("Steps 3-5: Quick hash, tail/sample fingerprints and full hash, cheapest size groups first...")
+        remaining = dict(groups)
+        for number, batch in enumerate(self._stream_batches(groups), start=1):
+            self.log(f"Batch {number}: {sum(len(files) for files in batch.values())} files in {len(batch)} groups")
+            candidates = batch
+            if stage == "size":
+                # Step 3: Quick hash check (first few KB)
+                candidates = self._quick_hash_check(candidates)
+                if self._cancel.is_set():
+                    break
+            if stage in ("size", "quick"):
+                # Step 4: Tail and sampled fingerprints split same-header files before any full read
+                candidates = self._fingerprint_check(candidates)
+                if self._cancel.is_set():
+                    break
+            # Step 5: Full hash for final confirmation
+            self._merge_groups(duplicate_groups, self._full_hash_check(candidates))
+            if self._cancel.is_set():
+                break
+
+            for key in batch:
+                del remaining[key]
+            if remaining:
+                self._save_checkpoint(scan_id, stage, remaining, duplicate_groups)
+
+        duplicate_groups = dict(duplicate_groups)
+        if self.cache is not None:
+            self.cache.flush()
+
+        total_duplicates = sum(len(group) - 1 for group in duplicate_groups.values())  # -1 because we keep one original
+        if self._cancel.is_set():
+            self.log(f"=== SCAN CANCELLED: {total_duplicates} duplicate files in {len(duplicate_groups)} groups "
+                     f"confirmed so far ===")
+            return duplicate_groups
+
+        if scan_id is not None:
+            self._clear_checkpoint()
+        self.log(f"=== SCAN COMPLETE: Found {total_duplicates} duplicate files in {len(duplicate_groups)} groups ===")
+        return duplicate_groups
+
+    def _split_by_name(self, groups):
+        """Split groups by case-insensitive file name, dropping files left on their own"""
+        split = defaultdict(list)
+        for key, files in groups.items():
+            for file_path in files:
+                split[f"{key}_{file_path.name.casefold()}" if key else file_path.name.casefold()].append(file_path)
+        return {key: files for key, files in split.items() if len(files) > 1}
+
+    def _finish_tier(self, groups, tier, scan_id=None):
+        """Report the candidate groups of a cheaper tier as they are"""
+        if self.cache is not None:
+            self.cache.flush()
+        for key, files in groups.items():
+            self.on_group(key, files)
+
+        total = sum(len(files) - 1 for files in groups.values())
+        if scan_id is not None:
+            self._clear_checkpoint()
+        self.log(f"=== {tier.upper()} SCAN COMPLETE: {total} possible duplicates in {len(groups)} groups, "
+                 f"confidence {DUPLICATE_TIER_CONFIDENCE[tier]} ===")
+        return dict(groups)
+
+    def cancel(self):
+        """Ask a running scan to stop; safe to call from any thread"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _stop_if_cancelled(self) -> bool:
+        """Log and return True once cancel() was called"""
+        if not self._cancel.is_set():
+            return False
+        if self.cache is not None:
+            self.cache.flush()
+        self.log("=== SCAN CANCELLED ===")
+        return True
+
+    def _save_checkpoint(self, scan_id, stage, groups, confirmed=None):
+        """Write the candidate groups left after ``stage`` and the confirmed ones, and flush cached hashes"""
+        if self.checkpoint is not None and scan_id is not None:
+            try:
+                if self.cache is not None:
+                    self.cache.flush()
+                self.checkpoint.save(scan_id, stage, groups, self._stats, self.hardlink_groups, confirmed)
+            except Exception as e:
+                self.log(f"Error saving scan checkpoint: {e}")
+        return stage
+
+    def _restore_checkpoint(self, scan_id):
+        """Return (stage, candidate groups, confirmed groups) saved for this scan with changed files dropped.
+
+        Returns (None, None, None) when there is nothing to resume.
+        """
+        if self.checkpoint is None:
+            return None, None, None
+        try:
+            state = self.checkpoint.load(scan_id)
+        except Exception as e:
+            self.log(f"Error reading scan checkpoint: {e}")
+            return None, None, None
+        if state is None:
+            return None, None, None
+
+        changed = 0
+
+        def restore(saved_groups):
+            nonlocal changed
+            restored = {}
+            for key, entries in saved_groups.items():
+                files = []
+                for path, dev, ino, size, mtime_ns in entries:
+                    file_path = Path(path)
+                    try:
+                        st = file_path.stat()
+                    except OSError:
+                        changed += 1
+                        continue
+                    if (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns) != (dev, ino, size, mtime_ns):
+                        changed += 1  # Its place in the saved groups may no longer hold
+                        continue
+                    self._stats[file_path] = st
+                    files.append(file_path)
+                if len(files) > 1:
+                    restored[key] = files
+            return restored
+
+        groups = restore(state['groups'])
+        confirmed = restore(state.get('confirmed', {}))
+        self.hardlink_groups = [[Path(path) for path in paths] for paths in state['hardlinks']]
+        if self.options.content_only:
+            self._locate_payloads([file_path for files in groups.values() for file_path in files])
+
+        self.log(f"Resuming from checkpoint after the {state['stage']} step: "
+                 f"{sum(len(files) for files in groups.values())} candidate files and {len(confirmed)} confirmed "
+                 f"groups, {changed} files changed since")
+        return state['stage'], groups, confirmed
+
+    def _clear_checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
+
+    def file_stat(self, file_path: Path) -> os.stat_result:
+        """Return the stat result recorded while collecting, or a fresh one.
+
+        Folders found by folder mode report the total size of their files.
+        """
+        st = self._stats.get(file_path) or self._folder_stats.get(file_path)
+        return st if st is not None else file_path.stat()
+
+    def hash_paths(self, stats: Dict[Path, os.stat_result], algorithm: str, workers: int):
+        """Yield (path, full hash or None, error) for files whose stat results are known, as they complete.
+
+        Uses the same bounded per-device queues as a scan, so cancel() stops it.
+        """
+        self._stats.update(stats)
+        return self._hash_files(list(stats), self._calculate_full_hash, algorithm, workers)
+
+    def _group_folders(self, folder_path, file_groups):
+        """Find duplicate folders bottom-up from the file hashes and collapse the file groups inside them.
+
+        A folder's hash covers the content hashes of its files and subfolders,
+        not their names, so a folder only gets one if every file in it has a
+        confirmed duplicate and nothing in it was excluded from the walk.
+        Such folders whose files all appear in one other folder are reported
+        as subsets of it.
+        """
+        self.log("Step 6: Comparing folders...")
+        # Hardlinks share an inode, so keying by inode covers every name of a hashed file
+        inode_hash = {}
+        for full_hash, files in file_groups.items():
+            for file_path in files:
+                st = self._stats.get(file_path)
+                if st is not None:
+                    inode_hash[(st.st_dev, st.st_ino)] = full_hash
+
+        dir_files = defaultdict(list)  # folder -> [content hash or None]
+        dir_bytes = defaultdict(int)
+        incomplete = set()
+        for file_path, st in self._walk_files(folder_path, incomplete):
+            dir_files[file_path.parent].append(inode_hash.get((st.st_dev, st.st_ino)))
+            dir_bytes[file_path.parent] += st.st_size
+        # Folders with excluded or unreadable entries hold files the scan never saw; they never match
+        for folder in incomplete:
+            dir_files[folder].append(None)
+
+        # Every folder holding files, and its ancestors below the scan root
+        subdirs = defaultdict(list)
+        folders = set()
+        for folder in list(dir_files):
+            while folder != folder_path and folder not in folders:
+                folders.add(folder)
+                subdirs[folder.parent].append(folder)
+                folder = folder.parent
+
+        dir_hash = {}  # fully matched folders only
+        contents = {}  # every folder -> set of the content hashes of the matched files under it
+        total_bytes = {}
+        for folder in sorted(folders, key=lambda d: len(d.parts), reverse=True):
+            parts = dir_files.get(folder, [])
+            total_bytes[folder] = dir_bytes.get(folder, 0) + sum(total_bytes[sub] for sub in subdirs[folder])
+            contents[folder] = {part for part in parts if part is not None}.union(
+                *(contents[sub] for sub in subdirs[folder]))
+            if None in parts or any(sub not in dir_hash for sub in subdirs[folder]):
+                continue  # Holds a file with no duplicate anywhere, or one the scan skipped
+            parts = parts + [f"dir:{dir_hash[sub]}" for sub in subdirs[folder]]
+            dir_hash[folder] = hashlib.sha256("\n".join(sorted(parts)).encode()).hexdigest()
+
+        same_hash = defaultdict(list)
+        for folder, folder_hash in dir_hash.items():
+            same_hash[folder_hash].append(folder)
+
+        groups = {}
+        covered = set()  # duplicate folders to be removed; matches inside them are implied
+
+        def inside_covered(folder):
+            return folder in covered or any(parent in covered for parent in folder.parents)
+
+        # Outermost folders first, so a copied tree is one group rather than one per subfolder
+        for folder in sorted(folders, key=lambda d: (len(d.parts), str(d))):
+            key = f"folder:{dir_hash.get(folder)}"
+            if folder not in dir_hash or key in groups or inside_covered(folder):
+                continue
+            members = sorted((member for member in same_hash[dir_hash[folder]] if not inside_covered(member)),
+                             key=lambda x: str(x))
+            if len(members) > 1:
+                groups[key] = members
+                covered.update(members[1:])
+
+        # Subsets: fully matched folders whose every file also lies under one other folder (not an
+        # ancestor of it); that folder may hold files of its own with no duplicate anywhere
+        containing = defaultdict(set)  # content hash -> folders holding it
+        for folder, folder_contents in contents.items():
+            for content_hash in folder_contents:
+                containing[content_hash].add(folder)
+        for folder in sorted(dir_hash, key=lambda d: (len(d.parts), str(d))):
+            if inside_covered(folder) or f"folder:{dir_hash[folder]}" in groups:
+                continue
+            candidates = set.intersection(*(containing[content_hash] for content_hash in contents[folder]))
+            candidates -= {folder, *folder.parents}
+            candidates = [other for other in candidates if folder not in other.parents
+                          and dir_hash.get(other) != dir_hash[folder] and not inside_covered(other)]
+            if candidates:
+                # The smallest folder holding everything is the closest match
+                target = min(candidates, key=lambda other: (total_bytes[other], str(other)))
+                groups[f"subset:{dir_hash[folder]}"] = [target, folder]
+                covered.add(folder)
+
+        for key, members in groups.items():
+            for member in members:
+                st = member.stat()
+                self._folder_stats[member] = os.stat_result(st[:6] + (total_bytes[member],) + st[7:10])
+
+        # Files under a folder that will be removed go with it
+        collapsed = 0
+        for full_hash, files in file_groups.items():
+            kept = [file_path for file_path in files
+                    if not any(parent in covered for parent in file_path.parents)]
+            collapsed += len(files) - len(kept)
+            if len(kept) > 1:
+                groups[full_hash] = kept
+
+        folder_count = sum(1 for key in groups if key.startswith(("folder:", "subset:")))
+        self.log(f"Found {folder_count} duplicate folder groups covering {collapsed} duplicate files")
+        return groups
+
+    @staticmethod
+    def _folder_files(folder: Path) -> Dict[int, List[Path]]:
+        """Return {size: [paths]} of every file under a folder, with no exclusions"""
+        def fail(error):
+            raise error
+
+        files = defaultdict(list)
+        for dirpath, _, filenames in os.walk(folder, onerror=fail):
+            for name in filenames:
+                file_path = Path(dirpath) / name
+                files[file_path.lstat().st_size].append(file_path)
+        return files
+
+    def _folder_is_copy(self, original: Path, duplicate: Path) -> bool:
+        """True if every file under ``duplicate`` has one with the same full hash under ``original``"""
+        algorithm = self.options.hash_algorithm
+        duplicate_files = self._folder_files(duplicate)
+        original_files = self._folder_files(original)
+        for size, files in duplicate_files.items():
+            if size not in original_files:
+                return False
+            original_hashes = {self._calculate_full_hash(file_path, algorithm) for file_path in original_files[size]}
+            original_hashes.discard(None)
+            for file_path in files:
+                if self._calculate_full_hash(file_path, algorithm) not in original_hashes:
+                    return False
+        return True
+
+    def _remove_folder(self, original: Path, duplicate: Path, action: str, duplicates_folder: Optional[Path]) -> bool:
+        """Delete or move a whole duplicate folder; returns False if it was skipped"""
+        if action not in ("delete", "move"):
+            self.log(f"Skipped folder '{duplicate}': {action} applies to files only")
+            return False
+        # Everything in the folder, including files the scan excluded, must still exist in the original
+        try:
+            is_copy = original.is_dir() and self._folder_is_copy(original, duplicate)
+        except OSError as e:
+            self.log(f"Skipped folder '{duplicate}': {e}")
+            return False
+        if not is_copy:
+            self.log(f"Skipped folder '{duplicate}': not every file in it is also in '{original}'")
+            return False
+        count = sum(len(files) for files in self._folder_files(duplicate).values())
+
+        if action == "delete":
+            shutil.rmtree(duplicate)
+            self.log(f"Deleted folder: {duplicate.name} ({count} files)")
+        else:
+            dest_path = _unique_sibling(duplicates_folder, duplicate.name, "")
+            duplicate.rename(dest_path)
+            self.log(f"Moved folder: {duplicate.name} → Duplicates/{dest_path.name}")
+        return True
+
+    def _replace_with_link(self, original: Path, duplicate: Path, action: str) -> bool:
+        """Atomically swap ``duplicate`` for a hardlink or reflink to ``original``.
+
+        The pair is compared byte for byte first, and the link is built under a
+        temporary name and renamed over the duplicate, so a failure at any
+        point leaves the duplicate untouched. Returns False if it was skipped.
+        """
+        original_stat = original.stat()
+        duplicate_stat = duplicate.stat()
+        if (original_stat.st_dev, original_stat.st_ino) == (duplicate_stat.st_dev, duplicate_stat.st_ino):
+            self.log(f"Skipped (already linked): {duplicate.name}")
+            return False
+        if original_stat.st_dev != duplicate_stat.st_dev:
+            self.log(f"Skipped (different filesystem from original): {duplicate.name}")
+            return False
+
+        # Verify: the files may have changed since they were hashed
+        if not filecmp.cmp(original, duplicate, shallow=False):
+            self.log(f"Skipped (no longer identical to original): {duplicate.name}")
+            return False
+
+        temp_path = duplicate.with_name(f".{duplicate.name}.{os.getpid()}.link")
+        try:
+            if action == "hardlink":
+                os.link(original, temp_path)
+            else:
+                reflink_file(original, temp_path)
+                # A clone is a new file; keep the duplicate's own permissions and times
+                shutil.copystat(duplicate, temp_path)
+            os.replace(temp_path, duplicate)
+        except Exception:
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+            raise
+
+        if action == "hardlink":
+            self.log(f"Hardlinked: {duplicate.name} → {original.name}")
+        else:
+            self.log(f"Reflinked: {duplicate.name} → {original.name}")
+        return True
+
+    def scan_selected(self, folder_path: Path) -> Dict[str, List[Path]]:
+        """Run the library check, the enabled similar image/video/audio scans, or the exact scan"""
+        if self.library is not None:
+            return self.scan_against_library(folder_path)
+
+        if not (self.options.similar_images or self.options.similar_videos or self.options.similar_audio
+                or self.options.truncated_files):
+            return self.scan(folder_path)
+
+        groups = {}
+        if self.options.similar_images:
+            groups.update(self.scan_similar_images(folder_path))
+        if self.options.similar_videos:
+            groups.update(self.scan_similar_videos(folder_path))
+        if self.options.similar_audio:
+            groups.update(self.scan_similar_audio(folder_path))
+        if self.options.truncated_files:
+            groups.update(self.scan_truncated(folder_path))
+        return groups
+
+    def scan_against_library(self, folder_path: Path) -> Dict[str, List[Path]]:
+        """Return {full_hash: [library_path, import paths...]} for files already in the reference library.
+
+        Only import files whose size occurs in the library are hashed, and no
+        library file is read. The library copy comes first in each group, so
+        apply actions keep it and act on the imported copies.
+        """
+        self.log("=== STARTING LIBRARY CHECK ===")
+        algorithm = self.options.hash_algorithm
+
+        library_sizes = self.library.sizes(algorithm)
+        if not library_sizes:
+            self.log(f"The reference library has no files indexed with {algorithm}; index it with this algorithm first")
+            return {}
+
+        self.log("Step 1: Collecting files and grouping by size...")
+        size_groups = self._collect_files_by_size(folder_path, self.options.min_size_kb * 1024)
+        candidates = [file_path for size, files in size_groups.items() if size in library_sizes for file_path in files]
+        self.log(f"{len(candidates)} files share a size with library files")
+
+        self.log("Step 2: Hashing candidates and querying the library index...")
+        duplicate_groups = {}
+        stale = 0
+        hashes = self._hash_files(candidates, self._calculate_full_hash, algorithm, self.options.full_hash_workers)
+        for processed, (file_path, full_hash, error) in enumerate(hashes, start=1):
+            if error is not None:
+                self.log(f"Error full hashing '{file_path}': {error}")
+            elif full_hash:
+                matches = []
+                for path, size, mtime_ns, ino in self.library.find(self._stats[file_path].st_size, algorithm, full_hash):
+                    # The import folder may sit inside a library root; never match a file with itself
+                    if path == file_path.resolve():
+                        continue
+                    # The library copy is the one kept, so it must still be the file that was indexed
+                    try:
+                        st = path.stat()
+                    except OSError:
+                        stale += 1
+                        continue
+                    if (st.st_size, st.st_mtime_ns, st.st_ino) != (size, mtime_ns, ino):
+                        stale += 1
+                        continue
+                    matches.append(path)
+                if matches:
+                    duplicate_groups.setdefault(full_hash, [matches[0]]).append(file_path)
+
+            if processed % 20 == 0:  # Update progress every 20 files
+                self.progress(f"Library check: {processed}/{len(candidates)}")
+
+        if self.cache is not None:
+            self.cache.flush()
+
+        if self._stop_if_cancelled():
+            return {}
+
+        for full_hash, files in duplicate_groups.items():
+            self.on_group(full_hash, files)
+
+        if stale:
+            self.log(f"Ignored {stale} library files changed or removed since they were indexed; update the library")
+        total_found = sum(len(group) - 1 for group in duplicate_groups.values())
+        self.log(f"=== LIBRARY CHECK COMPLETE: {total_found} files already in the library ===")
+        return duplicate_groups
+
+    def scan_similar_images(self, folder_path: Path) -> Dict[str, List[Path]]:
+        """Return {label: [paths]} for groups of visually similar images (re-encodes, resizes)"""
+        self.log("=== STARTING SIMILAR IMAGE SCAN ===")
+
+        if Image is None:
+            self.log("Similar image search needs Pillow: pip install Pillow")
+            return {}
+
+        self.log("Step 1: Collecting images...")
+        size_groups = self._collect_files_by_size(folder_path, self.options.min_size_kb * 1024)
+        paths = [file_path for files in size_groups.values() for file_path in files
+                 if file_path.suffix.lower() in PERCEPTUAL_IMAGE_EXTENSIONS]
+        self.log(f"Found {len(paths)} images")
+
+        self.log("Step 2: Computing perceptual hashes...")
+        hashes = {}
+        results = self._hash_files(paths, self._calculate_image_hash, "dhash", self.options.quick_hash_workers)
+        for processed, (file_path, image_hash, error) in enumerate(results, start=1):
+            if error is not None:
+                self.log(f"Error reading image '{file_path}': {error}")
+            elif image_hash is not None:
+                hashes[file_path] = image_hash
+
+            if processed % 50 == 0:  # Update progress every 50 files
+                self.progress(f"Perceptual hash: {processed}/{len(paths)}")
+
+        if self.cache is not None:
+            self.cache.flush()
+
+        if self._stop_if_cancelled():
+            return {}
+
+        self.log(f"Step 3: Grouping images within {self.options.similarity_distance} bits...")
+        similar_groups = group_similar(hashes, self.options.similarity_distance)
+
+        total_similar = sum(len(group) - 1 for group in similar_groups)
+        self.log(f"=== SCAN COMPLETE: Found {total_similar} similar images in {len(similar_groups)} groups ===")
+        groups = {f"image_{number}": group for number, group in enumerate(similar_groups, start=1)}
+        for key, files in groups.items():
+            self.on_group(key, files)
+        return groups
+
+    def scan_similar_videos(self, folder_path: Path) -> Dict[str, List[Path]]:
+        """Return {label: [paths]} for groups of re-encoded or re-muxed copies of the same video"""
+        self.log("=== STARTING SIMILAR VIDEO SCAN ===")
+
+        self.log("Step 1: Collecting videos...")
+        size_groups = self._collect_files_by_size(folder_path, self.options.min_size_kb * 1024)
+        paths = [file_path for files in size_groups.values() for file_path in files
+                 if file_path.suffix.lower() in DUPLICATE_VIDEO_EXTENSIONS]
+        self.log(f"Found {len(paths)} videos")
+
+        self.log(f"Step 2: Fingerprinting {self.options.video_frame_count} frames per video...")
+        fingerprints = {}
+        results = self._hash_files(paths, self._calculate_video_fingerprint, f"vframes{self.options.video_frame_count}",
+                                   self.options.quick_hash_workers)
+        for processed, (file_path, fingerprint, error) in enumerate(results, start=1):
+            if isinstance(error, FileNotFoundError):
+                # ffmpeg/ffprobe missing is the same for every file; stop early
+                self.log(f"Cannot fingerprint videos, FFmpeg was not found: {error}")
+                break
+            if error is not None:
+                self.log(f"Error fingerprinting '{file_path}': {error}")
+            if fingerprint is not None:
+                fingerprints[file_path] = (fingerprint['duration'], fingerprint['frames'])
+
+            if processed % 10 == 0:  # Update progress every 10 files
+                self.progress(f"Video fingerprint: {processed}/{len(paths)}")
+
+        if self.cache is not None:
+            self.cache.flush()
+
+        if self._stop_if_cancelled():
+            return {}
+
+        self.log("Step 3: Comparing videos of similar length...")
+        similar_groups = group_similar_videos(fingerprints, self.options.video_distance, self.options.duration_tolerance)
+
+        total_similar = sum(len(group) - 1 for group in similar_groups)
+        self.log(f"=== SCAN COMPLETE: Found {total_similar} similar videos in {len(similar_groups)} groups ===")
+        groups = {f"video_{number}": group for number, group in enumerate(similar_groups, start=1)}
+        for key, files in groups.items():
+            self.on_group(key, files)
+        return groups
+
+    def scan_similar_audio(self, folder_path: Path) -> Dict[str, List[Path]]:
+        """Return {label: [paths]} for groups of the same recording saved in different formats"""
+        self.log("=== STARTING SIMILAR AUDIO SCAN ===")
+
+        if media_similarity.np is None:
+            self.log("Similar audio search needs NumPy: pip install numpy")
+            return {}
+
+        self.log("Step 1: Collecting audio files...")
+        size_groups = self._collect_files_by_size(folder_path, self.options.min_size_kb * 1024)
+        paths = [file_path for files in size_groups.values() for file_path in files
+                 if file_path.suffix.lower() in DUPLICATE_AUDIO_EXTENSIONS]
+        self.log(f"Found {len(paths)} audio files")
+
+        self.log("Step 2: Fingerprinting audio...")
+        fingerprints = {}
+        results = self._hash_files(paths, self._calculate_audio_fingerprint, "audio_fp1", self.options.quick_hash_workers)
+        for processed, (file_path, fingerprint, error) in enumerate(results, start=1):
+            if isinstance(error, FileNotFoundError):
+                # ffmpeg/ffprobe missing is the same for every file; stop early
+                self.log(f"Cannot fingerprint audio, FFmpeg was not found: {error}")
+                break
+            if error is not None:
+                self.log(f"Error fingerprinting '{file_path}': {error}")
+            elif fingerprint is not None:
+                fingerprints[file_path] = (fingerprint['duration'], fingerprint['bits'])
+
+            if processed % 20 == 0:  # Update progress every 20 files
+                self.progress(f"Audio fingerprint: {processed}/{len(paths)}")
+
+        if self.cache is not None:
+            self.cache.flush()
+
+        if self._stop_if_cancelled():
+            return {}
+
+        self.log("Step 3: Matching fingerprints...")
+        similar_groups = group_similar_audio(fingerprints, self.options.audio_bit_error, self.options.duration_tolerance)
+
+        total_similar = sum(len(group) - 1 for group in similar_groups)
+        self.log(f"=== SCAN COMPLETE: Found {total_similar} similar audio files in {len(similar_groups)} groups ===")
+        groups = {f"audio_{number}": group for number, group in enumerate(similar_groups, start=1)}
+        for key, files in groups.items():
+            self.on_group(key, files)
+        return groups
+
+    def scan_truncated(self, folder_path: Path) -> Dict[str, List[Path]]:
+        """Return {"truncated:N": [complete file, truncated copies...]} for files that are a prefix of a larger one.
+
+        Files are indexed by the hash of their first 64 KB, so only files
+        sharing a head are compared. Head groups of more than 16 files (same
+        encoder header, camera or padding) are split further by the 4 KB
+        blocks at 64 KB, 68 KB, 76 KB, 92 KB...: a prefix of a file has
+        the same blocks as far as it reaches, so a file is only paired with
+        larger files that match all of its blocks, and with at most 32 of
+        them. Each candidate is then read to its end against the larger file.
+        A copy is grouped with the largest file it is a prefix of. Files
+        under 64 KB are not checked.
+        """
+        self.log("=== STARTING TRUNCATED FILE SCAN ===")
+
+        self.log("Step 1: Collecting files...")
+        size_groups = self._collect_files_by_size(folder_path, max(self.options.min_size_kb * 1024, QUICK_HASH_BYTES))
+        paths = [file_path for files in size_groups.values() for file_path in files]
+        self.log(f"Found {len(paths)} files")
+
+        self.log("Step 2: Indexing head blocks...")
+        heads = defaultdict(list)
+        results = self._hash_files(paths, self._calculate_quick_hash, self.options.hash_algorithm,
+                                   self.options.quick_hash_workers)
+        for processed, (file_path, quick_hash, error) in enumerate(results, start=1):
+            if error is not None:
+                self.log(f"Error quick hashing '{file_path}': {error}")
+            elif quick_hash:
+                heads[quick_hash].append(file_path)
+
+            if processed % 50 == 0:  # Update progress every 50 files
+                self.progress(f"Head hash: {processed}/{len(paths)}")
+
+        if self.cache is not None:
+            self.cache.flush()
+
+        if self._stop_if_cancelled():
+            return {}
+
+        # Only heads shared by files of different sizes can hold a truncated copy
+        buckets = [files for files in heads.values() if len({self._size(x) for x in files}) > 1]
+        large = [file_path for files in buckets if len(files) > TRUNCATED_INDEX_BUCKET for file_path in files]
+        blocks = {}
+        if large:
+            self.log(f"Sampling blocks of {len(large)} files in large head groups...")
+            results = self._hash_files(large, self._calculate_prefix_blocks, self.options.hash_algorithm,
+                                       self.options.quick_hash_workers)
+            for processed, (file_path, sampled, error) in enumerate(results, start=1):
+                if error is not None:
+                    self.log(f"Error sampling '{file_path}': {error}")
+                else:
+                    blocks[file_path] = sampled
+                if processed % 50 == 0:  # Update progress every 50 files
+                    self.progress(f"Block samples: {processed}/{len(large)}")
+
+            if self._stop_if_cancelled():
+                return {}
+
+        # Every file with larger files whose sampled blocks start with its own, largest first
+        jobs = []
+        capped = 0
+        for files in buckets:
+            if len(files) > TRUNCATED_INDEX_BUCKET:
+                files = [file_path for file_path in files if file_path in blocks]
+            files.sort(key=lambda x: (-self._size(x), str(x)))
+            by_prefix = defaultdict(list)  # block sequence prefix -> files, largest first
+            for file_path in files:
+                sampled = blocks.get(file_path, ())
+                for length in range(len(sampled) + 1):
+                    by_prefix[sampled[:length]].append(file_path)
+
+            for file_path in files:
+                size = self._size(file_path)
+                larger = []
+                for other in by_prefix[blocks.get(file_path, ())]:
+                    if self._size(other) <= size:
+                        break
+                    if len(larger) == TRUNCATED_MAX_CANDIDATES:
+                        capped += 1
+                        break
+                    larger.append(other)
+                if larger:
+                    jobs.append((file_path, larger))
+        if capped:
+            self.log(f"{capped} files match more than {TRUNCATED_MAX_CANDIDATES} larger files; "
+                     f"only the {TRUNCATED_MAX_CANDIDATES} largest were compared with each")
+        self.log(f"Step 3: Verifying {len(jobs)} possible truncated files...")
+
+        complete = defaultdict(list)
+        results = self._hash_files(jobs, lambda job, algorithm: self._find_prefix_of(*job), None,
+                                   self.options.full_hash_workers, path_of=lambda job: job[0])
+        for processed, ((file_path, _), longer, error) in enumerate(results, start=1):
+            if error is not None:
+                self.log(f"Error comparing '{file_path}': {error}")
+            elif longer is not None:
+                complete[longer].append(file_path)
+            self.progress(f"Prefix check: {processed}/{len(jobs)}")
+
+        if self._stop_if_cancelled():
+            return {}
+
+        total_truncated = sum(len(files) for files in complete.values())
+        self.log(f"=== SCAN COMPLETE: Found {total_truncated} truncated files in {len(complete)} groups ===")
+        groups = {f"truncated:{number}": [longer] + sorted(files, key=lambda x: str(x))
+                  for number, (longer, files) in enumerate(sorted(complete.items(), key=lambda x: str(x[0])), start=1)}
+        for key, files in groups.items():
+            self.on_group(key, files)
+        return groups
+
+    def estimate(self, folder_path: Path, seconds: float = 30.0, confidence: float = 0.95,
+                 on_estimate: Optional[Callable[[SpaceEstimate], None]] = None) -> Optional[SpaceEstimate]:
+        """Project the space a full scan would reclaim from quick hashes of a random sample of size groups.
+
+        Size groups are drawn with replacement, with probability proportional
+        to the bytes they could reclaim, so heavy groups are measured first
+        (PpsSample). Every file of a drawn group is quick hashed, which gives
+        the exact share of its candidate bytes duplicated at the quick tier
+        (same size and first 64 KB); the mean share over all draws times the
+        total candidate bytes is unbiased. The interval narrows with every
+        draw, until ``seconds`` run out or every group is hashed and the
+        figure is exact. A group still hashing when time runs out is left
+        out. ``on_estimate`` receives refined estimates about once a second.
+        Quick hashes go to the cache, so a later scan reuses them.
+        """
+        self.log("=== ESTIMATING RECLAIMABLE SPACE ===")
+        started = time.monotonic()
+        rng = random.Random()
+        z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+
+        self.log("Step 1: Collecting files...")
+        size_groups = self._collect_files_by_size(folder_path, self.options.min_size_kb * 1024)
+        groups = [(size, files) for size, files in size_groups.items() if size > 0 and len(files) > 1]
+        candidate_bytes = sum(size * (len(files) - 1) for size, files in groups)
+        self.log(f"{len(groups)} size groups could reclaim up to {format_file_size(candidate_bytes)}")
+
+        self.log(f"Step 2: Quick hashing sampled size groups for up to {seconds:g} seconds...")
+        pps = PpsSample([size * (len(files) - 1) for size, files in groups])
+        result = None
+        last_update = 0.0
+
+        def out_of_time():
+            # At least one group is hashed, so there is always an estimate to report
+            return self._cancel.is_set() or (pps.draws and time.monotonic() - started >= seconds)
+
+        while groups and len(pps.measured) < len(groups) and not out_of_time():
+            for index in pps.draw(rng, ESTIMATE_DRAW_BATCH):
+                if index not in pps.measured:
+                    if out_of_time():
+                        break
+                    size, files = groups[index]
+                    hashes = []
+                    for _, quick_hash, error in self._hash_files(files, self._calculate_quick_hash,
+                                                                 self.options.hash_algorithm,
+                                                                 self.options.quick_hash_workers):
+                        if out_of_time():
+                            break
+                        if error is None and quick_hash:
+                            hashes.append(quick_hash)
+                    else:
+                        if not self._cancel.is_set():  # _hash_files stops early when cancelled
+                            pps.measure(index, size * (len(hashes) - len(set(hashes))))
+                    if index not in pps.measured:
+                        break  # A partly hashed group would understate its share, so it is left out
+                pps.add(index)
+
+            reclaimable, low, high = pps.estimate(z)
+            result = SpaceEstimate(
+                reclaimable_bytes=round(reclaimable), low=round(low), high=round(high),
+                groups_sampled=len(pps.measured), groups_total=len(groups),
+                candidate_bytes=candidate_bytes, seconds=time.monotonic() - started)
+
+            if time.monotonic() - last_update >= ESTIMATE_UPDATE_SECONDS or result.exact:
+                last_update = time.monotonic()
+                self.progress(f"Estimate: {format_file_size(result.reclaimable_bytes)} "
+                              f"({format_file_size(result.low)} - {format_file_size(result.high)}), "
+                              f"{result.groups_sampled}/{result.groups_total} size groups")
+                if on_estimate is not None:
+                    on_estimate(result)
+
+        if self.cache is not None:
+            self.cache.flush()
+
+        if result is None:
+            if not self._cancel.is_set():
+                self.log("=== ESTIMATE COMPLETE: no files share a size, nothing to reclaim ===")
+                result = SpaceEstimate(0, 0, 0, 0, 0, 0, time.monotonic() - started)
+            return result
+        if result.exact:
+            self.log(f"=== ESTIMATE COMPLETE: {format_file_size(result.reclaimable_bytes)} reclaimable "
+                     f"(every size group hashed, quick tier) ===")
+        else:
+            self.log(f"=== ESTIMATE COMPLETE: about {format_file_size(result.reclaimable_bytes)} reclaimable, "
+                     f"{confidence:.0%} interval {format_file_size(result.low)} - {format_file_size(result.high)}, "
+                     f"from {result.groups_sampled} of {result.groups_total} size groups ===")
+        return result
+
+    def _calculate_prefix_blocks(self, file_path, algorithm):
+        """Hashes of the 4KB blocks after the head, at doubling gaps, that lie wholly inside the file"""
+        size = self._size(file_path)
+        hashes = []
+        with open(file_path, 'rb') as f:
+            gap = TRUNCATED_BLOCK_BYTES
+            offset = QUICK_HASH_BYTES
+            while offset + TRUNCATED_BLOCK_BYTES <= size:
+                f.seek(offset)
+                hashes.append(hashlib.new(algorithm, f.read(TRUNCATED_BLOCK_BYTES)).hexdigest())
+                offset += gap
+                gap *= 2
+        return tuple(hashes)
+
+    def _find_prefix_of(self, file_path, larger):
+        """Return the first of ``larger`` whose start matches all of ``file_path`` byte for byte, or None"""
+        length = self._size(file_path)
+        block_size = default_block_size(self.file_stat(file_path).st_dev)
+        # Downloads usually stop mid-block, so the last block rules out most non-matches in one read
+        tail = max(0, length - QUICK_HASH_BYTES)
+        with open(file_path, 'rb') as short:
+            short.seek(tail)
+            last_block = short.read()
+            for longer in larger:
+                with open(longer, 'rb') as f:
+                    f.seek(tail)
+                    if f.read(len(last_block)) != last_block:
+                        continue
+                    short.seek(0)
+                    f.seek(0)
+                    while True:
+                        if self._cancel.is_set():
+                            raise InterruptedError(f"comparison of '{file_path}' cancelled")
+                        chunk = short.read(block_size)
+                        if not chunk:
+                            return longer
+                        if f.read(len(chunk)) != chunk:
+                            break
+        return None
+
+    def _calculate_audio_fingerprint(self, file_path, kind):
+        """Return {'duration', 'bits'} for an audio file, or None if it cannot be decoded.
+
+        Raises when ffmpeg/ffprobe are missing or time out, so those runs are not cached.
+        """
+        st = self._stats.get(file_path)
+        duration = probe_duration(file_path, self.cache, st)
+        if duration <= 0:
+            return None
+
+        def compute():
+            cmd = [
+                get_ffmpeg_path(),
+                '-v', 'quiet',
+                '-ss', str(audio_excerpt_offset(duration)),
+                '-t', str(AUDIO_EXCERPT_SECONDS),
+                '-i', str(file_path),
+                '-vn',
+                '-ac', '1',
+                '-ar', str(AUDIO_SAMPLE_RATE),
+                '-f', 's16le',
+                '-'
+            ]
+
+            result = subprocess.run(cmd, capture_output=True, timeout=60)
+            if result.returncode != 0:
+                return None
+            bits = audio_fingerprint(result.stdout)
+            return {'duration': duration, 'bits': bits} if bits else None
+
+        return _cached(self.cache, file_path, kind, compute, st)
+
+    def _calculate_video_fingerprint(self, file_path, kind):
+        """Return {'duration', 'frames'} for a video, or None if it cannot be decoded.
+
+        Raises when ffmpeg/ffprobe are missing or time out, so those runs are not cached.
+        """
+        st = self._stats.get(file_path)
+        duration = probe_duration(file_path, self.cache, st)
+        if duration <= 0:
+            return None
+
+        def compute():
+            frames = []
+            count = self.options.video_frame_count
+            for index in range(count):
+                # Spread frames over the length, skipping the very start and end (intros, fades)
+                pixels = self._extract_gray_frame(file_path, duration * (index + 1) / (count + 1))
+                if pixels is None:
+                    return None
+                frames.append(dhash_from_pixels(pixels))
+            return {'duration': duration, 'frames': frames}
+
+        return _cached(self.cache, file_path, kind, compute, st)
+
+    def _extract_gray_frame(self, video_path, seconds):
+        """Decode the keyframe nearest ``seconds`` as a tiny grayscale grid for dHash, or None"""
+        cmd = [
+            get_ffmpeg_path(),
+            '-v', 'quiet',
+            '-ss', f"{seconds:.3f}",  # Seeking before -i jumps straight to the nearest keyframe
+            '-i', str(video_path),
+            '-frames:v', '1',
+            '-vf', f"scale={HASH_SIZE + 1}:{HASH_SIZE},format=gray",
+            '-f', 'rawvideo',
+            '-'
+        ]
+
+        result = subprocess.run(cmd, capture_output=True, timeout=60)
+        if result.returncode != 0 or len(result.stdout) < (HASH_SIZE + 1) * HASH_SIZE:
+            return None
+        return result.stdout[:(HASH_SIZE + 1) * HASH_SIZE]
+
+    def _calculate_image_hash(self, file_path, algorithm):
+        """Calculate the perceptual hash of an image, or None if Pillow cannot decode it"""
+        def compute():
+            try:
+                return dhash(file_path)
+            except Exception:
+                return None
+
+        return _cached(self.cache, file_path, algorithm, compute, self._stats.get(file_path))
+
+    def _walk_files(self, folder_path, incomplete=None):
+        """Yield (path, stat) for every file to scan, never entering excluded folders.
+
+        Pruning happens during the walk, so snapshot trees and the move
+        action's Duplicates folder are not even listed. Symlinked folders are
+        not followed. ``incomplete``, if given, is a set that receives every
+        folder holding something that was skipped or could not be read.
+        """
+        def skip(folder):
+            if incomplete is not None:
+                incomplete.add(folder)
+
+        patterns = [pattern.strip() for pattern in self.options.exclude_patterns if pattern.strip()]
+        pruned = 0
+
+        def excluded(name, relative):
+            return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative, pattern) for pattern in patterns)
+
+        stack = [(folder_path, "")]
+        while stack:
+            current, relative_dir = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as e:
+                self.log(f"Error scanning folder '{current}': {e}")
+                skip(current)
+                continue
+
+            subfolders = []
+            for entry in entries:
+                relative = f"{relative_dir}{entry.name}"
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self.options.include_subfolders:
+                            skip(current)
+                            continue
+                        if (entry.name.casefold() in DUPLICATE_EXCLUDED_DIRS
+                                or (not relative_dir and entry.name == DUPLICATES_FOLDER_NAME)
+                                or excluded(entry.name, relative)):
+                            pruned += 1
+                            skip(current)
+                            continue
+                        subfolders.append((Path(entry.path), relative + "/"))
+                    elif entry.is_file() and not excluded(entry.name, relative):
+                        # scandir leaves st_ino/st_dev empty on Windows; hardlink and cache keys need them
+                        st = entry.stat() if os.name != 'nt' else os.stat(entry.path)
+                        yield Path(entry.path), st
+                    else:
+                        skip(current)  # Excluded file, symlinked folder or special file
+                except OSError as e:
+                    self.log(f"Error accessing file '{entry.path}': {e}")
+                    skip(current)
+            # Reversed so folders are walked in name order
+            stack.extend(reversed(subfolders))
+
+        if pruned:
+            self.log(f"Skipped {pruned} excluded folders")
+
+    def _collect_files_by_size(self, folder_path, min_size_bytes):
+        """Collect all files and group them by size"""
+        size_groups = defaultdict(list)
+        inode_paths: Dict[tuple, List[Path]] = {}  # (st_dev, st_ino) -> paths, for multiply linked files
+        self.hardlink_groups = []
+        self._locality.clear()
+        self._payload.clear()
+
+        try:
+            for file_path, st in self._walk_files(folder_path):
+                if self._cancel.is_set():
+                    break
+                try:
+                    file_size = st.st_size
+
+                    # Skip files smaller than minimum
+                    if file_size < min_size_bytes:
+                        continue
+
+                    # Filter by file type if needed
+                    if not (self.options.scan_all_files or self.options.folder_mode):
+                        if file_path.suffix.lower() not in DUPLICATE_MEDIA_EXTENSIONS:
+                            continue
+
+                    # Further links to an inode already seen share its data; keep one path to hash
+                    if st.st_nlink > 1 and st.st_ino:
+                        linked = inode_paths.setdefault((st.st_dev, st.st_ino), [])
+                        linked.append(file_path)
+                        if len(linked) > 1:
+                            continue
+
+                    size_groups[file_size].append(file_path)
+                    self._stats[file_path] = st
+
+                except Exception as e:
+                    self.log(f"Error accessing file '{file_path}': {e}")
+                    continue
+
+            self.log(f"Collected {sum(len(files) for files in size_groups.values())} files")
+
+            self.hardlink_groups = [paths for paths in inode_paths.values() if len(paths) > 1]
+            if self.hardlink_groups:
+                linked_count = sum(len(paths) - 1 for paths in self.hardlink_groups)
+                self.log(f"Skipped {linked_count} hardlinks to {len(self.hardlink_groups)} files already collected "
+                         f"(same data, removing them frees no space)")
+
+        except Exception as e:
+            self.log(f"Error collecting files: {e}")
+
+        return size_groups
+
+    def _quick_hash_check(self, size_groups):
+        """Perform quick hash check on first few KB of files"""
+        quick_hash_groups = defaultdict(list)
+        hash_algorithm = self.options.hash_algorithm
+
+        try:
+            total_files = sum(len(files) for files in size_groups.values())
+            processed = 0
+
+            jobs = [(size, file_path) for size, files in size_groups.items() for file_path in files]
+            hashes = self._hash_files(jobs, lambda job, algorithm: self._calculate_quick_hash(job[1], algorithm),
+                                      hash_algorithm, self.options.quick_hash_workers, path_of=lambda job: job[1])
+
+            for (size, file_path), quick_hash, error in hashes:
+                if error is not None:
+                    self.log(f"Error quick hashing '{file_path}': {error}")
+                    continue
+
+                if quick_hash:
+                    # Use size + quick_hash as key for better grouping
+                    key = f"{size}_{quick_hash}"
+                    quick_hash_groups[key].append(file_path)
+
+                processed += 1
+                if processed % 50 == 0:  # Update progress every 50 files
+                    self.progress(f"Quick hash: {processed}/{total_files}")
+
+            # Filter out groups with only one file
+            quick_hash_groups = {key: files for key, files in quick_hash_groups.items() if len(files) > 1}
+            self.log(f"Quick hash found {len(quick_hash_groups)} potential duplicate groups")
+
+        except Exception as e:
+            self.log(f"Error in quick hash check: {e}")
+
+        return quick_hash_groups
+
+    def _fingerprint_check(self, quick_hash_groups):
+        """Split quick hash groups by a tail hash, then by evenly spaced samples"""
+        groups = quick_hash_groups
+        try:
+            # Files no larger than the head already had every byte hashed
+            groups = self._refine_groups(groups, "Tail hash", self._calculate_tail_hash, QUICK_HASH_BYTES)
+            self.log(f"Tail hash left {len(groups)} potential duplicate groups")
+
+            if self.options.sample_count > 0:
+                # Files covered by head + tail have nothing left to sample
+                groups = self._refine_groups(groups, "Sample hash", self._calculate_sample_hash, 2 * QUICK_HASH_BYTES)
+                self.log(f"Sample hash left {len(groups)} potential duplicate groups")
+
+        except Exception as e:
+            self.log(f"Error in fingerprint check: {e}")
+
+        return groups
+
+    def _refine_groups(self, groups, stage, calculate, covered_size):
+        """Re-key each group by one more fingerprint and drop the files left on their own.
+
+        Groups of files no larger than ``covered_size`` pass through unchanged.
+        """
+        refined = defaultdict(list)
+        jobs = []
+        for key, files in groups.items():
+            if self._size(files[0]) <= covered_size:
+                refined[key] = files
+            else:
+                jobs.extend((key, file_path) for file_path in files)
+
+        hashes = self._hash_files(jobs, lambda job, algorithm: calculate(job[1], algorithm), self.options.hash_algorithm,
+                                  self.options.quick_hash_workers, path_of=lambda job: job[1])
+
+        processed = 0
+        for (key, file_path), fingerprint, error in hashes:
+            if error is not None:
+                self.log(f"Error in {stage.lower()} of '{file_path}': {error}")
+                continue
+
+            if fingerprint:
+                refined[f"{key}_{fingerprint}"].append(file_path)
+
+            processed += 1
+            if processed % 50 == 0:  # Update progress every 50 files
+                self.progress(f"{stage}: {processed}/{len(jobs)}")
+
+        return {key: files for key, files in refined.items() if len(files) > 1}
+
+    def _full_hash_check(self, quick_hash_groups):
+        """Perform full hash check for final confirmation, reporting each group as soon as it is confirmed"""
+        duplicate_groups = defaultdict(list)
+        hash_algorithm = self.options.hash_algorithm
+
+        try:
+            total_files = sum(len(files) for files in quick_hash_groups.values())
+            processed = 0
+
+            # Cheapest candidate groups first, so results appear early in long scans (SSDs keep this order)
+            ordered = sorted(quick_hash_groups.values(), key=lambda files: self._size(files[0]) * len(files))
+
+            # One job per small group (compared in lockstep) or per file of a larger group (hashed)
+            jobs = []
+            remaining = {}  # group index -> files still to hash
+            for index, files in enumerate(ordered):
+                if self._use_lockstep(files):
+                    jobs.append((index, files, None))
+                else:
+                    jobs.extend((index, None, file_path) for file_path in files)
+                    remaining[index] = len(files)
+
+            def run_job(job, algorithm):
+                _, group, file_path = job
+                if group is not None:
+                    return self._compare_in_lockstep(group, algorithm)
+                return self._calculate_full_hash(file_path, algorithm)
+
+            hashed = defaultdict(lambda: defaultdict(list))  # group index -> full hash -> files
+            results = self._hash_files(jobs, run_job, hash_algorithm, self.options.full_hash_workers,
+                                       path_of=lambda job: job[2] or job[1][0])
+
+            for (index, group, file_path), result, error in results:
+                if group is not None:
+                    # Small groups are read in lockstep and split at the first differing chunk
+                    if error is not None:
+                        self.log(f"Error comparing '{group[0].name}' candidates: {error}")
+                    else:
+                        self._confirm_groups(duplicate_groups, result)
+
+                    processed += len(group)
+                    self.progress(f"Full hash: {processed}/{total_files}")
+                    continue
+
+                if error is not None:
+                    self.log(f"Error full hashing '{file_path}': {error}")
+                else:
+                    if result:
+                        hashed[index][result].append(file_path)
+                    processed += 1
+                    if processed % 20 == 0:  # Update progress every 20 files
+                        self.progress(f"Full hash: {processed}/{total_files}")
+
+                remaining[index] -= 1
+                if remaining[index] == 0:
+                    # Every file of this candidate group is hashed; its duplicate groups are final
+                    self._confirm_groups(duplicate_groups, hashed.pop(index, {}).items())
+
+        except Exception as e:
+            self.log(f"Error in full hash check: {e}")
+
+        return dict(duplicate_groups)
+
+    def _stream_batches(self, groups):
+        """Yield the candidate groups in batches, cheapest first, each batch twice the size of the last.
+
+        Early batches finish within seconds; later ones are large enough for
+        spinning disks to read in on-disk order, which _hash_files applies
+        within each batch only.
+        """
+        batch, batch_bytes, batch_files = {}, 0, 0
+        limit_bytes, limit_files = STREAM_BATCH_BYTES, STREAM_BATCH_FILES
+        for key, files in sorted(groups.items(), key=lambda item: self._size(item[1][0]) * len(item[1])):
+            batch[key] = files
+            batch_bytes += self._size(files[0]) * len(files)
+            batch_files += len(files)
+            if batch_bytes >= limit_bytes or batch_files >= limit_files:
+                yield batch
+                batch, batch_bytes, batch_files = {}, 0, 0
+                limit_bytes, limit_files = limit_bytes * 2, limit_files * 2
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _merge_groups(duplicate_groups, groups):
+        """Add confirmed groups to ``duplicate_groups``; equal full hashes from separate candidates are joined"""
+        for key, files in groups.items():
+            duplicate_groups[key].extend(files)
+
+    def _confirm_groups(self, duplicate_groups, matches):
+        """Record (full_hash, files) pairs with two or more files and pass each to on_group"""
+        for full_hash, files in matches:
+            if len(files) > 1:
+                duplicate_groups[full_hash].extend(files)
+                self.on_group(full_hash, files)
+
+    def _use_lockstep(self, files):
+        """Whether a candidate group should be compared in lockstep rather than hashed"""
+        if len(files) > self.options.lockstep_max_group:
+            return False
+        if self.cache is None:
+            return True
+        # Hashes already in the cache are cheaper than reading the files again
+        algorithm = self.options.hash_algorithm
+        return any(self.cache.get(self._stats[file_path], self._kind("full", algorithm, file_path)) is None
+                   for file_path in files)
+
+    def _compare_in_lockstep(self, files, algorithm):
+        """Read a candidate group chunk by chunk, splitting it as soon as contents differ.
+
+        Returns [(full_hash, files)] for every set of two or more byte-identical
+        files. Matching files share one hasher, so the hash of a confirmed set
+        is computed in the same pass and stored in the cache like a full hash.
+        """
+        handles = {}
+        try:
+            for file_path in files:
+                try:
+                    handles[file_path] = open_payload(file_path, self._payload.get(file_path))
+                except OSError as e:
+                    self.log(f"Error full hashing '{file_path}': {e}")
+
+            matches = []
+            # Each entry is a set of files identical so far and the hash of that shared prefix
+            pending = [(list(handles), hashlib.new(algorithm))]
+            while pending:
+                if self._cancel.is_set():
+                    return []  # Nothing is confirmed until every byte was compared
+                group, hasher = pending.pop()
+                chunks = defaultdict(list)
+                for file_path in group:
+                    try:
+                        chunks[handles[file_path].read(65536)].append(file_path)  # 64KB chunks
+                    except OSError as e:
+                        self.log(f"Error full hashing '{file_path}': {e}")
+
+                for chunk, same in chunks.items():
+                    if len(same) < 2:
+                        continue  # Differs from every other candidate
+                    branch = hasher.copy() if len(chunks) > 1 else hasher
+                    if not chunk:
+                        full_hash = branch.hexdigest()
+                        matches.append((full_hash, same))
+                        if self.cache is not None:
+                            for file_path in same:
+                                self.cache.put(self._stats[file_path], self._kind("full", algorithm, file_path),
+                                               full_hash)
+                        continue
+                    branch.update(chunk)
+                    pending.append((same, branch))
+            return matches
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    def _hash_files(self, items, calculate, algorithm, workers, path_of=None):
+        """Yield (item, result, error) of ``calculate`` for each path (or job) as it completes.
+
+        Items are split into one queue per device; ``path_of`` maps a job to
+        the path it reads. Spinning disks work through their queue in on-disk
+        order with ``hdd_workers`` threads, so the heads sweep instead of
+        seeking between files; other devices keep the caller's order and get
+        ``workers`` threads. All queues run at once, so a scan spanning several
+        disks keeps every one of them busy. hashlib releases the GIL while
+        hashing large buffers, which lets the reads overlap.
+        """
+        path_of = path_of or (lambda item: item)
+
+        def hash_one(item):
+            try:
+                return item, calculate(item, algorithm), None
+            except Exception as e:
+                return item, None, e
+
+        queues = defaultdict(list)  # st_dev -> items
+        for item in items:
+            st = self._stats.get(path_of(item))
+            queues[st.st_dev if st is not None else None].append(item)
+
+        plans = []  # (items in read order, threads)
+        for device, device_items in queues.items():
+            if device is not None and is_rotational(device):
+                device_items.sort(key=lambda item: self._locality_key(path_of(item)))
+                plans.append((device_items, max(1, min(workers, self.options.hdd_workers))))
+            else:
+                plans.append((device_items, max(1, workers)))
+
+        last_flush = time.monotonic()
+
+        def flush_periodically():
+            nonlocal last_flush
+            if self.cache is not None and time.monotonic() - last_flush >= CHECKPOINT_SECONDS:
+                self.cache.flush()
+                last_flush = time.monotonic()
+
+        total = sum(len(device_items) for device_items, _ in plans)
+        if workers <= 1 or total < 2:
+            for device_items, _ in plans:
+                for item in device_items:
+                    if self._cancel.is_set():
+                        return
+                    yield hash_one(item)
+                    flush_periodically()
+            return
+
+        thread_count = sum(threads for _, threads in plans)
+        # Bounded, so threads wait for the caller instead of buffering results for millions of files
+        results = queue.Queue(maxsize=thread_count * 4)
+        stop = threading.Event()
+        done = object()
+
+        def drain(iterator, lock):
+            while not stop.is_set() and not self._cancel.is_set():
+                with lock:
+                    item = next(iterator, done)
+                if item is done:
+                    return
+                outcome = hash_one(item)
+                while not stop.is_set():
+                    try:
+                        results.put(outcome, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+
+        threads = []
+        for device_items, count in plans:
+            iterator, lock = iter(device_items), threading.Lock()
+            for _ in range(count):
+                thread = threading.Thread(target=drain, args=(iterator, lock), name="hash", daemon=True)
+                thread.start()
+                threads.append(thread)
+        try:
+            for _ in range(total):
+                while True:
+                    if self._cancel.is_set():
+                        return  # Threads stop taking files; results still queued are dropped
+                    try:
+                        outcome = results.get(timeout=0.5)
+                        break
+                    except queue.Empty:
+                        continue
+                yield outcome
+                flush_periodically()
+        except KeyboardInterrupt:
+            self.cancel()  # Also interrupts the files being hashed, so the threads exit promptly
+            raise
+        finally:
+            # Also reached when the caller stops early; let the threads finish their current file
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _locality_key(self, file_path):
+        """Sort key putting files in on-disk order: first extent offset, else inode number"""
+        key = self._locality.get(file_path)
+        if key is None:
+            st = self._stats.get(file_path)
+            ino = st.st_ino if st is not None else 0
+            offset = physical_offset(file_path)
+            key = (0, offset, ino) if offset is not None else (1, ino, 0)
+            self._locality[file_path] = key
+        return key
+
+    def _size(self, file_path):
+        """Bytes that are hashed: the payload length in content-only mode, else the file size"""
+        ranges = self._payload.get(file_path)
+        if ranges:
+            return sum(length for _, length in ranges)
+        return self._stats[file_path].st_size
+
+    def _kind(self, stage, algorithm, file_path):
+        """Cache kind of a hash; payload hashes are kept apart from whole-file hashes"""
+        if file_path in self._payload:
+            return f"payload-{stage}:{algorithm}"
+        return f"{stage}:{algorithm}"
+
+    def _group_by_payload(self, size_groups):
+        """Re-key JPEG, MP4/MOV and MP3 files by payload length; other files keep their file size"""
+        self._locate_payloads([file_path for files in size_groups.values() for file_path in files])
+        regrouped = defaultdict(list)
+        for size, files in size_groups.items():
+            for file_path in files:
+                if file_path in self._payload:
+                    regrouped[f"payload{self._size(file_path)}"].append(file_path)
+                else:
+                    regrouped[size].append(file_path)
+        return regrouped
+
+    def _locate_payloads(self, paths):
+        """Parse the container headers of supported media files and record their payload ranges"""
+        paths = [file_path for file_path in paths if file_path.suffix.lower() in PAYLOAD_EXTENSIONS]
+        results = self._hash_files(paths, self._calculate_payload_ranges, "payload",
+                                   self.options.quick_hash_workers)
+        for processed, (file_path, ranges, error) in enumerate(results, start=1):
+            if error is not None:
+                self.log(f"Error reading container of '{file_path}': {error}")
+            elif ranges:
+                self._payload[file_path] = ranges
+
+            if processed % 50 == 0:  # Update progress every 50 files
+                self.progress(f"Payload: {processed}/{len(paths)}")
+
+    def _calculate_payload_ranges(self, file_path, kind):
+        """Payload ranges of a media file, [] if its headers do not parse"""
+        st = self._stats.get(file_path)
+        return _cached(self.cache, file_path, "payload_ranges",
+                       lambda: payload_ranges(file_path, st.st_size if st else None) or [], st)
+
+    def _calculate_quick_hash(self, file_path, algorithm):
+        """Calculate hash of first 64KB of file"""
+        return _cached(self.cache, file_path, self._kind("quick", algorithm, file_path),
+                       lambda: self._read_quick_hash(file_path, algorithm), self._stats.get(file_path))
+
+    def _calculate_full_hash(self, file_path, algorithm):
+        """Calculate hash of entire file"""
+        return _cached(self.cache, file_path, self._kind("full", algorithm, file_path),
+                       lambda: self._read_full_hash(file_path, algorithm), self._stats.get(file_path))
+
+    def _calculate_tail_hash(self, file_path, algorithm):
+        """Calculate hash of last 64KB of file"""
+        return _cached(self.cache, file_path, self._kind("tail", algorithm, file_path),
+                       lambda: self._read_ranges_hash(file_path, algorithm, [-QUICK_HASH_BYTES]),
+                       self._stats.get(file_path))
+
+    def _calculate_sample_hash(self, file_path, algorithm):
+        """Calculate hash of evenly spaced samples between the head and the tail"""
+        count = self.options.sample_count
+        size = self._size(file_path)
+        # Spread the samples over the bytes the head and tail hashes did not cover
+        span = size - 2 * QUICK_HASH_BYTES - SAMPLE_HASH_BYTES
+        offsets = [QUICK_HASH_BYTES + max(span, 0) * i // max(count - 1, 1) for i in range(count)]
+        return _cached(self.cache, file_path, self._kind(f"samples{count}", algorithm, file_path),
+                       lambda: self._read_ranges_hash(file_path, algorithm, offsets, SAMPLE_HASH_BYTES),
+                       self._stats.get(file_path))
+
+    def _read_quick_hash(self, file_path, algorithm):
+        """Hash the first 64KB of a file, or None if it cannot be read"""
+        return self._read_ranges_hash(file_path, algorithm, [0])
+
+    def _read_ranges_hash(self, file_path, algorithm, offsets, length=QUICK_HASH_BYTES):
+        """Hash ``length`` bytes at each offset (negative counts from the end), or None on error"""
+        try:
+            hasher = hashlib.new(algorithm)
+            with open_payload(file_path, self._payload.get(file_path)) as f:
+                for offset in offsets:
+                    f.seek(offset, os.SEEK_END if offset < 0 else os.SEEK_SET)
+                    hasher.update(f.read(length))
+            return hasher.hexdigest()
+        except Exception:
+            return None
+
+    def _read_full_hash(self, file_path, algorithm):
+        """Hash the entire file, or None if it cannot be read"""
+        try:
+            block_size = self.options.block_size_kb * 1024
+            if block_size <= 0:
+                block_size = default_block_size((self._stats.get(file_path) or os.stat(file_path)).st_dev)
+            ranges = self._payload.get(file_path)
+            if ranges:
+                return hash_payload(file_path, ranges, algorithm, block_size, self._cancel)
+            return hash_file(file_path, algorithm, self.options.read_strategy, block_size, self._cancel)
+        except Exception:
+            return None
+
+    def apply_actions(self, duplicate_groups: List[List[Path]], action: str, base_folder: Path):
+        """Delete, move or link every file but the first of each group; returns the paths handled.
+
+        ``action`` is "delete", "move", "hardlink" or "reflink"; the link actions
+        swap each duplicate for a link to the group's first file. Duplicate
+        folders from folder mode are deleted or moved whole.
+        """
+        self.log(f"=== APPLYING {action.upper()} ACTION ===")
+
+        if action == "move":
+            # Create duplicates folder
+            duplicates_folder = base_folder / DUPLICATES_FOLDER_NAME
+            duplicates_folder.mkdir(exist_ok=True)
+            self.log(f"Created duplicates folder: {duplicates_folder}")
+
+        handled = []
+        total_files = sum(len(group) - 1 for group in duplicate_groups)  # -1 for original
+
+        for group in duplicate_groups:
+            # Skip first file (original), process the rest as duplicates
+            for duplicate_file in group[1:]:
+                try:
+                    if duplicate_file.is_dir():
+                        if not self._remove_folder(group[0], duplicate_file, action,
+                                                   duplicates_folder if action == "move" else None):
+                            continue
+                    elif action == "delete":
+                        duplicate_file.unlink()
+                        self.log(f"Deleted: {duplicate_file.name}")
+                    elif action == "move":
+                        dest_path = duplicates_folder / duplicate_file.name
+                        # Handle name conflicts
+                        if dest_path.exists():
+                            dest_path = _unique_sibling(duplicates_folder, duplicate_file.stem, duplicate_file.suffix)
+
+                        duplicate_file.rename(dest_path)
+                        self.log(f"Moved: {duplicate_file.name} → Duplicates/{dest_path.name}")
+                    elif action in ("hardlink", "reflink"):
+                        if not self._replace_with_link(group[0], duplicate_file, action):
+                            continue
+
+                    handled.append(duplicate_file)
+                    self.progress(f"{action.title()}: {len(handled)}/{total_files}")
+
+                except Exception as e:
+                    self.log(f"Error processing '{duplicate_file}': {e}")
+
+        self.log(f"=== {action.upper()} COMPLETE: {len(handled)} files processed ===")
+        return handled
+
+
+def default_checkpoint_path():
+    """Return the duplicate scan state file next to the metadata cache"""
+    return Path.home() / '.bulk_media_organizer' / 'duplicate_scan_checkpoint.json'
+
+
+class ScanCheckpoint:
+    """JSON state file that lets an interrupted DuplicateFinder.scan resume after its last finished step.
+
+    It holds the candidate groups left after each step or batch and the
+    duplicate groups confirmed so far, with the stat key of every file, so
+    files changed since are dropped on resume. Completed
+    hashes are kept by the MetadataCache, which is flushed with every save.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else default_checkpoint_path()
+
+    @staticmethod
+    def scan_id(folder_path: Path, options: DuplicateOptions) -> dict:
+        """Identify a scan by its folder and the options that decide its groups"""
+        return {'folder': str(Path(folder_path).resolve()), 'scan_all_files': options.scan_all_files,
+                'include_subfolders': options.include_subfolders, 'min_size_kb': options.min_size_kb,
+                'hash_algorithm': options.hash_algorithm, 'sample_count': options.sample_count,
+                'content_only': options.content_only, 'tier': options.tier,
+                'exclude_patterns': list(options.exclude_patterns), 'folder_mode': options.folder_mode}
+
+    def load(self, scan_id: dict) -> Optional[dict]:
+        """Return the saved state ({'stage', 'groups', 'confirmed', 'hardlinks'}) of this scan, or None"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        return state if state.get('scan') == scan_id else None
+
+    def save(self, scan_id: dict, stage: str, groups: Dict[str, List[Path]], stats, hardlink_groups,
+             confirmed: Optional[Dict[str, List[Path]]] = None):
+        """Replace the state file atomically; ``stats`` maps each path to its stat result.
+
+        ``confirmed`` holds the duplicate groups already found, which a
+        resumed scan reports without hashing them again.
+        """
+        def entries(saved_groups):
+            return {key: [[str(file_path), stats[file_path].st_dev, stats[file_path].st_ino,
+                           stats[file_path].st_size, stats[file_path].st_mtime_ns] for file_path in files]
+                    for key, files in saved_groups.items()}
+
+        state = {
+            'scan': scan_id,
+            'stage': stage,
+            'saved_at': int(time.time()),
+            'groups': entries(groups),
+            'confirmed': entries(confirmed or {}),
+            'hardlinks': [[str(file_path) for file_path in paths] for paths in hardlink_groups],
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class DuplicateRecord(NamedTuple):
+    """One file of a duplicate group in DuplicateResults"""
+    group_id: int
+    path: Path
+    size: int
+    dev: int
+    ino: int
+    key: str  # full hash, or the similar-mode label of the group
+    links: int = 1  # hardlinks to the file; removing one of several frees nothing
+
+
+def hardlink_count(st: os.stat_result) -> int:
+    """Names sharing a regular file's data; 1 for folders, whose link count means something else"""
+    return st.st_nlink if S_ISREG(st.st_mode) else 1
+
+
+def order_group(files: List[Path], stat=None, keep_first=False) -> List[Tuple[Path, os.stat_result]]:
+    """Return (path, stat result) for the files of a group that still exist, the one to keep first.
+
+    Files are sorted by path. With ``keep_first`` the first file stays the
+    original (library checks, subset folders, truncated copies); otherwise
+    the file with the most hardlinks leads. The scan hashes one name per
+    inode, so removing a multiply linked file would leave its data behind
+    under its other names.
+    """
+    stat = stat or (lambda file_path: file_path.stat())
+    entries = []
+    for file_path in files:
+        try:
+            entries.append((file_path, stat(file_path)))
+        except OSError:
+            continue  # Gone since it was hashed
+
+    head = entries[:1] if keep_first and entries and entries[0][0] == files[0] else []
+    rest = entries[len(head):]
+    if keep_first:
+        rest.sort(key=lambda entry: str(entry[0]))
+    else:
+        rest.sort(key=lambda entry: (-hardlink_count(entry[1]), str(entry[0])))
+    return head + rest
+
+
+class DuplicateResults:
+    """In-memory duplicate groups, addressed by group ID instead of display strings.
+
+    The first record of each group is the one kept by apply actions. Groups
+    can be added from a scanning thread while another thread reads finished
+    ones; each group is built completely before it is published.
+    """
+
+    def __init__(self):
+        self.groups: Dict[int, List[DuplicateRecord]] = {}
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self.groups)
+
+    def add_group(self, key: str, files: List[Path], stat=None, keep_first=False) -> Optional[int]:
+        """Store a group in order_group's order and return its ID, or None if fewer than two files remain.
+
+        ``stat`` maps a path to its stat result (e.g. DuplicateFinder.file_stat).
+        With ``keep_first`` the first file stays the original (library checks).
+        """
+        group_id = self._next_id
+        self._next_id += 1
+
+        records = [DuplicateRecord(group_id, file_path, st.st_size, st.st_dev, st.st_ino, key, hardlink_count(st))
+                   for file_path, st in order_group(files, stat, keep_first)]
+        if len(records) < 2:
+            return None
+        self.groups[group_id] = records
+        return group_id
+
+    def records(self, group_id: int) -> List[DuplicateRecord]:
+        return self.groups.get(group_id, [])
+
+    def path_groups(self) -> List[List[Path]]:
+        """Return every group as a list of paths, original first, for DuplicateFinder.apply_actions"""
+        return [[record.path for record in records] for records in list(self.groups.values())]
+
+    def duplicate_count(self) -> int:
+        return sum(len(records) - 1 for records in list(self.groups.values()))
+
+    def reclaimable_bytes(self) -> int:
+        """Bytes freed by removing every duplicate (sizes of all records but the originals).
+
+        Hardlinked duplicates count nothing: their other names keep the data.
+        """
+        return sum(record.size for records in list(self.groups.values()) for record in records[1:]
+                   if record.links == 1)
+
+    def remove_paths(self, paths) -> Set[int]:
+        """Drop records for deleted or moved files; returns the IDs of the groups touched"""
+        removed = set(paths)
+        touched = set()
+        for group_id, records in list(self.groups.items()):
+            kept = [record for record in records if record.path not in removed]
+            if len(kept) != len(records):
+                touched.add(group_id)
+                self._store(group_id, kept)
+        return touched
+
+    def recheck(self, group_ids) -> Set[int]:
+        """Re-stat the files of some groups and drop those missing or replaced since the scan.
+
+        A file whose size, device and inode still match keeps its cached hash,
+        so nothing is re-read. Returns the IDs of the groups that changed.
+        """
+        changed = set()
+        for group_id in group_ids:
+            records = self.groups.get(group_id)
+            if records is None:
+                continue
+            kept = []
+            for record in records:
+                try:
+                    st = record.path.stat()
+                except OSError:
+                    continue
+                # A folder's recorded size is the total of its files, so only its identity is compared
+                size = record.size if S_ISDIR(st.st_mode) else st.st_size
+                if (size, st.st_dev, st.st_ino) == (record.size, record.dev, record.ino):
+                    kept.append(record)
+            if len(kept) != len(records):
+                changed.add(group_id)
+                self._store(group_id, kept)
+        return changed
+
+    def _store(self, group_id, records):
+        """Replace a group's records, dropping the group once it has no duplicates left"""
+        if len(records) > 1:
+            self.groups[group_id] = records
+        else:
+            self.groups.pop(group_id, None)
+
+    def clear(self):
+        self.groups.clear()
+        self._next_id = 1
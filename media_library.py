@@ -0,0 +1,184 @@
+"""Persistent size/hash index of reference libraries for the Duplicate Finder.
+
+A library root is walked and hashed once; later updates only re-hash files
+whose size, modification time or inode changed. Import folders are then
+checked against the index without reading any library file again.
+"""
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+from media_engine import DuplicateFinder, DuplicateOptions, FileInventory
+
+SCHEMA_VERSION = 1
+
+# Rows committed per transaction while indexing
+COMMIT_EVERY = 1000
+
+
+def _no_log(message):
+    pass
+
+
+def default_index_path():
+    """Return the index location: $MEDIA_ORGANIZER_LIBRARY or a file in the user's home"""
+    override = os.environ.get('MEDIA_ORGANIZER_LIBRARY')
+    if override:
+        return Path(override)
+    return Path.home() / '.bulk_media_organizer' / 'library_index.sqlite'
+
+
+class LibraryIndex:
+    """SQLite index of (size, full hash) for every file under registered library roots"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else default_index_path()
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS files")
+            self._conn.execute("DROP TABLE IF EXISTS roots")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS roots (
+                root TEXT PRIMARY KEY,
+                algorithm TEXT NOT NULL,
+                indexed_at INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                root TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                algorithm TEXT NOT NULL,
+                hash TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_lookup ON files (size, algorithm, hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_root ON files (root)")
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._conn.commit()
+
+    # ------------------------- Roots -------------------------
+    def roots(self):
+        """Return [{'root', 'algorithm', 'indexed_at', 'files', 'bytes'}] for every registered library"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT r.root, r.algorithm, r.indexed_at, COUNT(f.path), COALESCE(SUM(f.size), 0)
+                FROM roots r LEFT JOIN files f ON f.root = r.root
+                GROUP BY r.root ORDER BY r.root
+            """).fetchall()
+        return [{'root': root, 'algorithm': algorithm, 'indexed_at': indexed_at, 'files': files, 'bytes': size}
+                for root, algorithm, indexed_at, files, size in rows]
+
+    def remove_root(self, root):
+        """Forget a library root and its files; returns True if it was registered"""
+        root = str(Path(root).resolve())
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE root=?", (root,))
+            return self._conn.execute("DELETE FROM roots WHERE root=?", (root,)).rowcount > 0
+
+    def update(self, root, algorithm="sha256", workers=2, log=_no_log, progress=_no_log, finder=None):
+        """Register or refresh a library root, hashing only new and changed files.
+
+        Files are hashed by ``finder`` (a DuplicateFinder, created if not
+        given) with bounded per-device queues; its cancel() stops the update,
+        keeping every file hashed so far. Returns (hashed, removed, unchanged)
+        file counts.
+        """
+        root_path = Path(root).resolve()
+        root = str(root_path)
+        log(f"=== INDEXING LIBRARY: {root} ===")
+
+        inventory = FileInventory.scan(root_path, log)
+        with self._lock:
+            known = {path: (size, mtime_ns, ino, file_algorithm) for path, size, mtime_ns, ino, file_algorithm in
+                     self._conn.execute("SELECT path, size, mtime_ns, ino, algorithm FROM files WHERE root=?", (root,))}
+
+        to_hash = []
+        for path, entry in inventory.files.items():
+            st = entry.stat
+            if known.pop(str(path), None) != (st.st_size, st.st_mtime_ns, st.st_ino, algorithm):
+                to_hash.append(entry)
+        unchanged = len(inventory.files) - len(to_hash)
+        log(f"{len(inventory.files)} files: {unchanged} unchanged, {len(to_hash)} to hash, {len(known)} removed")
+
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM files WHERE path=?", [(path,) for path in known])
+            self._conn.execute("INSERT OR REPLACE INTO roots (root, algorithm, indexed_at) VALUES (?, ?, ?)",
+                               (root, algorithm, int(time.time())))
+
+        if finder is None:
+            finder = DuplicateFinder(DuplicateOptions(hash_algorithm=algorithm, full_hash_workers=workers), log, progress)
+        stats = {entry.path: entry.stat for entry in to_hash}
+        rows = []
+        hashed = 0
+        try:
+            for file_path, full_hash, error in finder.hash_paths(stats, algorithm, workers):
+                if error is not None or not full_hash:
+                    if not finder.cancelled:
+                        log(f"Error hashing '{file_path}': {error or 'unreadable'}")
+                    continue
+                st = stats[file_path]
+                rows.append((str(file_path), root, st.st_size, st.st_mtime_ns, st.st_ino, algorithm, full_hash))
+                hashed += 1
+                if len(rows) >= COMMIT_EVERY:
+                    self._insert(rows)
+                    progress(f"Indexing: {hashed}/{len(to_hash)}")
+        finally:
+            # Also reached on KeyboardInterrupt; every file hashed so far is kept
+            self._insert(rows)
+
+        if finder.cancelled:
+            log(f"=== LIBRARY INDEXING CANCELLED: {hashed} of {len(to_hash)} hashed; update again to finish ===")
+        else:
+            log(f"=== LIBRARY INDEXED: {hashed} hashed, {len(known)} removed, {unchanged} unchanged ===")
+        return hashed, len(known), unchanged
+
+    def _insert(self, rows):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, root, size, mtime_ns, ino, algorithm, hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        rows.clear()
+
+    # ------------------------- Queries -------------------------
+    def sizes(self, algorithm):
+        """Return the set of file sizes indexed with ``algorithm``"""
+        with self._lock:
+            return {size for (size,) in self._conn.execute(
+                "SELECT DISTINCT size FROM files WHERE algorithm=?", (algorithm,))}
+
+    def find(self, size, algorithm, full_hash):
+        """Return [(path, size, mtime_ns, ino)] of the library files indexed with this size and hash.
+
+        The stat fields are as indexed; callers re-stat to tell whether a file changed since.
+        """
+        with self._lock:
+            return [(Path(path), file_size, mtime_ns, ino) for path, file_size, mtime_ns, ino in self._conn.execute(
+                "SELECT path, size, mtime_ns, ino FROM files WHERE size=? AND algorithm=? AND hash=? ORDER BY path",
+                (size, algorithm, full_hash))]
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,202 @@
+"""Locate the media payload of JPEG, MP4/MOV and MP3 files for content-only hashing.
+
+Copies of a photo, clip or song often differ only in their metadata: EXIF and
+other APPn segments, MP4 ``udta``/``moov`` tags, ID3 tags. Only the container
+headers are parsed to find the bytes that hold the picture or the audio and
+video samples, so hashing them costs about the same I/O as hashing the file.
+
+Payloads are described as a list of ``(offset, length)`` ranges. Files that
+are not one of these formats, or whose headers do not parse, have no payload
+ranges and are hashed whole.
+"""
+import os
+import hashlib
+
+JPEG_EXTENSIONS = {'.jpg', '.jpeg'}
+MP4_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.m4a', '.3gp'}
+MP3_EXTENSIONS = {'.mp3'}
+PAYLOAD_EXTENSIONS = JPEG_EXTENSIONS | MP4_EXTENSIONS | MP3_EXTENSIONS
+
+
+def _merge(ranges):
+    """Join ranges that touch, so reads cross segment boundaries in one call"""
+    merged = []
+    for offset, length in ranges:
+        if merged and merged[-1][0] + merged[-1][1] == offset:
+            merged[-1][1] += length
+        elif length > 0:
+            merged.append([offset, length])
+    return merged
+
+
+def _jpeg_ranges(f, size):
+    """Every segment except APPn (EXIF, XMP, ICC, thumbnails) and comments, then the scan data"""
+    if f.read(2) != b'\xff\xd8':
+        return None
+    ranges = [(0, 2)]
+    offset = 2
+    while offset + 4 <= size:
+        f.seek(offset)
+        header = f.read(4)
+        if header[0] != 0xFF:
+            return None
+        marker = header[1]
+        if marker == 0xFF:
+            offset += 1  # Fill byte before a marker
+            continue
+        if marker == 0xD9 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            ranges.append((offset, 2))  # EOI, RSTn and TEM have no length field
+            if marker == 0xD9:
+                return ranges
+            offset += 2
+            continue
+        length = int.from_bytes(header[2:4], 'big')
+        if length < 2:
+            return None
+        if marker == 0xDA:
+            # Start of scan: the entropy-coded image data runs to the end of the file
+            ranges.append((offset, size - offset))
+            return ranges
+        if not (0xE0 <= marker <= 0xEF or marker == 0xFE):
+            ranges.append((offset, 2 + length))
+        offset += 2 + length
+    return None
+
+
+def _mp4_ranges(f, size):
+    """The contents of every top-level ``mdat`` box"""
+    ranges = []
+    offset = 0
+    while offset + 8 <= size:
+        f.seek(offset)
+        header = f.read(16)
+        box_size = int.from_bytes(header[:4], 'big')
+        box_type = header[4:8]
+        header_size = 8
+        if box_size == 1:
+            box_size = int.from_bytes(header[8:16], 'big')
+            header_size = 16
+        elif box_size == 0:
+            box_size = size - offset  # Last box, runs to the end
+        # Box types are four printable characters; anything else is not an ISO media file
+        if not all(32 <= c < 127 for c in box_type) or box_size < header_size or offset + box_size > size:
+            return None
+        if box_type == b'mdat':
+            ranges.append((offset + header_size, box_size - header_size))
+        offset += box_size
+    return ranges or None
+
+
+def _mp3_ranges(f, size):
+    """The audio frames between any leading ID3v2 tags and a trailing ID3v1 (and extended TAG+) tag"""
+    start = 0
+    while True:
+        f.seek(start)
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'ID3':
+            break
+        # Tag size is a 28-bit "syncsafe" integer; a footer adds another 10 bytes
+        tag_size = (header[6] & 0x7F) << 21 | (header[7] & 0x7F) << 14 | (header[8] & 0x7F) << 7 | (header[9] & 0x7F)
+        start += 10 + tag_size + (10 if header[5] & 0x10 else 0)
+
+    end = size
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+            if end - start >= 227:
+                f.seek(end - 227)
+                if f.read(4) == b'TAG+':
+                    end -= 227
+    if end <= start:
+        return None
+    return [(start, end - start)]
+
+
+def payload_ranges(file_path, size=None):
+    """Return the payload of a JPEG, MP4/MOV or MP3 as [[offset, length], ...], or None to hash the whole file"""
+    suffix = os.path.splitext(str(file_path))[1].lower()
+    if suffix in JPEG_EXTENSIONS:
+        parse = _jpeg_ranges
+    elif suffix in MP4_EXTENSIONS:
+        parse = _mp4_ranges
+    elif suffix in MP3_EXTENSIONS:
+        parse = _mp3_ranges
+    else:
+        return None
+
+    with open(file_path, 'rb') as f:
+        if size is None:
+            size = os.fstat(f.fileno()).st_size
+        ranges = parse(f, size)
+    return _merge(ranges) if ranges else None
+
+
+class PayloadReader:
+    """Read-only file object over the concatenated payload ranges of an open binary file"""
+
+    def __init__(self, f, ranges):
+        self._f = f
+        self._ranges = ranges
+        self.size = sum(length for _, length in ranges)
+        self._position = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            offset += self.size
+        elif whence == os.SEEK_CUR:
+            offset += self._position
+        self._position = max(0, offset)
+        return self._position
+
+    def read(self, count=-1):
+        if count < 0:
+            count = self.size
+        chunks = []
+        start = 0  # Payload position where the current range begins
+        for offset, length in self._ranges:
+            if count <= 0:
+                break
+            if self._position < start + length:
+                take = min(count, start + length - self._position)
+                self._f.seek(offset + self._position - start)
+                data = self._f.read(take)
+                chunks.append(data)
+                self._position += len(data)
+                count -= len(data)
+                if len(data) < take:
+                    break  # File shrank since it was parsed
+            start += length
+        return b''.join(chunks)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_payload(file_path, ranges):
+    """Open a file for reading, as a PayloadReader when it has payload ranges"""
+    f = open(file_path, 'rb')
+    return PayloadReader(f, ranges) if ranges else f
+
+
+def hash_payload(file_path, ranges, algorithm, block_size, stop=None):
+    """Return the hex digest of a file's payload ranges; raises InterruptedError once ``stop`` is set"""
+    hasher = hashlib.new(algorithm)
+    with open(file_path, 'rb') as f:
+        for offset, length in ranges:
+            f.seek(offset)
+            while length > 0:
+                if stop is not None and stop.is_set():
+                    raise InterruptedError(f"hashing of '{file_path}' cancelled")
+                chunk = f.read(min(block_size, length))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                length -= len(chunk)
+    return hasher.hexdigest()
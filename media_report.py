@@ -0,0 +1,107 @@
+"""Streaming CSV/JSONL reports of duplicate groups.
+
+Each group is written and flushed as soon as it is confirmed, so a report
+covering millions of files holds no more than one group in memory and a
+crash keeps every group found so far. CSV has one row per file; JSONL has
+one object per group.
+"""
+import csv
+import json
+from datetime import datetime
+from pathlib import Path
+
+from media_engine import hardlink_count, order_group
+
+REPORT_FORMATS = ("csv", "jsonl")
+CSV_FIELDS = ["group", "hash", "size", "role", "path", "device", "inode", "mtime"]
+
+
+def report_format_for(path):
+    """Pick the report format from a file name: .jsonl/.ndjson/.json write JSONL, anything else CSV"""
+    return "jsonl" if Path(path).suffix.lower() in ('.jsonl', '.ndjson', '.json') else "csv"
+
+
+def read_report(path):
+    """Return the path groups of a CSV or JSONL report written by DuplicateReportWriter, original first"""
+    path = Path(path)
+    groups = {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if report_format_for(path) == "jsonl":
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    groups[record['group']] = [Path(entry['path']) for entry in record['files']]
+        else:
+            for row in csv.DictReader(f):
+                groups.setdefault(row['group'], []).append(Path(row['path']))
+    return list(groups.values())
+
+
+class DuplicateReportWriter:
+    """Append duplicate groups to a CSV or JSONL file; usable directly as DuplicateFinder's on_group"""
+
+    def __init__(self, path, report_format=None):
+        self.path = Path(path)
+        self.format = report_format or report_format_for(self.path)
+        if self.format not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format '{self.format}', expected one of {', '.join(REPORT_FORMATS)}")
+
+        self.groups = 0
+        self.duplicates = 0
+        self.reclaimable_bytes = 0
+
+        self._file = open(self.path, 'w', encoding='utf-8', newline='')
+        self._csv = None
+        if self.format == "csv":
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(CSV_FIELDS)
+            self._file.flush()
+
+    def write_group(self, key, files, stat=None, keep_first=False):
+        """Write one group in the order DuplicateResults uses; returns False if fewer than two files remain.
+
+        ``stat`` maps a path to its stat result (e.g. DuplicateFinder.file_stat).
+        With ``keep_first`` the first file stays the original (library checks).
+        """
+        ordered = order_group(files, stat, keep_first)
+        entries = [(str(file_path), st.st_size, st.st_dev, st.st_ino,
+                    datetime.fromtimestamp(st.st_mtime).isoformat(timespec='seconds'))
+                   for file_path, st in ordered]
+        if len(entries) < 2:
+            return False
+
+        self.groups += 1
+        self.duplicates += len(entries) - 1
+        # Hardlinked duplicates free nothing: their other names keep the data
+        self.reclaimable_bytes += sum(st.st_size for _, st in ordered[1:] if hardlink_count(st) == 1)
+
+        if self._csv is not None:
+            for index, (path, size, dev, ino, mtime) in enumerate(entries):
+                role = "original" if index == 0 else "duplicate"
+                self._csv.writerow([self.groups, key, size, role, path, dev, ino, mtime])
+        else:
+            record = {
+                'group': self.groups,
+                'hash': key,
+                'size': entries[0][1],
+                'files': [{'path': path, 'size': size, 'device': dev, 'inode': ino, 'mtime': mtime}
+                          for path, size, dev, ino, mtime in entries],
+            }
+            self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        return True
+
+    def write_results(self, results):
+        """Write every group of a DuplicateResults model, in its order"""
+        for records in list(results.groups.values()):
+            self.write_group(records[0].key, [record.path for record in records], keep_first=True)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
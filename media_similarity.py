@@ -0,0 +1,365 @@
+"""Perceptual hashing for the Duplicate Finder's similar image, video and audio modes.
+
+Images (and sampled video frames) are reduced to a 64-bit difference hash
+(dHash), so re-encodes and resizes of the same picture end up a few bits
+apart. Image hashes are split into bands and indexed by exact band values
+(multi-index hashing), which answers "everything within N bits" queries by
+comparing each hash with a handful of candidates instead of every other
+image; videos are only compared with others of about the same duration.
+
+Audio gets a spectral fingerprint: one 16-bit word per 64 ms of a short
+excerpt, each bit the sign of an energy change between neighbouring bands
+and frames. Words survive re-encoding mostly intact, so an inverted index of
+exact runs of consecutive words finds candidate tracks before any
+fingerprints are compared.
+"""
+from itertools import combinations
+from math import comb
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# dHash grid: HASH_SIZE x HASH_SIZE brightness comparisons -> 64-bit hash
+HASH_SIZE = 8
+
+# Hashes whose candidate pairs the NumPy index expands at once
+HASH_INDEX_CHUNK = 1 << 16
+
+# Formats Pillow can decode for perceptual hashing
+PERCEPTUAL_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
+
+# Audio excerpt decoded for fingerprinting: mono 8 kHz, starting AUDIO_OFFSET seconds in
+# for tracks long enough to skip intros and leading silence
+AUDIO_SAMPLE_RATE = 8000
+AUDIO_EXCERPT_SECONDS = 12
+AUDIO_OFFSET_SECONDS = 10
+# 256 ms analysis frames every 64 ms, 17 log-spaced bands between 300 Hz and 2 kHz -> 16-bit words
+AUDIO_FRAME = 2048
+AUDIO_HOP = 512
+AUDIO_BANDS = 17
+# Consecutive words packed into one index key. A 12 s excerpt has ~180 words, so 300k tracks put
+# ~800 tracks on every 16-bit word; 32-bit keys leave nearly every bucket with at most one track
+AUDIO_INDEX_WORDS = 2
+# Keys shared by more tracks than this (silence, tones) are too common to be useful
+AUDIO_INDEX_BUCKET_LIMIT = 50
+
+
+def dhash(image_path, hash_size=HASH_SIZE):
+    """Return the difference hash of an image as an int; raises if Pillow cannot read it"""
+    with Image.open(image_path) as img:
+        # JPEGs decode straight to a reduced size, which is most of the speedup on large photos
+        img.draft('L', (hash_size * 8, hash_size * 8))
+        small = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        pixels = list(small.getdata())
+    return dhash_from_pixels(pixels, hash_size)
+
+
+def dhash_from_pixels(pixels, hash_size=HASH_SIZE):
+    """Return the difference hash of a row-major (hash_size + 1) x hash_size grayscale grid"""
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+try:
+    _popcount = int.bit_count  # Python 3.10+
+except AttributeError:
+    def _popcount(value):
+        return bin(value).count('1')
+
+
+def hamming_distance(a, b):
+    return _popcount(a ^ b)
+
+
+def _popcount_array(values):
+    """Set bits of every element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):  # NumPy 2.0+
+        return np.bitwise_count(values)
+    byte_counts = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+    return byte_counts[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class MultiIndexHash:
+    """Exact Hamming range search over integer hashes by multi-index hashing.
+
+    Hashes are cut into bands, each indexed in a dict of exact band values.
+    Two hashes within ``max_distance`` bits differ in at most
+    max_distance // bands bits of one band (pigeonhole), so a query looks up
+    its bands flipped in up to that many bits and only compares the hashes
+    found there. The band count is picked for ``expected_count`` hashes so
+    that lookups plus candidates per query are fewest: narrow bands mean
+    crowded buckets, wide ones many flipped lookups. With NumPy, pairs()
+    runs the same lookups for all hashes at once as sorted-array joins.
+    """
+
+    def __init__(self, max_distance, expected_count, bits=HASH_SIZE * HASH_SIZE):
+        self.max_distance = max_distance
+
+        def cost(band_count):
+            width = bits // band_count
+            lookups = band_count * sum(comb(width, flipped) for flipped in range(max_distance // band_count + 1))
+            return lookups + expected_count * lookups / 2 ** width
+
+        band_count = min(range(1, min(max_distance + 1, bits) + 1), key=cost)
+        # (shift, mask) per band; the first bits % band_count bands get one bit more
+        self._bands = []
+        shift = 0
+        for band in range(band_count):
+            width = bits // band_count + (band < bits % band_count)
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        radius = max_distance // band_count
+        # XOR masks of every way to flip up to ``radius`` bits of a band, per band width
+        self._flips = {}
+        for _, mask in self._bands:
+            width = mask.bit_length()
+            if width not in self._flips:
+                self._flips[width] = [sum(1 << bit for bit in flipped)
+                                      for count in range(radius + 1) for flipped in combinations(range(width), count)]
+        self._index = [{} for _ in self._bands]
+
+    def add(self, value):
+        for (shift, mask), index in zip(self._bands, self._index):
+            index.setdefault((value >> shift) & mask, []).append(value)
+
+    def search(self, value):
+        """Return the set of stored hashes within ``max_distance`` bits of ``value``"""
+        candidates = set()
+        for (shift, mask), index in zip(self._bands, self._index):
+            key = (value >> shift) & mask
+            for flip in self._flips[mask.bit_length()]:
+                bucket = index.get(key ^ flip)
+                if bucket:
+                    candidates.update(bucket)
+        max_distance = self.max_distance
+        return {other for other in candidates if _popcount(value ^ other) <= max_distance}
+
+    def pairs(self, values):
+        """Yield (a, b) for every pair of distinct ``values`` within ``max_distance`` bits; indexes them too"""
+        values = list(values)
+        if np is None:
+            for value in values:
+                self.add(value)
+            for value in values:
+                for other in self.search(value):
+                    if value < other:
+                        yield value, other
+            return
+
+        array = np.fromiter(values, dtype=np.uint64, count=len(values))
+        for shift, mask in self._bands:
+            keys = (array >> np.uint64(shift)) & np.uint64(mask)
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            for flip in self._flips[mask.bit_length()]:
+                wanted = keys ^ np.uint64(flip)
+                starts = np.searchsorted(sorted_keys, wanted, 'left')
+                counts = np.searchsorted(sorted_keys, wanted, 'right') - starts
+                for first in range(0, len(array), HASH_INDEX_CHUNK):
+                    chunk_counts = counts[first:first + HASH_INDEX_CHUNK]
+                    total = int(chunk_counts.sum())
+                    if not total:
+                        continue
+                    # One row per (hash, bucket entry) candidate pair
+                    rows = np.repeat(np.arange(first, first + len(chunk_counts)), chunk_counts)
+                    offsets = np.arange(total) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+                    cols = order[np.repeat(starts[first:first + HASH_INDEX_CHUNK], chunk_counts) + offsets]
+                    # Flips are symmetric, so each pair is found from both ends; keep one
+                    keep = rows < cols
+                    rows, cols = rows[keep], cols[keep]
+                    close = _popcount_array(array[rows] ^ array[cols]) <= self.max_distance
+                    yield from zip(array[rows[close]].tolist(), array[cols[close]].tolist())
+
+
+def _union_find():
+    """Return (find, union) over hashable keys"""
+    parent = {}
+
+    def find(key):
+        root = key
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while key != root:
+            parent[key], key = root, parent.get(key, key)
+        return root
+
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[b] = a
+
+    return find, union
+
+
+def group_similar(hashes, max_distance):
+    """Group items whose hashes are within ``max_distance`` bits, transitively.
+
+    ``hashes`` maps item -> hash. Returns lists of two or more items, in the
+    order their first item appears in ``hashes``.
+    """
+    # Union-find over distinct hash values; items with identical hashes group through their value
+    values = set(hashes.values())
+    find, union = _union_find()
+    for value, other in MultiIndexHash(max_distance, len(values)).pairs(values):
+        union(value, other)
+
+    groups = {}
+    for item, value in hashes.items():
+        groups.setdefault(find(value), []).append(item)
+    return [items for items in groups.values() if len(items) > 1]
+
+
+def group_similar_videos(fingerprints, max_distance, duration_tolerance):
+    """Group videos whose sampled frames differ by at most ``max_distance`` bits on average.
+
+    ``fingerprints`` maps item -> (duration, [frame hashes]). Only videos whose
+    durations are within ``duration_tolerance`` seconds (or that percentage of
+    the length, if larger) are compared, using a sweep over the sorted durations.
+    """
+    ordered = sorted(fingerprints.items(), key=lambda entry: entry[1][0])
+    find, union = _union_find()
+
+    for i, (item, (duration, frames)) in enumerate(ordered):
+        window = max(duration_tolerance, duration * duration_tolerance / 100)
+        for other, (other_duration, other_frames) in ordered[i + 1:]:
+            if other_duration - duration > window:
+                break  # Everything after this is longer still
+            if len(frames) != len(other_frames) or not frames:
+                continue
+            distance = sum(hamming_distance(a, b) for a, b in zip(frames, other_frames)) / len(frames)
+            if distance <= max_distance:
+                union(item, other)
+
+    groups = {}
+    for item in fingerprints:
+        groups.setdefault(find(item), []).append(item)
+    return [items for items in groups.values() if len(items) > 1]
+
+
+def audio_excerpt_offset(duration):
+    """Seconds into a track where its fingerprint excerpt starts"""
+    return AUDIO_OFFSET_SECONDS if duration >= AUDIO_OFFSET_SECONDS + 2 * AUDIO_EXCERPT_SECONDS else 0
+
+
+def audio_fingerprint(pcm):
+    """Return the spectral fingerprint of signed 16-bit mono PCM as a hex string, or None if too short.
+
+    Needs NumPy; every frame is transformed in one vectorized FFT.
+    """
+    samples = np.frombuffer(pcm, dtype='<i2').astype(np.float32)
+    if len(samples) < AUDIO_FRAME + 2 * AUDIO_HOP:
+        return None
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, AUDIO_FRAME)[::AUDIO_HOP]
+    power = np.abs(np.fft.rfft(frames * np.hanning(AUDIO_FRAME), axis=1)) ** 2
+
+    # Sum FFT bins into bands; reduceat needs one extra start index for the upper edge
+    freqs = np.fft.rfftfreq(AUDIO_FRAME, 1 / AUDIO_SAMPLE_RATE)
+    starts = np.searchsorted(freqs, np.geomspace(300, 2000, AUDIO_BANDS + 1))
+    energy = np.add.reduceat(power, starts, axis=1)[:, :AUDIO_BANDS]
+
+    band_delta = energy[:, :-1] - energy[:, 1:]
+    bits = (band_delta[1:] - band_delta[:-1]) > 0
+    words = bits.astype(np.uint32) @ (1 << np.arange(AUDIO_BANDS - 2, -1, -1, dtype=np.uint32))
+    return ''.join(f"{word:04x}" for word in words.tolist())
+
+
+def _audio_words(fingerprint):
+    return np.array([int(fingerprint[i:i + 4], 16) for i in range(0, len(fingerprint), 4)], dtype=np.uint16)
+
+
+def _audio_index_keys(words):
+    """Distinct keys of every AUDIO_INDEX_WORDS consecutive words, packed into one integer each"""
+    count = len(words) - AUDIO_INDEX_WORDS + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    keys = np.zeros(count, dtype=np.uint64)
+    for offset in range(AUDIO_INDEX_WORDS):
+        keys = (keys << np.uint64(16)) | words[offset:offset + count].astype(np.uint64)
+    return np.unique(keys)
+
+
+def _audio_candidate_pairs(word_arrays):
+    """Yield (i, j, shared keys) for every pair of tracks, by position, sharing an index key.
+
+    All keys are sorted in one array, so tracks sharing a key sit next to
+    each other; the pairs of every run are counted at once with NumPy.
+    """
+    keys = [_audio_index_keys(words) for words in word_arrays]
+    owners = np.concatenate([np.full(len(track_keys), position, dtype=np.int64)
+                             for position, track_keys in enumerate(keys)] or [np.zeros(0, dtype=np.int64)])
+    keys = np.concatenate(keys or [np.zeros(0, dtype=np.uint64)])
+    # Stable sort keeps the owners of each key in ascending order
+    order = np.argsort(keys, kind='stable')
+    keys, owners = keys[order], owners[order]
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    lengths = np.diff(np.r_[starts, len(keys)])
+    useful = (lengths > 1) & (lengths <= AUDIO_INDEX_BUCKET_LIMIT)
+    codes = []
+    for length in np.unique(lengths[useful]).tolist():
+        run_starts = starts[useful & (lengths == length)]
+        members = owners[run_starts[:, None] + np.arange(length)]
+        first, second = np.triu_indices(length, 1)
+        codes.append(members[:, first].ravel() * len(word_arrays) + members[:, second].ravel())
+    if not codes:
+        return
+    codes, hits = np.unique(np.concatenate(codes), return_counts=True)
+    for code, shared in zip(codes.tolist(), hits.tolist()):
+        yield code // len(word_arrays), code % len(word_arrays), shared
+
+
+def _bit_error_rate(a, b, max_shift=3):
+    """Lowest fraction of differing bits between two word arrays over small alignment shifts"""
+    best = 1.0
+    for shift in range(-max_shift, max_shift + 1):
+        x = a[max(shift, 0):]
+        y = b[max(-shift, 0):]
+        length = min(len(x), len(y))
+        if length == 0:
+            continue
+        diff = np.bitwise_xor(x[:length], y[:length])
+        errors = np.unpackbits(diff.view(np.uint8)).sum()
+        best = min(best, errors / (length * 16))
+    return best
+
+
+def group_similar_audio(fingerprints, max_bit_error, duration_tolerance):
+    """Group tracks whose fingerprints differ in at most ``max_bit_error`` of their bits.
+
+    ``fingerprints`` maps item -> (duration, hex fingerprint). Candidates come
+    from an inverted index of exact runs of AUDIO_INDEX_WORDS consecutive
+    words and must have durations within ``duration_tolerance`` seconds (or
+    that percentage of the length); only they are compared bit by bit.
+    """
+    items = list(fingerprints)
+    words = [_audio_words(fingerprints[item][1]) for item in items]
+
+    find, union = _union_find()
+    for first, second, hits in _audio_candidate_pairs(words):
+        item, other = items[first], items[second]
+        # Two exact keys in common rules out chance collisions
+        if hits < 2 or find(other) == find(item):
+            continue
+        duration = fingerprints[item][0]
+        window = max(duration_tolerance, duration * duration_tolerance / 100)
+        if abs(fingerprints[other][0] - duration) > window:
+            continue
+        if _bit_error_rate(words[first], words[second]) <= max_bit_error:
+            union(item, other)
+
+    groups = {}
+    for item in fingerprints:
+        groups.setdefault(find(item), []).append(item)
+    return [items for items in groups.values() if len(items) > 1]